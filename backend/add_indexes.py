@@ -7,7 +7,21 @@ def add_simple_indexes():
     with app.app_context():
         print("Adding database indexes (without CONCURRENTLY)...")
         
+        # Remove duplicate readings so the unique (sensor_id, timestamp) index can be built
+        try:
+            print("Removing duplicate measurements...")
+            result = db.session.execute(db.text(
+                "DELETE FROM measurements a USING measurements b "
+                "WHERE a.sensor_id = b.sensor_id AND a.timestamp = b.timestamp AND a.id > b.id;"
+            ))
+            db.session.commit()
+            print(f"✅ Removed {result.rowcount} duplicates")
+        except Exception as e:
+            print(f"❌ Error: {e}")
+            db.session.rollback()
+        
         # Simpler index creation (works on all PostgreSQL versions)
+        # On the partitioned measurements table each index cascades to every partition
         indexes = [
             "CREATE INDEX IF NOT EXISTS idx_sensors_location_id ON sensors(location_id);",
             "CREATE INDEX IF NOT EXISTS idx_sensors_parameter_id ON sensors(parameter_id);",
@@ -15,8 +29,13 @@ def add_simple_indexes():
             "CREATE INDEX IF NOT EXISTS idx_measurements_timestamp ON measurements(timestamp DESC);",
             "CREATE INDEX IF NOT EXISTS idx_locations_lat_lng ON locations(latitude, longitude);",
             "CREATE INDEX IF NOT EXISTS idx_measurements_sensor_timestamp ON measurements(sensor_id, timestamp DESC);",
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_measurements_sensor_timestamp ON measurements(sensor_id, timestamp);",
             "CREATE INDEX IF NOT EXISTS idx_sensors_location_parameter ON sensors(location_id, parameter_id);",
-            "CREATE INDEX IF NOT EXISTS idx_locations_bounds ON locations(latitude, longitude, country_code);"
+            "CREATE INDEX IF NOT EXISTS idx_locations_bounds ON locations(latitude, longitude, country_code);",
+            # Trigram indexes let the /locations/search fallback's ILIKE '%term%' skip the sequential scan
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm;",
+            "CREATE INDEX IF NOT EXISTS idx_locations_name_trgm ON locations USING gin (name gin_trgm_ops);",
+            "CREATE INDEX IF NOT EXISTS idx_locations_locality_trgm ON locations USING gin (locality gin_trgm_ops);"
         ]
         
         for index_sql in indexes:
@@ -1,20 +1,37 @@
-from flask import jsonify, request
+import bisect
+from datetime import datetime, timedelta
+from flask import current_app, jsonify, request
 from sqlalchemy import func
 from sqlalchemy.orm import joinedload, selectinload
 from app.database import db
-from app.models import Location, Sensor, Parameter, Measurement
+from app.models import Location, Sensor, Parameter
 from app.api import api_bp
-from app.api.utils import parse_bounds
+from app.api.utils import parse_bounds, encode_cursor, decode_cursor, parse_include_total
+from app.counters import read_counters
+from app.spatial import EARTH_RADIUS_KM, LocationIndex
 from app import cache
 
 @api_bp.route('/locations', methods=['GET'])
-@cache.cached(timeout=300, query_string=True)  # Cache for 5 minutes
+@cache.cached(timeout=300, query_string=True, unless=lambda: served_from_index())  # Cache for 5 minutes
 def get_locations():
-    """Get all locations with optimized queries"""
+    """Get all locations - from the in-memory grid index, or the database while it is unavailable"""
     # Parse query parameters
     bounds = parse_bounds(request)
     limit = request.args.get('limit', 1000, type=int)
     offset = request.args.get('offset', 0, type=int)
+    cursor = request.args.get('cursor')  # next_cursor of the previous page - replaces offset
+    include_total = parse_include_total(request)
+    
+    after_id = None
+    if cursor:
+        try:
+            after_id = int(decode_cursor(cursor)['id'])
+        except (ValueError, KeyError, TypeError) as e:
+            return jsonify({'error': f"Invalid cursor: {e}"}), 400
+    
+    grid = location_index.get(current_app.config)
+    if grid is not None:
+        return locations_from_index(grid, bounds, limit, offset, after_id, include_total)
     
     # Optimized query with eager loading - eliminates N+1 queries
     query = db.session.query(Location).options(
@@ -30,60 +47,160 @@ def get_locations():
             Location.longitude <= bounds['east']
         )
     
-    # Get total count for pagination
-    total = query.count()
+    # Get total count for pagination (optional - it repeats the filtered scan)
+    total = query.count() if include_total else None
     
-    # Apply pagination
-    locations = query.limit(limit).offset(offset).all()
+    # Apply pagination - a cursor seeks past the last id instead of skipping `offset` rows
+    query = query.order_by(Location.id)
+    if after_id is not None:
+        locations = query.filter(Location.id > after_id).limit(limit).all()
+    else:
+        locations = query.limit(limit).offset(offset).all()
     
     # Format response (sensors and parameters already loaded via eager loading)
-    result = []
-    for loc in locations:
-        sensor_data = []
-        
-        # Process sensors (already loaded, no additional queries)
-        for sensor in loc.sensors:
-            if sensor.parameter:  # Already loaded via joinedload
-                sensor_data.append({
-                    'id': sensor.id,
-                    'openaq_id': sensor.openaq_id,
-                    'parameter': {
-                        'id': sensor.parameter.id,
-                        'name': sensor.parameter.name,
-                        'display_name': sensor.parameter.display_name,
-                        'unit': sensor.parameter.unit
-                    },
-                    'last_value': float(sensor.last_value) if sensor.last_value else None,
-                    'last_updated': sensor.last_updated.isoformat() if sensor.last_updated else None
-                })
-        
-        # Calculate simple AQI (preserved from original)
-        pm25_sensor = next((s for s in sensor_data if s['parameter']['name'] == 'pm25'), None)
-        aqi = calculate_aqi_from_pm25(pm25_sensor['last_value']) if pm25_sensor and pm25_sensor['last_value'] else None
-        
-        result.append({
-            'id': loc.id,
-            'openaq_id': loc.openaq_id,
-            'name': loc.name,
-            'locality': loc.locality,
-            'country_code': loc.country_code,
-            'latitude': float(loc.latitude),
-            'longitude': float(loc.longitude),
-            'is_mobile': loc.is_mobile,
-            'last_updated': loc.last_updated.isoformat() if loc.last_updated else None,
-            'sensors': sensor_data,
-            'aqi': aqi
-        })
+    result = [format_location(loc) for loc in locations]
     
     return jsonify({
         'results': result,
         'meta': {
             'limit': limit,
-            'offset': offset,
-            'total': total
+            'offset': offset if after_id is None else None,
+            'total': total,
+            'next_cursor': encode_cursor({'id': locations[-1].id}) if limit and len(locations) == limit else None,
+            'source': 'database'
         }
     })
 
+def locations_from_index(grid, bounds, limit, offset, after_id, include_total):
+    """get_locations answered from the in-memory grid - same records, order and paging as the SQL path"""
+    positions = grid.query(bounds)
+    total = len(positions) if include_total else None
+    if after_id is not None:
+        start = bisect.bisect_right(positions, after_id, key=lambda position: grid.ids[position])
+        page = positions[start:start + limit]
+    else:
+        page = positions[offset:offset + limit]
+    
+    return jsonify({
+        'results': [grid.records[position] for position in page],
+        'meta': {
+            'limit': limit,
+            'offset': offset if after_id is None else None,
+            'total': total,
+            'next_cursor': encode_cursor({'id': grid.ids[page[-1]]}) if limit and len(page) == limit else None,
+            'source': 'memory'
+        }
+    })
+
+def format_location(loc):
+    """/locations record of a Location with its sensors and parameters loaded"""
+    sensor_data = []
+    
+    # Process sensors (already loaded, no additional queries)
+    for sensor in loc.sensors:
+        if sensor.parameter:  # Already loaded via joinedload
+            sensor_data.append({
+                'id': sensor.id,
+                'openaq_id': sensor.openaq_id,
+                'parameter': {
+                    'id': sensor.parameter.id,
+                    'name': sensor.parameter.name,
+                    'display_name': sensor.parameter.display_name,
+                    'unit': sensor.parameter.unit
+                },
+                'last_value': float(sensor.last_value) if sensor.last_value else None,
+                'last_updated': sensor.last_updated.isoformat() if sensor.last_updated else None
+            })
+    
+    # Calculate simple AQI (preserved from original)
+    pm25_sensor = next((s for s in sensor_data if s['parameter']['name'] == 'pm25'), None)
+    aqi = calculate_aqi_from_pm25(pm25_sensor['last_value']) if pm25_sensor and pm25_sensor['last_value'] else None
+    
+    return {
+        'id': loc.id,
+        'openaq_id': loc.openaq_id,
+        'name': loc.name,
+        'locality': loc.locality,
+        'country_code': loc.country_code,
+        'latitude': float(loc.latitude),
+        'longitude': float(loc.longitude),
+        'is_mobile': loc.is_mobile,
+        'last_updated': loc.last_updated.isoformat() if loc.last_updated else None,
+        'sensors': sensor_data,
+        'aqi': aqi
+    }
+
+def load_location_records():
+    """Every location as a /locations record - what the in-memory grid is built from"""
+    locations = db.session.query(Location).options(
+        selectinload(Location.sensors).joinedload(Sensor.parameter)
+    ).all()
+    return [format_location(loc) for loc in locations]
+
+# Built at startup (run.py) and rebuilt after ingestion bumps the index version
+location_index = LocationIndex(load_location_records)
+
+SEARCH_FIELDS = ('id', 'name', 'locality', 'country_code', 'latitude', 'longitude')
+
+def served_from_index():
+    """Responses come from the in-memory snapshot - cheaper than a cache round trip, and never stale"""
+    return current_app.config['SPATIAL_INDEX_ENABLED'] and location_index.grid is not None
+
+MAX_NEAREST = 100
+
+@api_bp.route('/locations/nearest', methods=['GET'])
+def get_nearest_locations():
+    """The k stations closest to lat/lon by great-circle distance, nearest first
+
+    parameter (name) or parameter_id keeps stations measuring it, max_age_hours
+    only those that reported it (or anything, without a parameter) that recently.
+    Answered from the in-memory KD-tree; not cached - every position differs.
+    """
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    if lat is None or lon is None or not -90 <= lat <= 90 or not -180 <= lon <= 180:
+        return jsonify({'error': 'lat (-90..90) and lon (-180..180) are required'}), 400
+    k = min(max(request.args.get('k', 10, type=int), 1), MAX_NEAREST)
+    parameter = request.args.get('parameter')  # Parameter name, e.g. pm25
+    parameter_id = request.args.get('parameter_id', type=int)
+    max_age_hours = request.args.get('max_age_hours', type=float)
+    since = datetime.utcnow() - timedelta(hours=max_age_hours) if max_age_hours else None
+    meta = {'lat': lat, 'lon': lon, 'k': k, 'parameter': parameter, 'parameter_id': parameter_id, 'max_age_hours': max_age_hours}
+    
+    grid = location_index.get(current_app.config)
+    if grid is not None:
+        if parameter and not parameter_id:
+            parameter_id = grid.parameter_ids.get(parameter, -1)  # Unknown name: nothing measures it
+        result = [
+            dict(grid.records[position], distance_km=round(distance, 3))
+            for distance, position in grid.nearest(lat, lon, k, parameter_id, since)
+        ]
+        return jsonify({'results': result, 'meta': dict(meta, source='memory')})
+    
+    # Haversine in SQL - a scan over all locations, fine for the fallback
+    distance = 2 * EARTH_RADIUS_KM * func.asin(func.least(1.0, func.sqrt(
+        func.power(func.sin(func.radians(Location.latitude - lat) / 2), 2)
+        + func.cos(func.radians(lat)) * func.cos(func.radians(Location.latitude))
+        * func.power(func.sin(func.radians(Location.longitude - lon) / 2), 2)
+    )))
+    sensor_filters = []
+    if parameter_id:
+        sensor_filters.append(Sensor.parameter_id == parameter_id)
+    elif parameter:
+        sensor_filters.append(Sensor.parameter.has(Parameter.name == parameter))
+    if since is not None:
+        sensor_filters.append(Sensor.last_updated >= since)
+    
+    query = db.session.query(Location, distance.label('distance_km')).options(
+        selectinload(Location.sensors).joinedload(Sensor.parameter)
+    ).filter(Location.latitude.is_not(None), Location.longitude.is_not(None))
+    if sensor_filters:
+        query = query.filter(Location.sensors.any(db.and_(*sensor_filters)))
+    rows = query.order_by(distance, Location.id).limit(k).all()
+    
+    result = [dict(format_location(loc), distance_km=round(float(km), 3)) for loc, km in rows]
+    return jsonify({'results': result, 'meta': dict(meta, source='database')})
+
 @api_bp.route('/locations/<int:location_id>', methods=['GET'])
 @cache.cached(timeout=600)  # Cache for 10 minutes
 def get_location(location_id):
@@ -134,21 +251,34 @@ def get_location(location_id):
     return jsonify(result)
 
 @api_bp.route('/locations/search', methods=['GET'])
-@cache.cached(timeout=600, query_string=True)  # Cache search results
+@cache.cached(timeout=600, query_string=True, unless=lambda: served_from_index())  # Cache search results
 def search_locations():
-    """Search locations by name or locality with caching"""
+    """Search locations by name or locality - ranked, typo tolerant, from the in-memory trigram index"""
     query_term = request.args.get('q', '')
     limit = request.args.get('limit', 10, type=int)
     
     if not query_term:
         return jsonify({'results': []})
     
-    # Search by name or locality (preserved original logic)
+    grid = location_index.get(current_app.config)
+    if grid is not None:
+        result = [
+            dict({key: grid.records[position][key] for key in SEARCH_FIELDS}, score=score)
+            for score, position in grid.text_index.search(query_term, limit)
+        ]
+        return jsonify({'results': result, 'meta': {'source': 'memory'}})
+    
+    # Substring match on name or locality (trigram GIN indexes from add_indexes.py),
+    # names starting with the term first - no typo tolerance on this path
     locations = Location.query.filter(
         db.or_(
             Location.name.ilike(f'%{query_term}%'),
             Location.locality.ilike(f'%{query_term}%')
         )
+    ).order_by(
+        db.case((Location.name.ilike(f'{query_term}%'), 0), else_=1),
+        func.length(Location.name),
+        Location.id
     ).limit(limit).all()
     
     result = []
@@ -162,7 +292,7 @@ def search_locations():
             'longitude': float(loc.longitude)
         })
     
-    return jsonify({'results': result})
+    return jsonify({'results': result, 'meta': {'source': 'database'}})
 
 @api_bp.route('/test', methods=['GET'])
 def test_endpoint():
@@ -177,7 +307,7 @@ def test_db():
         location_count = Location.query.count()
         sensor_count = Sensor.query.count()
         parameter_count = Parameter.query.count()
-        measurement_count = Measurement.query.count()
+        measurement_count = read_counters()['total']  # Kept by the ingestion writer, no table scan
         
         return jsonify({
             'status': 'Database connected successfully',
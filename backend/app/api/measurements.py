@@ -1,13 +1,36 @@
-from flask import jsonify, request
+import csv
+import io
+import json
+from flask import Response, current_app, jsonify, request, stream_with_context
 from datetime import datetime, timedelta
+from sqlalchemy import tuple_
 from sqlalchemy.orm import joinedload
 from app.database import db
-from app.models import Location, Sensor, Parameter, Measurement
+from app.models import Location, Sensor, Parameter, Measurement, LocationDataSummary, SensorDataSummary
+from app.rollups import ROLLUP_MODELS
+from app.retention import retention_cutoff
+from app.downsample import DOWNSAMPLE_METHODS, MAX_POINTS, pick_source, load_series, downsample
 from app.api import api_bp
+from app.api.utils import parse_bounds, parse_utc_timestamp, encode_cursor, decode_cursor, parse_include_total
 from app import cache
 
+# format=ndjson|csv streams rows from a server-side cursor instead of building one JSON list
+STREAM_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+STREAM_BATCH_ROWS = 2000  # Rows fetched from the cursor (and written to the response) at a time
+SERIES_DEFAULT_LIMIT = 200  # Readings (or buckets) per series in /measurements/series
+SERIES_MAX_LIMIT = 5000
+SERIES_MAX_PAIRS = 100
+CSV_COLUMNS = [
+    'id', 'timestamp', 'value', 'min', 'max', 'count', 'resolution',
+    'sensor_id', 'sensor_openaq_id', 'parameter_id', 'parameter', 'parameter_display_name', 'unit',
+    'location_id', 'location', 'latitude', 'longitude'
+]
+
 @api_bp.route('/measurements', methods=['GET'])
-@cache.cached(timeout=180, query_string=True)
+@cache.cached(timeout=180, query_string=True, unless=lambda: request.args.get('format') in STREAM_FORMATS)
 def get_measurements():
     """Get measurements with filtering options - NO DATE FILTERING - SHOW ALL HISTORICAL DATA"""
     sensor_id = request.args.get('sensor_id', type=int)
@@ -16,6 +39,36 @@ def get_measurements():
     days = request.args.get('days', type=int)  # Optional date filtering
     limit = request.args.get('limit', type=int)  # NO DEFAULT LIMIT
     offset = request.args.get('offset', 0, type=int)
+    resolution = request.args.get('resolution')  # hour|day = pre-aggregated rollups instead of raw rows
+    output_format = request.args.get('format', 'json')  # json | ndjson | csv (streamed, no total count)
+    cursor = request.args.get('cursor')  # next_cursor of the previous page - replaces offset
+    include_total = parse_include_total(request)
+    
+    if output_format != 'json' and output_format not in STREAM_FORMATS:
+        return jsonify({'error': f"format must be one of: json, {', '.join(STREAM_FORMATS)}"}), 400
+    if resolution and resolution not in ROLLUP_MODELS:
+        return jsonify({'error': f"resolution must be one of: {', '.join(ROLLUP_MODELS)}"}), 400
+    
+    points = request.args.get('points', type=int)  # Downsample one series to at most this many points
+    if points is not None:
+        return get_downsampled_measurements(points, resolution, sensor_id, location_id, parameter_id, days)
+    
+    if output_format in STREAM_FORMATS:
+        return stream_measurements(output_format, resolution, sensor_id, location_id, parameter_id, days, limit, offset)
+    
+    position = None
+    if cursor:
+        try:
+            position = parse_measurement_cursor(cursor)
+        except (ValueError, KeyError, TypeError) as e:
+            return jsonify({'error': f"Invalid cursor: {e}"}), 400
+        # Raw pages continue into the hourly tier, rollup pages stay in their resolution
+        if position[0] not in ((resolution,) if resolution else ('raw', 'hour')):
+            return jsonify({'error': 'Invalid cursor: it belongs to a different resolution'}), 400
+    
+    if resolution:
+        return get_rollup_measurements(resolution, sensor_id, location_id, parameter_id, days, limit, offset,
+                                       position, include_total)
     
     # Build optimized query with eager loading
     query = db.session.query(Measurement).options(
@@ -24,6 +77,7 @@ def get_measurements():
     )
     
     # Apply date filtering ONLY if explicitly requested by user
+    start_date = None
     if days:
         start_date = datetime.utcnow() - timedelta(days=days)
         query = query.filter(Measurement.timestamp >= start_date)
@@ -42,18 +96,40 @@ def get_measurements():
     elif parameter_id:
         query = query.join(Sensor).filter(Sensor.parameter_id == parameter_id)
     
-    # Order by timestamp descending
-    query = query.order_by(Measurement.timestamp.desc())
+    # Raw readings older than the retention cutoff only exist as hourly rollups -
+    # serve that range from the compacted tier after the raw rows
+    cutoff = retention_cutoff(current_app.config)
+    compacted = None
+    if cutoff and (start_date is None or start_date < cutoff):
+        query = query.filter(Measurement.timestamp >= cutoff)
+        compacted = rollup_query('hour', sensor_id, location_id, parameter_id, days).filter(
+            ROLLUP_MODELS['hour'].bucket < cutoff
+        )
     
-    # Get total count for pagination
-    total = query.count()
+    # Order by timestamp descending (id breaks ties, so the order is a stable keyset)
+    query = query.order_by(Measurement.timestamp.desc(), Measurement.id.desc())
     
-    # Apply limit ONLY if specified - NO DEFAULT LIMIT
-    if limit:
-        measurements = query.limit(limit).offset(offset).all()
-    else:
-        # Get ALL measurements if no limit specified
-        measurements = query.offset(offset).all()
+    # Get total count for pagination (optional - it repeats the filtered scan)
+    total = raw_total = query.count() if include_total else None
+    
+    # A cursor seeks to the rows after the previous page, so page N costs what page 1 does;
+    # without one, apply offset (and limit ONLY if specified - NO DEFAULT LIMIT)
+    in_compacted = position is not None and position[0] == 'hour'
+    measurements = []
+    if not in_compacted:
+        page = query
+        if position:
+            page = page.filter(
+                Measurement.timestamp <= position[1],
+                tuple_(Measurement.timestamp, Measurement.id) < (position[1], position[2])
+            )
+        elif offset:
+            page = page.offset(offset)
+        if limit:
+            page = page.limit(limit)
+        measurements = page.all()
+    last = ('raw', measurements[-1].timestamp, measurements[-1].id) if measurements else None
+    fetched = len(measurements)
     
     # Format response (relationships already loaded via eager loading)
     result = []
@@ -81,61 +157,579 @@ def get_measurements():
                 }
             })
     
+    meta = {
+        'limit': limit if limit else 'no_limit',
+        'offset': offset if position is None else None,
+        'total': total,
+        'found': len(result),
+        'note': 'All historical data available - no date filtering applied'
+    }
+    
+    if compacted is not None:
+        if include_total:
+            total += compacted.count()
+        remaining = limit - len(measurements) if limit else None
+        if remaining is None or remaining > 0:
+            if in_compacted:
+                compacted = after_rollup(compacted, ROLLUP_MODELS['hour'], position[1], position[2])
+            elif position is None and offset and not measurements:
+                compacted = compacted.offset(max(0, offset - (raw_total if raw_total is not None else query.count())))
+            if remaining:
+                compacted = compacted.limit(remaining)
+            buckets = compacted.all()
+            for b in buckets:
+                if b.sensor and b.sensor.parameter and b.sensor.location:
+                    result.append(dict(format_rollup(b), resolution='hour'))
+            if buckets:
+                last = ('hour', buckets[-1].bucket, buckets[-1].sensor_id)
+            fetched += len(buckets)
+        meta.update({
+            'total': total,
+            'found': len(result),
+            'raw_since': cutoff.isoformat(),
+            'note': f"Readings before {cutoff:%Y-%m-%d} are hourly averages (resolution: hour) - raw data was compacted"
+        })
+    
+    meta['next_cursor'] = encode_measurement_cursor(last) if limit and last and fetched == limit else None
+    
+    return jsonify({
+        'results': result,
+        'meta': meta
+    })
+
+def get_downsampled_measurements(points, resolution, sensor_id, location_id, parameter_id, days):
+    """/measurements?points=N[&start&end&method=lttb|minmax] - one series reduced to at most N points
+
+    Needs sensor_id, or location_id + parameter_id (all sensors of that pair form
+    one series). The window defaults to the last `days` days or the whole history.
+    Long windows read from the hourly/daily rollups (pick_source), so the work
+    grows with N and the window, not with the number of raw readings.
+    """
+    method = request.args.get('method', 'lttb')
+    if method not in DOWNSAMPLE_METHODS:
+        return jsonify({'error': f"method must be one of: {', '.join(DOWNSAMPLE_METHODS)}"}), 400
+    if not 2 <= points <= MAX_POINTS:
+        return jsonify({'error': f"points must be between 2 and {MAX_POINTS}"}), 400
+    try:
+        start = parse_utc_timestamp(request.args['start']) if request.args.get('start') else None
+        end = parse_utc_timestamp(request.args['end']) if request.args.get('end') else None
+    except ValueError as e:
+        return jsonify({'error': f"start/end must be ISO timestamps: {e}"}), 400
+    
+    if sensor_id:
+        sensor_ids = [sensor_id]
+    elif location_id and parameter_id:
+        sensor_ids = [sid for (sid,) in db.session.query(Sensor.id).filter_by(
+            location_id=location_id, parameter_id=parameter_id
+        ).all()]
+    else:
+        return jsonify({'error': 'points needs sensor_id, or location_id and parameter_id'}), 400
+    
+    end = end or datetime.utcnow()
+    if start is None and days:
+        start = end - timedelta(days=days)
+    if start is None and sensor_ids:
+        start = db.session.query(db.func.min(SensorDataSummary.oldest)).filter(
+            SensorDataSummary.sensor_id.in_(sensor_ids)
+        ).scalar()
+    
+    meta = {
+        'points': points,
+        'method': method,
+        'start': start.isoformat() if start else None,
+        'end': end.isoformat(),
+        'source': None,
+        'rows_read': 0,
+        'found': 0
+    }
+    if not sensor_ids or start is None or start >= end:
+        return jsonify({'results': [], 'meta': meta})
+    
+    source = resolution or pick_source(start, end, points)
+    series = load_series(sensor_ids, start, end, source, cutoff=retention_cutoff(current_app.config))
+    result = downsample(series, points, method, start, end)
+    meta.update({'source': source, 'rows_read': len(series), 'found': len(result)})
+    
+    return jsonify({'results': result, 'meta': meta})
+
+def parse_measurement_cursor(token):
+    """(tier, timestamp, key) from a /measurements cursor - key is the id, or the sensor_id of a rollup bucket"""
+    position = decode_cursor(token)
+    return position['tier'], datetime.fromisoformat(position['ts']), int(position['key'])
+
+def encode_measurement_cursor(position):
+    tier, timestamp, key = position
+    return encode_cursor({'tier': tier, 'ts': timestamp.isoformat(), 'key': key})
+
+def after_rollup(query, model, timestamp, sensor_id):
+    """Rollup buckets after (timestamp, sensor_id) in rollup_query's order"""
+    return query.filter(
+        model.bucket <= timestamp,
+        tuple_(model.bucket, model.sensor_id) < (timestamp, sensor_id)
+    )
+
+def rollup_query(resolution, sensor_id, location_id, parameter_id, days):
+    """Rollup buckets matching the /measurements filters, newest first"""
+    model = ROLLUP_MODELS[resolution]
+    query = db.session.query(model).options(
+        joinedload(model.sensor).joinedload(Sensor.parameter),
+        joinedload(model.sensor).joinedload(Sensor.location)
+    )
+    
+    if days:
+        query = query.filter(model.bucket >= datetime.utcnow() - timedelta(days=days))
+    
+    if sensor_id:
+        query = query.filter(model.sensor_id == sensor_id)
+    elif location_id or parameter_id:
+        query = query.join(Sensor, model.sensor_id == Sensor.id)
+        if location_id:
+            query = query.filter(Sensor.location_id == location_id)
+        if parameter_id:
+            query = query.filter(Sensor.parameter_id == parameter_id)
+    
+    return query.order_by(model.bucket.desc(), model.sensor_id.desc())
+
+def format_rollup(b):
+    return {
+        'value': round(float(b.sum_value) / b.count, 3),
+        'min': float(b.min_value),
+        'max': float(b.max_value),
+        'count': b.count,
+        'timestamp': b.bucket.isoformat(),
+        'sensor': {
+            'id': b.sensor.id,
+            'openaq_id': b.sensor.openaq_id
+        },
+        'parameter': {
+            'id': b.sensor.parameter.id,
+            'name': b.sensor.parameter.name,
+            'display_name': b.sensor.parameter.display_name,
+            'unit': b.sensor.parameter.unit
+        },
+        'location': {
+            'id': b.sensor.location.id,
+            'name': b.sensor.location.name,
+            'latitude': float(b.sensor.location.latitude),
+            'longitude': float(b.sensor.location.longitude)
+        }
+    }
+
+def get_rollup_measurements(resolution, sensor_id, location_id, parameter_id, days, limit, offset,
+                            position=None, include_total=True):
+    """/measurements?resolution=hour|day - one row per sensor and bucket with avg/min/max/count"""
+    query = rollup_query(resolution, sensor_id, location_id, parameter_id, days)
+    total = query.count() if include_total else None
+    if position:
+        query = after_rollup(query, ROLLUP_MODELS[resolution], position[1], position[2])
+    elif offset:
+        query = query.offset(offset)
+    if limit:
+        query = query.limit(limit)
+    buckets = query.all()
+    
+    result = [format_rollup(b) for b in buckets if b.sensor and b.sensor.parameter and b.sensor.location]
+    
     return jsonify({
         'results': result,
         'meta': {
             'limit': limit if limit else 'no_limit',
-            'offset': offset,
+            'offset': offset if position is None else None,
             'total': total,
             'found': len(result),
-            'note': 'All historical data available - no date filtering applied'
+            'next_cursor': encode_measurement_cursor(
+                (resolution, buckets[-1].bucket, buckets[-1].sensor_id)
+            ) if limit and len(buckets) == limit else None,
+            'resolution': resolution,
+            'note': f"Averages per {resolution} - value is the mean, min/max/count describe the bucket"
         }
     })
 
+def stream_measurements(output_format, resolution, sensor_id, location_id, parameter_id, days, limit, offset):
+    """/measurements?format=ndjson|csv - same rows as the JSON response, streamed with constant memory
+
+    Plain column queries (no ORM objects) read through a server-side cursor
+    STREAM_BATCH_ROWS at a time, each batch is encoded and sent before the next
+    is fetched. There is no count() pre-query, so no total either. Raw queries
+    continue into the hourly tier before the retention cutoff, like the JSON one.
+    """
+    start_date = datetime.utcnow() - timedelta(days=days) if days else None
+    cutoff = None if resolution else retention_cutoff(current_app.config)
+    
+    if resolution:
+        tiers = [(resolution, stream_query(resolution, sensor_id, location_id, parameter_id, start_date))]
+    else:
+        raw = stream_query(None, sensor_id, location_id, parameter_id, start_date)
+        tiers = [(None, raw)]
+        if cutoff and (start_date is None or start_date < cutoff):
+            tiers = [
+                (None, raw.filter(Measurement.timestamp >= cutoff)),
+                ('hour', stream_query('hour', sensor_id, location_id, parameter_id, start_date).filter(
+                    ROLLUP_MODELS['hour'].bucket < cutoff
+                ))
+            ]
+    
+    def generate():
+        if output_format == 'csv':
+            yield ','.join(CSV_COLUMNS) + '\n'
+        
+        remaining = limit
+        skip = offset
+        for tier_resolution, query in tiers:
+            if remaining is not None and remaining <= 0:
+                break
+            tier = query.offset(skip) if skip else query
+            if remaining is not None:
+                tier = tier.limit(remaining)
+            
+            emitted = 0
+            batch = []
+            for row in tier.yield_per(STREAM_BATCH_ROWS):
+                batch.append(stream_record(row, tier_resolution))
+                if len(batch) >= STREAM_BATCH_ROWS:
+                    yield encode_stream_batch(batch, output_format)
+                    emitted += len(batch)
+                    batch = []
+            if batch:
+                yield encode_stream_batch(batch, output_format)
+                emitted += len(batch)
+            
+            if remaining is not None:
+                remaining -= emitted
+            # The next tier starts after the rows this one had beyond the offset
+            skip = max(0, skip - query.count()) if skip and not emitted else 0
+    
+    headers = {}
+    if output_format == 'csv':
+        headers['Content-Disposition'] = 'attachment; filename=measurements.csv'
+    return Response(stream_with_context(generate()), mimetype=STREAM_FORMATS[output_format], headers=headers)
+
+def stream_query(resolution, sensor_id, location_id, parameter_id, start_date):
+    """Column query behind stream_measurements - raw readings, or rollup buckets for `resolution`"""
+    if resolution:
+        model = ROLLUP_MODELS[resolution]
+        columns = [
+            db.null().label('id'),
+            (model.sum_value / model.count).label('value'),
+            model.bucket.label('timestamp'),
+            model.min_value,
+            model.max_value,
+            model.count
+        ]
+        sensor_column, time_column = model.sensor_id, model.bucket
+    else:
+        columns = [Measurement.id, Measurement.value, Measurement.timestamp]
+        sensor_column, time_column = Measurement.sensor_id, Measurement.timestamp
+    
+    query = db.session.query(
+        *columns,
+        Sensor.id.label('sensor_id'),
+        Sensor.openaq_id,
+        Parameter.id.label('parameter_id'),
+        Parameter.name.label('parameter_name'),
+        Parameter.display_name,
+        Parameter.unit,
+        Location.id.label('location_id'),
+        Location.name.label('location_name'),
+        Location.latitude,
+        Location.longitude
+    ).join(Sensor, sensor_column == Sensor.id).join(
+        Parameter, Sensor.parameter_id == Parameter.id
+    ).join(Location, Sensor.location_id == Location.id)
+    
+    if start_date:
+        query = query.filter(time_column >= start_date)
+    if sensor_id:
+        query = query.filter(sensor_column == sensor_id)
+    else:
+        if location_id:
+            query = query.filter(Sensor.location_id == location_id)
+        if parameter_id:
+            query = query.filter(Sensor.parameter_id == parameter_id)
+    
+    return query.order_by(time_column.desc())
+
+def stream_record(row, resolution):
+    """One streamed row in the shape of a JSON result (rollup rows carry min/max/count/resolution)"""
+    record = {
+        'id': row.id,
+        'value': round(float(row.value), 3),
+        'timestamp': row.timestamp.isoformat(),
+        'sensor': {
+            'id': row.sensor_id,
+            'openaq_id': row.openaq_id
+        },
+        'parameter': {
+            'id': row.parameter_id,
+            'name': row.parameter_name,
+            'display_name': row.display_name,
+            'unit': row.unit
+        },
+        'location': {
+            'id': row.location_id,
+            'name': row.location_name,
+            'latitude': float(row.latitude) if row.latitude is not None else None,
+            'longitude': float(row.longitude) if row.longitude is not None else None
+        }
+    }
+    if resolution:
+        del record['id']
+        record.update({
+            'min': float(row.min_value),
+            'max': float(row.max_value),
+            'count': row.count,
+            'resolution': resolution
+        })
+    return record
+
+def encode_stream_batch(records, output_format):
+    if output_format == 'ndjson':
+        return ''.join(json.dumps(record) + '\n' for record in records)
+    
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for r in records:
+        writer.writerow([
+            r.get('id'), r['timestamp'], r['value'], r.get('min'), r.get('max'), r.get('count'), r.get('resolution'),
+            r['sensor']['id'], r['sensor']['openaq_id'],
+            r['parameter']['id'], r['parameter']['name'], r['parameter']['display_name'], r['parameter']['unit'],
+            r['location']['id'], r['location']['name'], r['location']['latitude'], r['location']['longitude']
+        ])
+    return buffer.getvalue()
+
 @api_bp.route('/measurements/latest', methods=['GET'])
-@cache.cached(timeout=300)
+@cache.cached(timeout=300, query_string=True)
 def get_latest_measurements():
-    """Get latest measurements for all sensors - NO DATE FILTERING"""
-    # Get all sensors with valid parameter_id and location_id
-    sensors = Sensor.query.options(
-        joinedload(Sensor.parameter),
-        joinedload(Sensor.location)
+    """Latest reading of every sensor, optionally only one parameter, inside bounds or fresher than max_age_hours"""
+    parameter = request.args.get('parameter')  # Parameter name, e.g. pm25
+    parameter_id = request.args.get('parameter_id', type=int)
+    max_age_hours = request.args.get('max_age_hours', type=float)
+    bounds = parse_bounds(request)
+    
+    # One query over the denormalized sensors.last_value/last_updated (kept by the ingestion writer)
+    query = db.session.query(
+        Sensor.id,
+        Sensor.openaq_id,
+        Sensor.last_value,
+        Sensor.last_updated,
+        Parameter.id.label('parameter_id'),
+        Parameter.name.label('parameter_name'),
+        Parameter.display_name,
+        Parameter.unit,
+        Location.id.label('location_id'),
+        Location.name.label('location_name'),
+        Location.latitude,
+        Location.longitude
+    ).join(Parameter, Sensor.parameter_id == Parameter.id).join(
+        Location, Sensor.location_id == Location.id
     ).filter(
-        Sensor.parameter_id.is_not(None),
-        Sensor.location_id.is_not(None)
-    ).all()
+        Sensor.last_value.is_not(None),
+        Sensor.last_updated.is_not(None)
+    )
+    
+    if parameter_id:
+        query = query.filter(Parameter.id == parameter_id)
+    elif parameter:
+        query = query.filter(Parameter.name == parameter)
+    
+    if max_age_hours:
+        query = query.filter(Sensor.last_updated >= datetime.utcnow() - timedelta(hours=max_age_hours))
+    
+    if bounds:
+        query = query.filter(
+            Location.latitude >= bounds['south'],
+            Location.latitude <= bounds['north'],
+            Location.longitude >= bounds['west'],
+            Location.longitude <= bounds['east']
+        )
     
     result = []
-    for sensor in sensors:
-        # Get latest measurement for this sensor - NO DATE FILTERING
-        measurement = Measurement.query.filter_by(
-            sensor_id=sensor.id
-        ).order_by(Measurement.timestamp.desc()).first()
-        
-        if measurement and sensor.parameter and sensor.location:
-            result.append({
-                'value': float(measurement.value),
-                'timestamp': measurement.timestamp.isoformat(),
-                'sensor': {
-                    'id': sensor.id,
-                    'openaq_id': sensor.openaq_id
-                },
-                'parameter': {
-                    'id': sensor.parameter.id,
-                    'name': sensor.parameter.name,
-                    'display_name': sensor.parameter.display_name,
-                    'unit': sensor.parameter.unit
-                },
-                'location': {
-                    'id': sensor.location.id,
-                    'name': sensor.location.name,
-                    'latitude': float(sensor.location.latitude),
-                    'longitude': float(sensor.location.longitude)
-                }
-            })
+    for row in query.all():
+        result.append({
+            'value': float(row.last_value),
+            'timestamp': row.last_updated.isoformat(),
+            'sensor': {
+                'id': row.id,
+                'openaq_id': row.openaq_id
+            },
+            'parameter': {
+                'id': row.parameter_id,
+                'name': row.parameter_name,
+                'display_name': row.display_name,
+                'unit': row.unit
+            },
+            'location': {
+                'id': row.location_id,
+                'name': row.location_name,
+                'latitude': float(row.latitude),
+                'longitude': float(row.longitude)
+            }
+        })
     
     return jsonify(result)
 
+@api_bp.route('/measurements/series', methods=['GET'])
+@cache.cached(timeout=180, query_string=True)
+def get_measurement_series():
+    """Many (location, parameter) series in one request - latest readings, rollup buckets or a has-data probe
+
+    pairs=LOC:PARAM[:LIMIT],... picks the series (LIMIT overrides `limit` for that
+    pair); probe=true with parameter_id instead answers for every location
+    measuring that parameter. All series come from one grouped query.
+    """
+    parameter_id = request.args.get('parameter_id', type=int)
+    limit = request.args.get('limit', SERIES_DEFAULT_LIMIT, type=int)
+    days = request.args.get('days', type=int)
+    resolution = request.args.get('resolution')  # hour|day buckets instead of raw readings
+    probe = request.args.get('probe', 'false').lower() in ('true', '1', 'yes')
+    
+    try:
+        pairs = parse_series_pairs(request.args.get('pairs', ''), limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if resolution and resolution not in ROLLUP_MODELS:
+        return jsonify({'error': f"resolution must be one of: {', '.join(ROLLUP_MODELS)}"}), 400
+    if not pairs and not (probe and parameter_id):
+        return jsonify({'error': 'pairs=LOC:PARAM,... is required (or probe=true with parameter_id)'}), 400
+    if len(pairs) > SERIES_MAX_PAIRS:
+        return jsonify({'error': f"At most {SERIES_MAX_PAIRS} pairs per request"}), 400
+    if any(not 1 <= pair_limit <= SERIES_MAX_LIMIT for _, _, pair_limit in pairs):
+        return jsonify({'error': f"limit must be between 1 and {SERIES_MAX_LIMIT}"}), 400
+    
+    if probe:
+        return jsonify({'series': probe_series(pairs, parameter_id), 'meta': {'probe': True}})
+    
+    since = datetime.utcnow() - timedelta(days=days) if days else None
+    series = {(location_id, pair_parameter): [] for location_id, pair_parameter, _ in pairs}
+    cutoff = None if resolution else retention_cutoff(current_app.config)
+    for row in query_series(pairs, resolution, since, cutoff):
+        point = {'timestamp': row.timestamp.isoformat(), 'value': round(float(row.value), 3)}
+        if resolution:
+            point.update({'min': float(row.min), 'max': float(row.max), 'count': int(row.count)})
+        series[(row.location_id, row.parameter_id)].append(point)
+    
+    return jsonify({
+        'series': [
+            {
+                'location_id': location_id,
+                'parameter_id': pair_parameter,
+                'limit': pair_limit,
+                'found': len(series[(location_id, pair_parameter)]),
+                'results': series[(location_id, pair_parameter)]
+            }
+            for location_id, pair_parameter, pair_limit in pairs
+        ],
+        'meta': {
+            'pairs': len(pairs),
+            'resolution': resolution or 'raw',
+            'days': days
+        }
+    })
+
+def parse_series_pairs(raw, default_limit):
+    """'12:2,13:2:50' -> [(12, 2, default_limit), (13, 2, 50)] (duplicates dropped)"""
+    pairs = {}
+    for item in filter(None, (part.strip() for part in raw.split(','))):
+        fields = item.split(':')
+        if len(fields) not in (2, 3):
+            raise ValueError(f"Invalid pair '{item}' - expected LOCATION_ID:PARAMETER_ID[:LIMIT]")
+        try:
+            numbers = [int(field) for field in fields]
+        except ValueError:
+            raise ValueError(f"Invalid pair '{item}' - ids and limits must be integers")
+        pairs[(numbers[0], numbers[1])] = numbers[2] if len(numbers) == 3 else default_limit
+    return [(location_id, parameter_id, pair_limit) for (location_id, parameter_id), pair_limit in pairs.items()]
+
+def query_series(pairs, resolution, since, cutoff=None):
+    """Newest `limit` readings (or rollup buckets) per pair: a VALUES list joined LATERAL
+
+    Each pair's subquery walks the (sensor_id, timestamp) index backwards and
+    stops after its own limit, so a pair's cost does not depend on its history.
+    Several sensors of one pair are merged (rollups: per bucket). Raw series
+    continue with hourly averages before the retention `cutoff`, like load_series.
+    """
+    values_sql = ', '.join(f"(:l{i}, :p{i}, :n{i})" for i in range(len(pairs)))
+    params = {'since': since}
+    for i, (location_id, parameter_id, pair_limit) in enumerate(pairs):
+        params.update({f"l{i}": location_id, f"p{i}": parameter_id, f"n{i}": pair_limit})
+    since_sql = "AND {column} >= :since" if since else ""
+    
+    if resolution:
+        table = ROLLUP_MODELS[resolution].__tablename__
+        inner = (
+            f"SELECT r.bucket AS timestamp, sum(r.sum_value) / sum(r.count) AS value, "
+            f"min(r.min_value) AS min, max(r.max_value) AS max, sum(r.count) AS count "
+            f"FROM {table} r JOIN sensors s ON s.id = r.sensor_id "
+            f"WHERE s.location_id = pair.location_id AND s.parameter_id = pair.parameter_id "
+            f"{since_sql.format(column='r.bucket')} "
+            f"GROUP BY r.bucket ORDER BY r.bucket DESC LIMIT pair.row_limit"
+        )
+    else:
+        cutoff_sql = "AND m.timestamp >= :cutoff" if cutoff else ""
+        inner = (
+            f"SELECT m.timestamp, m.value FROM measurements m JOIN sensors s ON s.id = m.sensor_id "
+            f"WHERE s.location_id = pair.location_id AND s.parameter_id = pair.parameter_id "
+            f"{since_sql.format(column='m.timestamp')} {cutoff_sql} "
+            f"ORDER BY m.timestamp DESC LIMIT pair.row_limit"
+        )
+        if cutoff:
+            # Raw rows before the cutoff were compacted - the hourly rollups hold that history
+            params['cutoff'] = cutoff
+            compacted = (
+                f"SELECT h.bucket AS timestamp, sum(h.sum_value) / sum(h.count) AS value "
+                f"FROM {ROLLUP_MODELS['hour'].__tablename__} h JOIN sensors s ON s.id = h.sensor_id "
+                f"WHERE s.location_id = pair.location_id AND s.parameter_id = pair.parameter_id "
+                f"{since_sql.format(column='h.bucket')} AND h.bucket < :cutoff "
+                f"GROUP BY h.bucket ORDER BY h.bucket DESC LIMIT pair.row_limit"
+            )
+            inner = (
+                f"SELECT * FROM (({inner}) UNION ALL ({compacted})) merged "
+                f"ORDER BY merged.timestamp DESC LIMIT pair.row_limit"
+            )
+    
+    return db.session.execute(db.text(
+        f"SELECT pair.location_id, pair.parameter_id, series.* "
+        f"FROM (VALUES {values_sql}) AS pair(location_id, parameter_id, row_limit) "
+        f"CROSS JOIN LATERAL ({inner}) series "
+        f"ORDER BY pair.location_id, pair.parameter_id, series.timestamp DESC"
+    ), params).all()
+
+def probe_series(pairs, parameter_id):
+    """Has-data answer per pair from the per-sensor data summaries - no measurement is read"""
+    query = db.session.query(
+        Sensor.location_id,
+        Sensor.parameter_id,
+        db.func.min(SensorDataSummary.oldest).label('oldest'),
+        db.func.max(SensorDataSummary.newest).label('newest'),
+        db.func.sum(SensorDataSummary.count).label('count')
+    ).join(SensorDataSummary, SensorDataSummary.sensor_id == Sensor.id)
+    
+    if pairs:
+        query = query.filter(tuple_(Sensor.location_id, Sensor.parameter_id).in_(
+            [(location_id, pair_parameter) for location_id, pair_parameter, _ in pairs]
+        ))
+    else:
+        query = query.filter(Sensor.parameter_id == parameter_id)
+    
+    found = {
+        (row.location_id, row.parameter_id): row
+        for row in query.group_by(Sensor.location_id, Sensor.parameter_id).all()
+    }
+    keys = [(location_id, pair_parameter) for location_id, pair_parameter, _ in pairs] if pairs else sorted(found)
+    
+    result = []
+    for key in keys:
+        row = found.get(key)
+        result.append({
+            'location_id': key[0],
+            'parameter_id': key[1],
+            'has_data': row is not None and row.count > 0,
+            'count': int(row.count) if row else 0,
+            'oldest': row.oldest.isoformat() if row else None,
+            'newest': row.newest.isoformat() if row else None
+        })
+    return result
+
 @api_bp.route('/measurements/data-range', methods=['GET'])
 @cache.cached(timeout=3600)
 def get_data_range():
@@ -143,22 +737,16 @@ def get_data_range():
     location_id = request.args.get('location_id', type=int)
     
     if location_id:
-        # Get date range for specific location
-        query = db.session.query(
-            db.func.min(Measurement.timestamp).label('oldest'),
-            db.func.max(Measurement.timestamp).label('newest'),
-            db.func.count(Measurement.id).label('total_measurements')
-        ).join(Sensor).filter(Sensor.location_id == location_id)
+        # Get date range for specific location (maintained at ingest time)
+        result = db.session.get(LocationDataSummary, location_id)
         
-        result = query.first()
-        
-        if result and result.oldest:
+        if result:
             return jsonify({
                 'location_id': location_id,
                 'oldest_data': result.oldest.isoformat(),
                 'newest_data': result.newest.isoformat(),
-                'total_measurements': result.total_measurements,
-                'data_span_years': (result.newest - result.oldest).days / 365.25 if result.newest and result.oldest else 0
+                'total_measurements': result.count,
+                'data_span_years': (result.newest - result.oldest).days / 365.25
             })
         else:
             return jsonify({
@@ -166,11 +754,11 @@ def get_data_range():
                 'message': 'No data available for this location'
             })
     else:
-        # Get overall data range
+        # Get overall data range (one row per location, not per measurement)
         query = db.session.query(
-            db.func.min(Measurement.timestamp).label('oldest'),
-            db.func.max(Measurement.timestamp).label('newest'),
-            db.func.count(Measurement.id).label('total_measurements')
+            db.func.min(LocationDataSummary.oldest).label('oldest'),
+            db.func.max(LocationDataSummary.newest).label('newest'),
+            db.func.coalesce(db.func.sum(LocationDataSummary.count), 0).label('total_measurements')
         )
         
         result = query.first()
@@ -178,7 +766,7 @@ def get_data_range():
         return jsonify({
             'overall_oldest_data': result.oldest.isoformat() if result.oldest else None,
             'overall_newest_data': result.newest.isoformat() if result.newest else None,
-            'total_measurements': result.total_measurements,
+            'total_measurements': int(result.total_measurements),
             'data_span_years': (result.newest - result.oldest).days / 365.25 if result.newest and result.oldest else 0
         })
 
@@ -1,7 +1,8 @@
 from flask import jsonify
 from sqlalchemy import func, desc
 from app.database import db
-from app.models import Location, Parameter, Sensor, Measurement
+from app.models import Location, Parameter, Sensor
+from app.counters import read_counters, recent_count
 from app.api import api_bp
 from datetime import datetime, timedelta
 from app import cache
@@ -11,31 +12,29 @@ from app import cache
 def get_overview_stats():
     """Get overview statistics for the dashboard"""
     try:
-        # Basic counts
+        # Basic counts - measurement numbers come from the counters kept by the writer (O(1))
         location_count = Location.query.count()
         sensor_count = Sensor.query.count()
         parameter_count = Parameter.query.count()
-        measurement_count = Measurement.query.count()
+        counters = read_counters()
+        measurement_count = counters['total']
         
-        # Recent measurements (last 7 days)
+        # Recent measurements (last 7 days, from the daily activity buckets)
         seven_days_ago = datetime.utcnow() - timedelta(days=7)
-        recent_measurement_count = Measurement.query.filter(
-            Measurement.timestamp >= seven_days_ago
-        ).count()
+        recent_measurement_count = recent_count(counters, days=7)
         
-        # Active sensors (sensors with measurements in last 7 days) - FIXED QUERY
-        active_sensors = db.session.query(Sensor.id).select_from(Sensor).join(Measurement).filter(
-            Measurement.timestamp >= seven_days_ago
-        ).distinct().count()
+        # Active sensors (newest reading in the last 7 days - sensors.last_updated is their last-seen time)
+        active_sensors = Sensor.query.filter(Sensor.last_updated >= seven_days_ago).count()
         
-        # Top parameters by measurement count - FIXED QUERY
-        parameter_stats = db.session.query(
-            Parameter.name,
-            Parameter.display_name,
-            func.count(Measurement.id).label('measurement_count')
-        ).select_from(Parameter).join(Sensor).join(Measurement).group_by(
-            Parameter.id, Parameter.name, Parameter.display_name
-        ).order_by(desc('measurement_count')).limit(10).all()
+        # Top parameters by measurement count
+        parameters = {p.id: p for p in Parameter.query.filter(Parameter.id.in_(list(counters['parameters']))).all()}
+        parameter_stats = sorted(
+            (
+                (parameters[parameter_id], count)
+                for parameter_id, count in counters['parameters'].items() if parameter_id in parameters
+            ),
+            key=lambda stat: stat[1], reverse=True
+        )[:10]
         
         # Locations by country
         country_stats = db.session.query(
@@ -52,11 +51,11 @@ def get_overview_stats():
             'active_sensors': active_sensors,
             'parameter_distribution': [
                 {
-                    'name': stat.name,
-                    'display_name': stat.display_name,
-                    'measurement_count': stat.measurement_count
+                    'name': parameter.name,
+                    'display_name': parameter.display_name,
+                    'measurement_count': count
                 }
-                for stat in parameter_stats
+                for parameter, count in parameter_stats
             ],
             'country_distribution': [
                 {
@@ -64,7 +63,8 @@ def get_overview_stats():
                     'location_count': stat.location_count
                 }
                 for stat in country_stats
-            ]
+            ],
+            'counters_reconciled_at': counters['reconciled_at'].isoformat() if counters['reconciled_at'] else None
         }
         
         return jsonify(result)
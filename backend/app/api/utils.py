@@ -1,3 +1,6 @@
+import base64
+import json
+from datetime import datetime, timezone
 from flask import request
 
 def parse_bounds(request):
@@ -15,3 +18,31 @@ def parse_bounds(request):
             'west': west
         }
     return None
+
+def parse_utc_timestamp(text):
+    """Naive UTC datetime from an ISO timestamp - offsets ('Z', '+02:00') are converted,
+    timestamps without one are taken as UTC. Raises ValueError for anything else."""
+    timestamp = datetime.fromisoformat(text.replace('Z', '+00:00'))
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+def encode_cursor(position):
+    """Opaque pagination token for a dict of JSON-serializable key values"""
+    raw = json.dumps(position, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token):
+    """Inverse of encode_cursor - raises ValueError for tokens we did not issue"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        position = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(position, dict):
+        raise ValueError("Invalid cursor")
+    return position
+
+def parse_include_total(request):
+    """include_total=false skips the count() query behind meta.total"""
+    return request.args.get('include_total', 'true').lower() not in ('false', '0', 'no')
@@ -0,0 +1,218 @@
+import os
+import time
+import uuid
+import redis
+from datetime import datetime, timedelta
+from celery import chain, group
+from celery.utils.log import get_task_logger
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from app.models import db, Sensor, Parameter, BackfillCheckpoint
+from app.ingest import MeasurementBatch, INSERT_CHUNK_SIZE
+from app.rate_limit import RateLimitExceeded
+from app.partitions import ensure_partitions
+from app.retention import retention_cutoff
+from app.tasks import app, fetch_api_data, parse_found_value, OPENAQ_BASE_URL, RATE_LIMIT_MAX_RETRIES
+
+logger = get_task_logger(__name__)
+
+# Progress of each run lives in a Redis hash so workers can update it cheaply
+PROGRESS_KEY = 'backfill:run:{}'
+PROGRESS_TTL = 7 * 24 * 3600
+
+progress_store = redis.Redis.from_url(app.config['REDIS_URL'])
+
+class BackfillFetchError(Exception):
+    """A window page could not be fetched (retries exhausted) - the window must not count as done"""
+
+def split_windows(start, end, window_days):
+    """Split [start, end) into consecutive windows of at most `window_days`"""
+    windows = []
+    step = timedelta(days=window_days)
+    while start < end:
+        windows.append((start, min(start + step, end)))
+        start += step
+    return windows
+
+def plan_backfill(since, until, parameter=None, location_id=None, window_days=30):
+    """Create/resume checkpoints and dispatch one chain of window tasks per sensor
+
+    Sensors run in parallel; the windows of one sensor run in order so its
+    high-water mark only ever moves forward. Re-running the same command after a
+    crash resumes every sensor from its checkpoint.
+    """
+    query = db.session.query(Sensor.id, Sensor.openaq_id)
+    if parameter:
+        query = query.join(Parameter).filter(Parameter.name == parameter)
+    if location_id:
+        query = query.filter(Sensor.location_id == location_id)
+    sensors = dict(query.all())  # our id -> openaq id
+
+    run_id = uuid.uuid4().hex[:12]
+    cutoff = retention_cutoff(app.config)
+    if cutoff is not None and since < cutoff:
+        # Raw history before the cutoff is compacted - loading it would re-create
+        # dropped partitions and count those readings twice in the rollups
+        raise ValueError(f"--since is before the retention cutoff {cutoff:%Y-%m-%d} (RAW_RETENTION_DAYS)")
+    if not sensors:
+        return {'run_id': run_id, 'sensors': 0, 'windows': 0}
+
+    # Historical months get their own partitions instead of piling up in the default one
+    ensure_partitions(start=since, end=until, months_ahead=0)
+
+    # One checkpoint row per (sensor, range) - existing ones are resumed
+    rows = [
+        {'sensor_id': sensor_id, 'range_start': since, 'range_end': until, 'rows_written': 0, 'completed': False}
+        for sensor_id in sensors
+    ]
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        db.session.execute(
+            insert(BackfillCheckpoint.__table__).values(rows[start:start + INSERT_CHUNK_SIZE])
+            .on_conflict_do_nothing(index_elements=['sensor_id', 'range_start', 'range_end'])
+        )
+    db.session.commit()
+
+    checkpoints = db.session.execute(
+        select(BackfillCheckpoint).where(
+            BackfillCheckpoint.sensor_id.in_(list(sensors)),
+            BackfillCheckpoint.range_start == since,
+            BackfillCheckpoint.range_end == until
+        )
+    ).scalars().all()
+
+    chains = []
+    total_windows = 0
+    resumed = 0
+    for checkpoint in checkpoints:
+        if checkpoint.completed:
+            continue
+        if checkpoint.high_water_mark:
+            resumed += 1
+        windows = split_windows(checkpoint.high_water_mark or since, until, window_days)
+        total_windows += len(windows)
+        chains.append(chain(
+            backfill_sensor_window.si(run_id, checkpoint.id, sensors[checkpoint.sensor_id],
+                                      start.isoformat(), end.isoformat())
+            for start, end in windows
+        ))
+
+    progress_store.hset(PROGRESS_KEY.format(run_id), mapping={
+        'since': since.isoformat(),
+        'until': until.isoformat(),
+        'parameter': parameter or '',
+        'sensors': len(chains),
+        'windows_total': total_windows,
+        'windows_done': 0,
+        'rows_inserted': 0,
+        'rows_skipped': 0,
+        'api_calls': 0,
+        'started_at': time.time(),
+        'updated_at': time.time()
+    })
+    progress_store.expire(PROGRESS_KEY.format(run_id), PROGRESS_TTL)
+
+    if chains:
+        group(chains).apply_async()
+
+    return {
+        'run_id': run_id,
+        'sensors': len(chains),
+        'already_complete': len(checkpoints) - len(chains),
+        'resumed': resumed,
+        'windows': total_windows
+    }
+
+def backfill_progress(run_id):
+    """Progress of a run with rows/second since it started (None if unknown)"""
+    raw = progress_store.hgetall(PROGRESS_KEY.format(run_id))
+    if not raw:
+        return None
+
+    progress = {key.decode(): value.decode() for key, value in raw.items()}
+    for key in ('sensors', 'windows_total', 'windows_done', 'rows_inserted', 'rows_skipped', 'api_calls'):
+        progress[key] = int(float(progress[key]))
+
+    elapsed = float(progress.pop('updated_at')) - float(progress.pop('started_at'))
+    progress['elapsed_seconds'] = round(elapsed, 1)
+    progress['rows_per_second'] = round(progress['rows_inserted'] / elapsed, 1) if elapsed > 0 else 0.0
+    progress['percent_done'] = round(100 * progress['windows_done'] / progress['windows_total'], 1) if progress['windows_total'] else 100.0
+    return progress
+
+def fetch_sensor_window(openaq_sensor_id, sensor_id, window_start, window_end, page_size=1000):
+    """Fetch one sensor's readings for a window page by page, writing each page in one batch"""
+    url = f"{OPENAQ_BASE_URL}/sensors/{openaq_sensor_id}/measurements"
+    headers = {'X-API-Key': os.getenv('OPENAQ_API_KEY')}
+    params = {
+        'datetime_from': window_start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'datetime_to': window_end.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'limit': page_size,
+        'page': 1
+    }
+    stats = {'api_calls': 0, 'inserted': 0, 'skipped': 0}
+
+    while True:
+        # A sensor OpenAQ has no history for answers 404 - an empty window, not a failure to retry
+        data = fetch_api_data(url, headers, params, not_found={'results': []})
+        stats['api_calls'] += 1
+        if data is None:
+            # Raise so the task is retried and the checkpoint stays before this window
+            raise BackfillFetchError(
+                f"Could not fetch sensor {openaq_sensor_id} {window_start} - {window_end}, page {params['page']}"
+            )
+        if not data.get('results'):
+            return stats  # A successful, empty response: nothing (more) in this window
+
+        batch = MeasurementBatch()
+        for measurement in data['results']:
+            batch.add(sensor_id, measurement)
+        write_stats = batch.flush()
+        stats['inserted'] += write_stats['inserted']
+        stats['skipped'] += write_stats['skipped']
+
+        found = parse_found_value(data.get('meta', {}).get('found', 0))
+        if len(data['results']) < page_size or params['page'] * page_size >= found:
+            return stats
+        params['page'] += 1
+
+# Import celery from celery_app after app is created
+from celery_app import celery
+
+@celery.task(bind=True, autoretry_for=(Exception,), retry_kwargs={'max_retries': 3, 'countdown': 120})
+def backfill_sensor_window(self, run_id, checkpoint_id, openaq_sensor_id, window_start, window_end):
+    """Backfill one (sensor, time window) and advance the sensor's checkpoint"""
+    with app.app_context():
+        window_start = datetime.fromisoformat(window_start)
+        window_end = datetime.fromisoformat(window_end)
+
+        checkpoint = db.session.get(BackfillCheckpoint, checkpoint_id)
+        if checkpoint is None:
+            logger.warning(f"Backfill checkpoint {checkpoint_id} is gone, skipping window")
+            return {'status': 'no_checkpoint'}
+        if checkpoint.high_water_mark and checkpoint.high_water_mark >= window_end:
+            return {'status': 'already_done'}  # Redelivered task
+
+        try:
+            stats = fetch_sensor_window(openaq_sensor_id, checkpoint.sensor_id, window_start, window_end)
+        except RateLimitExceeded as e:
+            # Pages written so far are safe to refetch - inserts skip duplicates
+            raise self.retry(countdown=e.retry_after, max_retries=RATE_LIMIT_MAX_RETRIES)
+        except Exception as e:
+            logger.error(f"Backfill of sensor {checkpoint.sensor_id} {window_start} - {window_end} failed: {e}")
+            raise
+
+        checkpoint.high_water_mark = window_end
+        checkpoint.rows_written += stats['inserted']
+        checkpoint.completed = window_end >= checkpoint.range_end
+        db.session.commit()
+
+        key = PROGRESS_KEY.format(run_id)
+        pipe = progress_store.pipeline()
+        pipe.hincrby(key, 'windows_done', 1)
+        pipe.hincrby(key, 'rows_inserted', stats['inserted'])
+        pipe.hincrby(key, 'rows_skipped', stats['skipped'])
+        pipe.hincrby(key, 'api_calls', stats['api_calls'])
+        pipe.hset(key, 'updated_at', time.time())
+        pipe.execute()
+
+        logger.info(f"Backfill {run_id}: sensor {checkpoint.sensor_id} {window_start:%Y-%m-%d} - {window_end:%Y-%m-%d}: {stats}")
+        return dict(stats, status='success', sensor_id=checkpoint.sensor_id)
@@ -0,0 +1,110 @@
+import random
+from datetime import datetime, timedelta
+from sqlalchemy.dialects.postgresql import insert
+from app.database import db
+from app.models import MeasurementCounter
+
+TOTAL = 'measurements'
+COUNTER_SHARDS = 8  # Concurrent writers spread their increments over this many rows per counter
+ACTIVITY_DAYS = 8  # Day buckets kept - enough for a rolling 7-day window
+
+def parameter_counter(parameter_id):
+    return f"parameter:{parameter_id}"
+
+def day_counter(day):
+    return f"day:{day:%Y-%m-%d}"
+
+def apply_counters(rows, sensors):
+    """Add newly inserted (sensor_id, timestamp, value) rows to the dashboard counters
+
+    `sensors` maps sensor_id -> (location_id, parameter_id). Like apply_rollups:
+    only rows that were really inserted, inside the writer's transaction. Each
+    writer adds to one randomly chosen shard of every counter, so concurrent
+    flushes do not queue up behind a single 'total' row.
+    """
+    if not rows:
+        return 0
+
+    oldest_day = (datetime.utcnow() - timedelta(days=ACTIVITY_DAYS)).date()
+
+    increments = {TOTAL: len(rows)}
+    for sensor_id, timestamp, _ in rows:
+        key = parameter_counter(sensors[sensor_id][1])
+        increments[key] = increments.get(key, 0) + 1
+        if timestamp.date() >= oldest_day:
+            key = day_counter(timestamp)
+            increments[key] = increments.get(key, 0) + 1
+
+    shard = random.randrange(COUNTER_SHARDS)
+    table = MeasurementCounter.__table__
+    stmt = insert(table).values([
+        {'name': name, 'shard': shard, 'value': value} for name, value in sorted(increments.items())
+    ])
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['name', 'shard'],
+        set_={'value': table.c.value + stmt.excluded.value}
+    ))
+    return len(increments)
+
+def read_counters():
+    """Current counters: {'total', 'parameters': {parameter_id: n}, 'days': {date: n}}
+
+    Reads a few dozen rows however many measurements there are. 'reconciled_at'
+    is None until reconcile_counters() has run once.
+    """
+    counters = {'total': 0, 'parameters': {}, 'days': {}, 'reconciled_at': None}
+    for name, value, updated in db.session.query(
+        MeasurementCounter.name,
+        db.func.sum(MeasurementCounter.value),
+        db.func.min(MeasurementCounter.reconciled_at)
+    ).group_by(MeasurementCounter.name).all():
+        if name == TOTAL:
+            counters['total'] = int(value)
+            counters['reconciled_at'] = updated
+        elif name.startswith('parameter:'):
+            counters['parameters'][int(name.split(':', 1)[1])] = int(value)
+        elif name.startswith('day:'):
+            counters['days'][datetime.strptime(name.split(':', 1)[1], '%Y-%m-%d').date()] = int(value)
+    return counters
+
+def recent_count(counters, days=7, now=None):
+    """Readings in the day buckets of the last `days` days (today included)"""
+    first_day = ((now or datetime.utcnow()) - timedelta(days=days)).date()
+    return sum(value for day, value in counters['days'].items() if day >= first_day)
+
+def reconcile_counters():
+    """Re-sync every counter to the daily rollups and replace the sharded rows
+
+    The counters end up matching measurements_daily, not the raw table: rows
+    written or removed behind the writer's back (migrations, manual deletes)
+    only show up here once rebuild-rollups has carried them into the rollups.
+    The daily rollups still hold compacted history, so the totals include
+    readings retention removed from the raw table. The counter
+    table is locked for the (short) recount so no concurrent increment is lost
+    or counted twice. Returns the new counters.
+    """
+    now = datetime.utcnow()
+    first_day = (now - timedelta(days=ACTIVITY_DAYS)).replace(hour=0, minute=0, second=0, microsecond=0)
+    try:
+        db.session.execute(db.text("LOCK TABLE measurement_counters IN EXCLUSIVE MODE"))
+        per_parameter = db.session.execute(db.text(
+            "SELECT s.parameter_id, sum(d.count) FROM measurements_daily d "
+            "JOIN sensors s ON s.id = d.sensor_id GROUP BY s.parameter_id"
+        )).all()
+        per_day = db.session.execute(db.text(
+            "SELECT bucket, sum(count) FROM measurements_daily WHERE bucket >= :first_day GROUP BY bucket"
+        ), {'first_day': first_day}).all()
+
+        rows = [{'name': TOTAL, 'value': sum(int(count) for _, count in per_parameter)}]
+        rows += [{'name': parameter_counter(parameter_id), 'value': int(count)} for parameter_id, count in per_parameter]
+        rows += [{'name': day_counter(day), 'value': int(count)} for day, count in per_day]
+
+        db.session.execute(db.text("DELETE FROM measurement_counters"))
+        db.session.execute(insert(MeasurementCounter.__table__).values([
+            dict(row, shard=0, reconciled_at=now) for row in rows
+        ]))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return read_counters()
@@ -0,0 +1,154 @@
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import func, select
+from app.database import db
+from app.models import Measurement
+from app.rollups import ROLLUP_MODELS
+
+DOWNSAMPLE_METHODS = ('lttb', 'minmax')
+MAX_POINTS = 5000
+EPOCH = datetime(1970, 1, 1)
+
+def to_epoch(timestamp):
+    """Naive UTC datetime -> epoch seconds (what extract(epoch ...) returns for our columns)"""
+    return (timestamp - EPOCH).total_seconds()
+
+class Series:
+    """One time series as parallel NumPy arrays, oldest first
+
+    t is epoch seconds; avg/lo/hi/count describe each sample - for raw readings
+    lo == hi == avg and count == 1, rollup buckets carry their min/max/count.
+    """
+
+    def __init__(self, t, avg, lo, hi, count, source):
+        self.t = t
+        self.avg = avg
+        self.lo = lo
+        self.hi = hi
+        self.count = count
+        self.source = source
+
+    def __len__(self):
+        return len(self.t)
+
+def pick_source(start, end, points):
+    """Coarsest tier whose resolution is still finer than one output point"""
+    step = (end - start) / points
+    if step >= timedelta(days=1):
+        return 'day'
+    if step >= timedelta(hours=1):
+        return 'hour'
+    return 'raw'
+
+def load_series(sensor_ids, start, end, source, cutoff=None):
+    """Read [start, end) for the sensors from `source` into a Series
+
+    Raw reads switch to the hourly rollups before the retention `cutoff`, where
+    raw rows no longer exist.
+    """
+    parts = []
+    if source == 'raw':
+        raw_start = max(start, cutoff) if cutoff else start
+        if cutoff and start < cutoff:
+            parts.append(_fetch_rollup('hour', sensor_ids, start, min(end, cutoff)))
+        if raw_start < end:
+            epoch = func.extract('epoch', Measurement.timestamp)
+            rows = db.session.execute(
+                select(epoch, Measurement.value).where(
+                    Measurement.sensor_id.in_(sensor_ids),
+                    Measurement.timestamp >= raw_start,
+                    Measurement.timestamp < end
+                ).order_by(Measurement.timestamp)
+            ).all()
+            data = np.array(rows, dtype=np.float64).reshape(-1, 2)
+            parts.append((data[:, 0], data[:, 1], data[:, 1], data[:, 1], np.ones(len(data))))
+    else:
+        parts.append(_fetch_rollup(source, sensor_ids, start, end))
+
+    t, avg, lo, hi, count = (np.concatenate(column) for column in zip(*parts))
+    if len(sensor_ids) > 1:
+        # Several sensors of one parameter at a location form one series
+        order = np.argsort(t, kind='stable')
+        t, avg, lo, hi, count = t[order], avg[order], lo[order], hi[order], count[order]
+    return Series(t, avg, lo, hi, count, source)
+
+def _fetch_rollup(resolution, sensor_ids, start, end):
+    model = ROLLUP_MODELS[resolution]
+    rows = db.session.execute(
+        select(
+            func.extract('epoch', model.bucket), model.sum_value, model.count, model.min_value, model.max_value
+        ).where(
+            model.sensor_id.in_(sensor_ids),
+            model.bucket >= start,
+            model.bucket < end
+        ).order_by(model.bucket)
+    ).all()
+    data = np.array(rows, dtype=np.float64).reshape(-1, 5)
+    return data[:, 0], data[:, 1] / np.maximum(data[:, 2], 1), data[:, 3], data[:, 4], data[:, 2]
+
+def lttb(series, points):
+    """Largest-Triangle-Three-Buckets: indices of `points` samples that keep the visual shape"""
+    n = len(series)
+    if points >= n or points < 3:
+        return np.arange(n) if points >= n else np.linspace(0, n - 1, max(points, 1)).astype(int)
+
+    t, y = series.t, series.avg
+    edges = np.linspace(1, n - 1, points - 1).astype(int)  # Buckets between the fixed first and last point
+    chosen = np.empty(points, dtype=int)
+    chosen[0], chosen[-1] = 0, n - 1
+    previous = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        # Average of the next bucket (or the last point) is the triangle's third corner
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        if next_lo >= next_hi:
+            next_lo, next_hi = n - 1, n
+        third_t = t[next_lo:next_hi].mean()
+        third_y = y[next_lo:next_hi].mean()
+
+        area = np.abs(
+            (t[previous] - third_t) * (y[lo:hi] - y[previous])
+            - (t[previous] - t[lo:hi]) * (third_y - y[previous])
+        )
+        previous = lo + int(area.argmax())
+        chosen[i + 1] = previous
+    return chosen
+
+def bucket_minmax(series, points, start, end):
+    """Equal-width time buckets over [start, end): (bucket start, avg, min, max, count) of the non-empty ones"""
+    edges = np.linspace(to_epoch(start), to_epoch(end), points + 1)
+    starts = np.searchsorted(series.t, edges[:-1], side='left')
+    stops = np.searchsorted(series.t, edges[1:], side='left')
+    filled = starts < stops
+    if not filled.any():
+        return []
+
+    first = starts[filled]  # Consecutive non-empty buckets are contiguous because t is sorted
+    weighted = series.avg * series.count
+    total = np.add.reduceat(weighted, first)
+    count = np.add.reduceat(series.count, first)
+    low = np.minimum.reduceat(series.lo, first)
+    high = np.maximum.reduceat(series.hi, first)
+    return list(zip(edges[:-1][filled], total / count, low, high, count))
+
+def downsample(series, points, method, start, end):
+    """At most `points` samples, newest first, in the /measurements result shape"""
+    if method == 'minmax':
+        return [
+            {
+                'timestamp': (EPOCH + timedelta(seconds=float(bucket))).isoformat(),
+                'value': round(float(avg), 3),
+                'min': float(low),
+                'max': float(high),
+                'count': int(count)
+            }
+            for bucket, avg, low, high, count in reversed(bucket_minmax(series, points, start, end))
+        ]
+
+    return [
+        {
+            'timestamp': (EPOCH + timedelta(seconds=float(series.t[i]))).isoformat(),
+            'value': round(float(series.avg[i]), 3)
+        }
+        for i in reversed(lttb(series, points))
+    ]
@@ -0,0 +1,485 @@
+import hashlib
+import json
+import math
+from datetime import datetime, timezone
+from sqlalchemy import Integer, Numeric, DateTime, String, Boolean, column, values, update, select, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DataError, IntegrityError
+from flask import current_app
+from celery.utils.log import get_task_logger
+from app.database import db
+from app.models import Location, Parameter, Sensor, Measurement
+from app.rollups import apply_rollups
+from app.counters import apply_counters
+from app.summaries import apply_summaries
+from app.retention import retention_cutoff
+
+logger = get_task_logger(__name__)
+
+# Rows per INSERT statement (3 bind params per row keeps us far below PostgreSQL's 65535 limit)
+INSERT_CHUNK_SIZE = 1000
+# measurements.value is NUMERIC(8, 3): anything that rounds to 10^5 or more overflows
+VALUE_LIMIT = 10 ** 5
+# SQLSTATEs caused by the values of one row - numeric overflow, bad or out-of-range datetimes.
+# Anything else (no partition for the month, a check constraint, a missing sensor) hits every
+# row alike, so bisecting would only reject the whole batch one row at a time.
+ROW_ERROR_CODES = {'22003', '22007', '22008'}
+
+class BatchRejected(Exception):
+    """The database rejected every row of a flush - nothing was written"""
+
+def parse_measurement_timestamp(measurement):
+    """Return the UTC timestamp of an OpenAQ reading as a naive datetime (None if unknown)"""
+    if 'date' in measurement:
+        raw = measurement['date']['utc']
+    elif 'datetime' in measurement:
+        raw = measurement['datetime']['utc']
+    elif 'period' in measurement:
+        # /sensors/{id}/measurements - end of the averaging period, like /latest's datetime
+        raw = measurement['period']['datetimeTo']['utc']
+    else:
+        return None
+
+    timestamp = datetime.fromisoformat(raw.replace('Z', '+00:00'))
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+def location_problem(loc):
+    """Why an OpenAQ location payload cannot be stored (None if it can)
+
+    Checked before the page is upserted in bulk, so one malformed location is
+    skipped instead of failing the whole page. Lengths follow the column sizes
+    in app.models.
+    """
+    try:
+        if not isinstance(loc['id'], int):
+            return f"id {loc['id']!r} is not an integer"
+        if not loc['name'] or len(loc['name']) > 255:
+            return "name is empty or longer than 255 characters"
+        if loc.get('locality') is not None and len(loc['locality']) > 100:
+            return "locality is longer than 100 characters"
+        if len(loc['country']['code']) != 2:
+            return f"country code {loc['country']['code']!r} is not 2 letters"
+        for axis, limit in (('latitude', 90), ('longitude', 180)):
+            value = loc['coordinates'][axis]
+            if value is not None and not -limit <= float(value) <= limit:
+                return f"{axis} {value} is out of range"
+        if not isinstance(loc['isMobile'], bool):
+            return f"isMobile {loc['isMobile']!r} is not a boolean"
+        for sensor in loc.get('sensors', []):
+            param = sensor['parameter']
+            if not isinstance(sensor['id'], int):
+                return f"sensor id {sensor['id']!r} is not an integer"
+            if not param['name'] or len(param['name']) > 50 or len(param['units']) > 20 \
+                    or len(param.get('displayName') or '') > 100:
+                return f"parameter {param['name']!r} does not fit the parameters table"
+    except (KeyError, TypeError, ValueError) as e:
+        return f"malformed payload: {e!r}"
+    return None
+
+def location_fingerprint(loc):
+    """Stable hash of the OpenAQ location fields we store (location row + its sensors)"""
+    relevant = {
+        'name': loc['name'],
+        'locality': loc.get('locality'),
+        'country': loc['country']['code'],
+        'latitude': loc['coordinates']['latitude'],
+        'longitude': loc['coordinates']['longitude'],
+        'is_mobile': loc['isMobile'],
+        'sensors': sorted(
+            (sensor['id'], sensor['parameter']['name'], sensor['parameter']['units'])
+            for sensor in loc.get('sensors', [])
+        )
+    }
+    return hashlib.sha1(json.dumps(relevant, sort_keys=True).encode()).hexdigest()
+
+class MeasurementBatch:
+    """Collect readings for a batch of locations and write them with a few set-based statements
+
+    Instead of one existence check + commit per reading, flush() issues multi-row
+    INSERT ... ON CONFLICT (sensor_id, timestamp) DO NOTHING statements, a single
+    UPDATE sensors ... FROM (VALUES ...) for the newest reading of each sensor and
+    upserts of the rollup buckets, dashboard counters and data-range summaries the
+    new rows fall into. Values the table cannot hold are rejected when queued; a
+    row the database still refuses because of its values is isolated by retrying
+    the batch in halves, so only that row is lost.
+    """
+
+    def __init__(self):
+        self.readings = {}  # (sensor_id, timestamp) -> value
+        self.invalid = 0
+
+    def __len__(self):
+        return len(self.readings)
+
+    def add(self, sensor_id, measurement):
+        """Queue an OpenAQ reading for one of our sensors (sensor_id is our DB id)"""
+        try:
+            timestamp = parse_measurement_timestamp(measurement)
+            value = float(measurement['value'])
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Skipping malformed measurement for sensor {sensor_id}: {e}")
+            self.invalid += 1
+            return False
+
+        if timestamp is None:
+            logger.warning(f"Unknown timestamp format in measurement: {measurement}")
+            self.invalid += 1
+            return False
+
+        return self.add_reading(sensor_id, value, timestamp)
+
+    def add_reading(self, sensor_id, value, timestamp):
+        """Queue an already parsed reading; False (counted as invalid) if it cannot be stored"""
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            value = math.nan
+        if not math.isfinite(value) or abs(round(value, 3)) >= VALUE_LIMIT:
+            logger.warning(f"Skipping out-of-range value {value} for sensor {sensor_id} at {timestamp}")
+            self.invalid += 1
+            return False
+        self.readings[(sensor_id, timestamp)] = value
+        return True
+
+    def flush(self):
+        """Write all queued readings in one transaction and report what happened"""
+        self._drop_expired()
+        stats = {
+            'readings': len(self.readings),
+            'inserted': 0,
+            'skipped': 0,
+            'invalid': self.invalid,
+            'sensors_updated': 0,
+            'rollup_buckets': 0
+        }
+        if not self.readings:
+            return stats
+
+        rows = [
+            {'sensor_id': sensor_id, 'timestamp': timestamp, 'value': value}
+            for (sensor_id, timestamp), value in self.readings.items()
+        ]
+
+        try:
+            new_rows, stats['sensors_updated'], stats['rollup_buckets'], rejected = self._write(rows)
+            if rejected == len(rows):
+                raise BatchRejected(f"The database rejected all {len(rows)} readings of the batch")
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        stats['inserted'] = len(new_rows)
+        stats['invalid'] += rejected
+        stats['skipped'] = len(rows) - len(new_rows) - rejected
+        self.readings = {}
+        self.invalid = 0
+        return stats
+
+    def _write(self, rows):
+        """_write_rows() inside a SAVEPOINT, bisecting on rows the database rejects
+
+        Returns (new rows, sensors updated, rollup buckets, rows rejected).
+        Only errors in ROW_ERROR_CODES are bisected; table-level and connection
+        errors abort the flush.
+        """
+        try:
+            with db.session.begin_nested():
+                return self._write_rows(rows) + (0,)
+        except (DataError, IntegrityError) as e:
+            if getattr(e.orig, 'pgcode', None) not in ROW_ERROR_CODES:
+                raise
+            if len(rows) == 1:
+                logger.warning(f"Skipping reading rejected by the database {rows[0]}: {e.orig}")
+                return [], 0, 0, 1
+        middle = len(rows) // 2
+        first, second = self._write(rows[:middle]), self._write(rows[middle:])
+        return (first[0] + second[0],) + tuple(a + b for a, b in zip(first[1:], second[1:]))
+
+    def _write_rows(self, rows):
+        """Insert rows and fold the new ones into sensors, rollups, counters and summaries
+
+        Returns (new rows, sensors updated, rollup buckets).
+        """
+        measurements = Measurement.__table__
+        new_rows = []  # Only rows that were not already stored
+        for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+            chunk = rows[start:start + INSERT_CHUNK_SIZE]
+            stmt = insert(measurements).values(chunk).on_conflict_do_nothing(
+                index_elements=['sensor_id', 'timestamp']
+            ).returning(measurements.c.sensor_id, measurements.c.timestamp, measurements.c.value)
+            new_rows.extend(db.session.execute(stmt).all())
+
+        sensors_updated = self._update_sensor_last_values(rows)
+        rollup_buckets = apply_rollups(new_rows)
+        if new_rows:
+            sensors = {
+                sensor_id: (location_id, parameter_id)
+                for sensor_id, location_id, parameter_id in db.session.query(
+                    Sensor.id, Sensor.location_id, Sensor.parameter_id
+                ).filter(Sensor.id.in_({row[0] for row in new_rows})).all()
+            }
+            apply_counters(new_rows, sensors)
+            apply_summaries(new_rows, sensors)
+        return new_rows, sensors_updated, rollup_buckets
+
+    def _drop_expired(self):
+        """Drop readings older than the retention cutoff (counted as invalid)
+
+        Their months are - or are about to be - compacted into the rollups, so
+        writing them raw would count them twice once the month is rolled up
+        again.
+        """
+        cutoff = retention_cutoff(current_app.config)
+        if cutoff is None:
+            return
+        expired = [key for key in self.readings if key[1] < cutoff]
+        if expired:
+            logger.warning(f"Skipping {len(expired)} readings older than the retention cutoff {cutoff:%Y-%m-%d}")
+            for key in expired:
+                del self.readings[key]
+            self.invalid += len(expired)
+
+    def _update_sensor_last_values(self, rows):
+        """Move sensors.last_value/last_updated forward in one UPDATE ... FROM (VALUES ...)"""
+        newest = {}
+        for row in rows:
+            sensor_id, timestamp, value = row['sensor_id'], row['timestamp'], row['value']
+            if sensor_id not in newest or timestamp > newest[sensor_id][0]:
+                newest[sensor_id] = (timestamp, value)
+
+        latest = values(
+            column('id', Integer),
+            column('last_value', Numeric(8, 3)),
+            column('last_updated', DateTime),
+            name='latest'
+        ).data([
+            (sensor_id, value, timestamp) for sensor_id, (timestamp, value) in newest.items()
+        ])
+
+        sensors = Sensor.__table__
+        stmt = update(sensors).where(
+            sensors.c.id == latest.c.id,
+            or_(sensors.c.last_updated.is_(None), sensors.c.last_updated < latest.c.last_updated)
+        ).values(
+            last_value=latest.c.last_value,
+            last_updated=latest.c.last_updated
+        )
+        return db.session.execute(stmt).rowcount
+
+class LookupCache:
+    """Per-run identity map for the rows OpenAQ payloads refer to
+
+    Loads parameter name -> id, location openaq_id -> id (+ metadata fingerprint)
+    and sensor openaq_id -> id with one query each, answers lookups from dicts
+    afterwards and writes only what is new or changed, in bulk. Hit/miss/query
+    counters show how much work a sync actually did.
+    """
+
+    def __init__(self):
+        self.parameters = {}  # name -> id
+        self.locations = {}  # openaq_id -> id
+        self.fingerprints = {}  # openaq_id -> fingerprint stored on the location
+        self.sensors = {}  # openaq_id -> id
+        self.counters = {
+            'hits': 0,
+            'misses': 0,
+            'queries': 0,
+            'parameters_created': 0,
+            'locations_created': 0,
+            'locations_updated': 0,
+            'locations_unchanged': 0,
+            'locations_invalid': 0,
+            'sensors_created': 0
+        }
+
+    @classmethod
+    def load(cls):
+        cache = cls()
+        cache.parameters = dict(db.session.query(Parameter.name, Parameter.id).all())
+        for openaq_id, location_id, fingerprint in db.session.query(
+            Location.openaq_id, Location.id, Location.fingerprint
+        ).all():
+            cache.locations[openaq_id] = location_id
+            cache.fingerprints[openaq_id] = fingerprint
+        cache.sensors = dict(db.session.query(Sensor.openaq_id, Sensor.id).all())
+        cache.counters['queries'] += 3
+        return cache
+
+    def sync_locations(self, payloads):
+        """Upsert a page of OpenAQ location payloads with their parameters and sensors
+
+        Locations whose fingerprint matches the stored one are left untouched
+        (no UPDATE, no sensor checks), malformed ones are logged and skipped (see
+        location_problem). Returns {openaq_location_id: our location id} for every
+        stored payload. Everything is committed in one transaction.
+        """
+        valid = []
+        for loc in payloads:
+            problem = location_problem(loc)
+            if problem:
+                logger.warning(f"Skipping location {loc.get('id') if isinstance(loc, dict) else loc}: {problem}")
+                self.counters['locations_invalid'] += 1
+            else:
+                valid.append(loc)
+        payloads = valid
+
+        try:
+            written = self._upsert_locations(payloads)
+            changed = [loc for loc, _ in written]
+            self._ensure_parameters(changed)
+            self._ensure_sensors(changed)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        # Only remember fingerprints once they are committed
+        for loc, fingerprint in written:
+            self.fingerprints[loc['id']] = fingerprint
+
+        return {loc['id']: self.locations[loc['id']] for loc in payloads if loc['id'] in self.locations}
+
+    def stats(self):
+        lookups = self.counters['hits'] + self.counters['misses']
+        return dict(self.counters, hit_rate=round(self.counters['hits'] / lookups, 3) if lookups else None)
+
+    def _lookup(self, mapping, key):
+        if key in mapping:
+            self.counters['hits'] += 1
+            return True
+        self.counters['misses'] += 1
+        return False
+
+    def _insert_missing(self, table, rows, key_column):
+        """INSERT ... ON CONFLICT DO NOTHING RETURNING key, id for new rows
+
+        Keys another worker inserted first are read back. Returns ({key: id}, rows created).
+        """
+        if not rows:
+            return {}, 0
+
+        key = table.c[key_column]
+        ids = dict(db.session.execute(
+            insert(table).values(rows).on_conflict_do_nothing(index_elements=[key_column])
+            .returning(key, table.c.id)
+        ).all())
+        self.counters['queries'] += 1
+        created = len(ids)
+
+        raced = [row[key_column] for row in rows if row[key_column] not in ids]
+        if raced:
+            ids.update(db.session.execute(select(key, table.c.id).where(key.in_(raced))).all())
+            self.counters['queries'] += 1
+
+        return ids, created
+
+    def _ensure_parameters(self, payloads):
+        new_rows = {}
+        for loc in payloads:
+            for sensor in loc.get('sensors', []):
+                param = sensor['parameter']
+                if param['name'] in new_rows or self._lookup(self.parameters, param['name']):
+                    continue
+                new_rows[param['name']] = {
+                    'name': param['name'],
+                    'display_name': param.get('displayName', param['name']),
+                    'unit': param['units']
+                }
+
+        if new_rows:
+            ids, created = self._insert_missing(Parameter.__table__, list(new_rows.values()), 'name')
+            self.parameters.update(ids)
+            self.counters['parameters_created'] += created
+
+    def _upsert_locations(self, payloads):
+        """Insert new locations, update changed ones; returns [(payload, fingerprint)] written"""
+        new_rows = []
+        changed_rows = []
+        written = []
+        now = datetime.utcnow()
+
+        for loc in payloads:
+            fingerprint = location_fingerprint(loc)
+            row = {
+                'openaq_id': loc['id'],
+                'name': loc['name'],
+                'locality': loc.get('locality'),
+                'country_code': loc['country']['code'],
+                'latitude': loc['coordinates']['latitude'],
+                'longitude': loc['coordinates']['longitude'],
+                'is_mobile': loc['isMobile'],
+                'fingerprint': fingerprint
+            }
+            if self._lookup(self.locations, loc['id']):
+                if self.fingerprints.get(loc['id']) == fingerprint:
+                    self.counters['locations_unchanged'] += 1
+                    continue
+                changed_rows.append(dict(row, id=self.locations[loc['id']], last_updated=now))
+            else:
+                new_rows.append(row)
+            written.append((loc, fingerprint))
+
+        if new_rows:
+            ids, created = self._insert_missing(Location.__table__, new_rows, 'openaq_id')
+            self.locations.update(ids)
+            self.counters['locations_created'] += created
+
+        if changed_rows:
+            self.counters['locations_updated'] += self._update_locations(changed_rows)
+
+        return written
+
+    def _update_locations(self, rows):
+        """Rewrite changed locations in one UPDATE ... FROM (VALUES ...)"""
+        locations = Location.__table__
+        incoming = values(
+            column('id', Integer),
+            column('name', String),
+            column('locality', String),
+            column('latitude', Numeric(9, 6)),
+            column('longitude', Numeric(9, 6)),
+            column('is_mobile', Boolean),
+            column('last_updated', DateTime),
+            column('fingerprint', String),
+            name='incoming'
+        ).data([
+            (row['id'], row['name'], row['locality'], row['latitude'], row['longitude'],
+             row['is_mobile'], row['last_updated'], row['fingerprint'])
+            for row in rows
+        ])
+
+        stmt = update(locations).where(locations.c.id == incoming.c.id).values(
+            name=incoming.c.name,
+            locality=incoming.c.locality,
+            latitude=incoming.c.latitude,
+            longitude=incoming.c.longitude,
+            is_mobile=incoming.c.is_mobile,
+            last_updated=incoming.c.last_updated,
+            fingerprint=incoming.c.fingerprint
+        )
+        self.counters['queries'] += 1
+        return db.session.execute(stmt).rowcount
+
+    def _ensure_sensors(self, payloads):
+        new_rows = []
+        for loc in payloads:
+            location_id = self.locations.get(loc['id'])
+            if location_id is None:
+                logger.warning(f"Location {loc['id']} missing after upsert, skipping its sensors")
+                continue
+            for sensor in loc.get('sensors', []):
+                if self._lookup(self.sensors, sensor['id']):
+                    continue
+                new_rows.append({
+                    'openaq_id': sensor['id'],
+                    'location_id': location_id,
+                    'parameter_id': self.parameters[sensor['parameter']['name']]
+                })
+
+        if new_rows:
+            ids, created = self._insert_missing(Sensor.__table__, new_rows, 'openaq_id')
+            self.sensors.update(ids)
+            self.counters['sensors_created'] += created
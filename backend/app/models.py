@@ -13,6 +13,7 @@ class Location(db.Model):
     longitude = db.Column(db.Numeric(9,6))
     is_mobile = db.Column(db.Boolean, default=False)
     last_updated = db.Column(db.DateTime, default=db.func.now())
+    fingerprint = db.Column(db.String(40))  # Hash of the synced OpenAQ metadata, see app.ingest.location_fingerprint
     
     # Add relationship for eager loading
     sensors = db.relationship('Sensor', backref='location', lazy='select')
@@ -37,10 +38,93 @@ class Sensor(db.Model):
     parameter = db.relationship('Parameter', backref='sensors', lazy='select')
     measurements = db.relationship('Measurement', backref='sensor', lazy='select')
 
+# Range partitioned by month on timestamp - partitions are managed in app/partitions.py,
+# so the partition key is part of the primary key
 class Measurement(db.Model):
     __tablename__ = 'measurements'
-    id = db.Column(db.Integer, primary_key=True)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     sensor_id = db.Column(db.Integer, db.ForeignKey('sensors.id'), nullable=False)
     value = db.Column(db.Numeric(8,3), nullable=False)
-    timestamp = db.Column(db.DateTime, nullable=False)
+    timestamp = db.Column(db.DateTime, primary_key=True, nullable=False)
+
+    # One reading per sensor and timestamp - lets ingestion use INSERT ... ON CONFLICT DO NOTHING
+    __table_args__ = (
+        db.UniqueConstraint('sensor_id', 'timestamp', name='uq_measurements_sensor_timestamp'),
+        {'postgresql_partition_by': 'RANGE (timestamp)'},
+    )
+
+# Hourly and daily aggregates per sensor, kept up to date by the ingestion writer (app/rollups.py)
+class MeasurementHourly(db.Model):
+    __tablename__ = 'measurements_hourly'
+    sensor_id = db.Column(db.Integer, db.ForeignKey('sensors.id'), primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)  # Start of the hour (UTC)
+    min_value = db.Column(db.Numeric(8,3), nullable=False)
+    max_value = db.Column(db.Numeric(8,3), nullable=False)
+    sum_value = db.Column(db.Numeric(14,3), nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+
+    sensor = db.relationship('Sensor', lazy='select')
+
+class MeasurementDaily(db.Model):
+    __tablename__ = 'measurements_daily'
+    sensor_id = db.Column(db.Integer, db.ForeignKey('sensors.id'), primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)  # Start of the day (UTC)
+    min_value = db.Column(db.Numeric(8,3), nullable=False)
+    max_value = db.Column(db.Numeric(8,3), nullable=False)
+    sum_value = db.Column(db.Numeric(14,3), nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+
+    sensor = db.relationship('Sensor', lazy='select')
+
+# Dashboard counters (app/counters.py): total, per-parameter and per-day reading counts,
+# incremented by the ingestion writer in sharded rows and periodically reconciled
+class MeasurementCounter(db.Model):
+    __tablename__ = 'measurement_counters'
+    name = db.Column(db.String(64), primary_key=True)  # 'measurements', 'parameter:<id>', 'day:<YYYY-MM-DD>'
+    shard = db.Column(db.SmallInteger, primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+    reconciled_at = db.Column(db.DateTime)  # Set on rows written by reconcile_counters()
+
+# Per-sensor high-water mark of a historical backfill over [range_start, range_end)
+class BackfillCheckpoint(db.Model):
+    __tablename__ = 'backfill_checkpoints'
+    id = db.Column(db.Integer, primary_key=True)
+    sensor_id = db.Column(db.Integer, db.ForeignKey('sensors.id'), nullable=False)
+    range_start = db.Column(db.DateTime, nullable=False)
+    range_end = db.Column(db.DateTime, nullable=False)
+    high_water_mark = db.Column(db.DateTime)  # Everything in [range_start, high_water_mark) is stored
+    rows_written = db.Column(db.Integer, default=0, nullable=False)
+    completed = db.Column(db.Boolean, default=False, nullable=False)
+    updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
+
+    __table_args__ = (
+        db.UniqueConstraint('sensor_id', 'range_start', 'range_end', name='uq_backfill_checkpoints_sensor_range'),
+    )
+
+# Adaptive polling (OPENAQ_INGEST_MODE=adaptive): learned reporting interval and next due time per location
+class LocationPollState(db.Model):
+    __tablename__ = 'location_poll_state'
+    location_id = db.Column(db.Integer, db.ForeignKey('locations.id'), primary_key=True)
+    interval_seconds = db.Column(db.Integer, nullable=False)  # EWMA of the gaps between new readings
+    next_due_at = db.Column(db.DateTime, nullable=False, index=True)
+    last_observed_at = db.Column(db.DateTime)  # Newest reading seen for the location
+    last_polled_at = db.Column(db.DateTime)
+    idle_polls = db.Column(db.Integer, default=0, nullable=False)  # Polls in a row without new data
+
+# Oldest/newest reading and reading count per sensor and per location (app/summaries.py),
+# maintained by the ingestion writer so data-range lookups never aggregate measurements
+class SensorDataSummary(db.Model):
+    __tablename__ = 'sensor_data_summary'
+    sensor_id = db.Column(db.Integer, db.ForeignKey('sensors.id'), primary_key=True)
+    oldest = db.Column(db.DateTime, nullable=False)
+    newest = db.Column(db.DateTime, nullable=False)
+    count = db.Column(db.BigInteger, nullable=False)
+
+class LocationDataSummary(db.Model):
+    __tablename__ = 'location_data_summary'
+    location_id = db.Column(db.Integer, db.ForeignKey('locations.id'), primary_key=True)
+    oldest = db.Column(db.DateTime, nullable=False, index=True)  # Ranking by oldest data
+    newest = db.Column(db.DateTime, nullable=False)
+    count = db.Column(db.BigInteger, nullable=False)
 
+    location = db.relationship('Location', lazy='select')
@@ -0,0 +1,163 @@
+import re
+from datetime import datetime
+from app.database import db
+
+# measurements is range partitioned by month on timestamp (see partition_measurements.py)
+PARENT_TABLE = 'measurements'
+DEFAULT_PARTITION = 'measurements_default'  # Catches rows no monthly partition covers yet
+PARTITION_NAME = re.compile(r'^measurements_y(\d{4})m(\d{2})$')
+
+def month_start(moment):
+    return datetime(moment.year, moment.month, 1)
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+def partition_name(month):
+    return f"{PARENT_TABLE}_y{month:%Y}m{month:%m}"
+
+# `parent` below is only ever another table while partition_measurements.py builds the
+# partitioned table next to the live one; partitions keep their measurements_* names.
+
+def is_partitioned(parent=PARENT_TABLE):
+    """True once measurements has been converted to a partitioned table"""
+    return db.session.execute(db.text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = :name AND pg_table_is_visible(c.oid))"
+    ), {'name': parent}).scalar()
+
+def list_partitions(parent=PARENT_TABLE):
+    """Attached partitions with their month (None for the default), estimated rows, size and tablespace"""
+    rows = db.session.execute(db.text(
+        "SELECT c.relname, c.reltuples::bigint, pg_total_relation_size(c.oid), t.spcname "
+        "FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "LEFT JOIN pg_tablespace t ON t.oid = c.reltablespace "
+        "WHERE p.relname = :name AND pg_table_is_visible(p.oid) "
+        "ORDER BY c.relname"
+    ), {'name': parent}).all()
+
+    partitions = []
+    for name, rows_estimate, size, tablespace in rows:
+        match = PARTITION_NAME.match(name)
+        partitions.append({
+            'name': name,
+            'month': datetime(int(match.group(1)), int(match.group(2)), 1) if match else None,
+            'rows_estimate': max(rows_estimate, 0),  # -1 = never analyzed
+            'bytes': size,
+            'tablespace': tablespace or 'default'
+        })
+    return partitions
+
+def ensure_default_partition(parent=PARENT_TABLE):
+    db.session.execute(db.text(
+        f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {parent} DEFAULT"
+    ))
+    db.session.commit()
+
+def create_month_partition(month, parent=PARENT_TABLE):
+    """Create the partition for one month, moving any rows the default partition holds for it
+
+    A month can't be attached while the default partition has rows inside its
+    range, so those are moved within the same transaction (concurrent writers
+    wait on the lock instead of failing).
+    """
+    lower, upper = month, add_months(month, 1)
+    name = partition_name(month)
+    bounds = {'lower': lower, 'upper': upper}
+
+    try:
+        stranded = db.session.execute(db.text(
+            f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE timestamp >= :lower AND timestamp < :upper)"
+        ), bounds).scalar()
+
+        if stranded:
+            db.session.execute(db.text(f"ALTER TABLE {parent} DETACH PARTITION {DEFAULT_PARTITION}"))
+
+        db.session.execute(db.text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {parent} "
+            f"FOR VALUES FROM ('{lower:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')"
+        ))
+
+        moved = 0
+        if stranded:
+            moved = db.session.execute(db.text(
+                f"INSERT INTO {parent} (id, sensor_id, value, timestamp) "
+                f"SELECT id, sensor_id, value, timestamp FROM {DEFAULT_PARTITION} "
+                f"WHERE timestamp >= :lower AND timestamp < :upper"
+            ), bounds).rowcount
+            db.session.execute(db.text(
+                f"DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= :lower AND timestamp < :upper"
+            ), bounds)
+            db.session.execute(db.text(
+                f"ALTER TABLE {parent} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"
+            ))
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return moved
+
+def ensure_partitions(start=None, end=None, months_ahead=3, parent=PARENT_TABLE):
+    """Make sure monthly partitions exist from `start` through `end` plus `months_ahead`
+
+    Defaults to the current month. A no-op (returns []) while measurements is not
+    partitioned yet. Returns the names of the partitions created.
+    """
+    if not is_partitioned(parent):
+        return []
+
+    now = datetime.utcnow()
+    month = month_start(start or now)
+    last = add_months(month_start(end or now), months_ahead)
+
+    ensure_default_partition(parent)
+    existing = {partition['name'] for partition in list_partitions(parent)}
+
+    created = []
+    while month <= last:
+        if partition_name(month) not in existing:
+            create_month_partition(month, parent)
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+def archive_partitions(before, tablespace=None, detach=True, drop=False):
+    """Archive whole months that end on or before `before` - no row-by-row DELETE
+
+    detach: remove the month from measurements (the table stays, e.g. for pg_dump)
+    tablespace: move the month's table to cheaper storage (attached or detached)
+    drop: drop the detached table
+    Returns [(partition name, action)] in month order.
+    """
+    cutoff = month_start(before)
+    quoted_tablespace = db.engine.dialect.identifier_preparer.quote(tablespace) if tablespace else None
+    actions = []
+
+    for partition in list_partitions():
+        month = partition['month']
+        if month is None or add_months(month, 1) > cutoff:
+            continue
+
+        name = partition['name']
+        try:
+            if detach or drop:
+                db.session.execute(db.text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+            if drop:
+                db.session.execute(db.text(f"DROP TABLE {name}"))
+                actions.append((name, 'dropped'))
+            elif quoted_tablespace:
+                db.session.execute(db.text(f"ALTER TABLE {name} SET TABLESPACE {quoted_tablespace}"))
+                actions.append((name, f"{'detached and ' if detach else ''}moved to {tablespace}"))
+            elif detach:
+                actions.append((name, 'detached'))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    return actions
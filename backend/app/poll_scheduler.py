@@ -0,0 +1,196 @@
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, distinct
+from sqlalchemy.dialects.postgresql import insert
+from app.database import db
+from app.models import Location, Sensor, Measurement, LocationPollState
+from app.ingest import parse_measurement_timestamp, INSERT_CHUNK_SIZE
+
+EWMA_ALPHA = 0.3  # Weight of the newest observed gap in the learned interval
+PROBE_SHRINK = 0.75  # A gap no longer than the interval only bounds the cadence - learn from a shorter one
+HISTORY_DAYS = 14  # Measurement history used to guess the interval of a new location
+DORMANT_AFTER = timedelta(days=30)  # No reading for this long = back off from the first poll
+DORMANT_IDLE_POLLS = 3
+LEASE = timedelta(minutes=30)  # Dispatched but not yet reported back - don't hand out again before this
+
+class PollPolicy:
+    """Interval limits for the adaptive scheduler, from the POLL_* config"""
+
+    def __init__(self, min_interval=900, max_interval=7 * 86400, default_interval=3600):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.default_interval = default_interval
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            min_interval=config['POLL_MIN_INTERVAL_SECONDS'],
+            max_interval=config['POLL_MAX_INTERVAL_SECONDS'],
+            default_interval=config['POLL_DEFAULT_INTERVAL_SECONDS']
+        )
+
+    def clamp(self, seconds):
+        return int(min(self.max_interval, max(self.min_interval, seconds)))
+
+    def observe(self, state, newest_reading, now):
+        """Update a poll state after a poll that saw `newest_reading` (None = nothing)
+
+        New data: fold the gap since the previous reading into the EWMA interval and
+        come back when the next reading is expected. The gap between the newest
+        readings of two polls is never shorter than the poll spacing, so a gap
+        that is not longer than the interval says "reports at least this often",
+        not how often: it is learned as PROBE_SHRINK * gap, which pulls the next
+        poll in before the expected reading. Once polls come faster than the
+        station reports, gaps are the station's real cadence (reading times, not
+        poll times) and the interval settles there.
+
+        No new data: poll again after one interval, then back off exponentially
+        (interval * 2^(idle_polls - 1)), capped at max_interval.
+        """
+        state.last_polled_at = now
+
+        if newest_reading is not None and (state.last_observed_at is None or newest_reading > state.last_observed_at):
+            if state.last_observed_at is not None:
+                gap = (newest_reading - state.last_observed_at).total_seconds()
+                sample = gap * PROBE_SHRINK if gap <= state.interval_seconds else gap
+                state.interval_seconds = self.clamp(EWMA_ALPHA * sample + (1 - EWMA_ALPHA) * state.interval_seconds)
+            state.last_observed_at = newest_reading
+            state.idle_polls = 0
+            expected = newest_reading + timedelta(seconds=state.interval_seconds)
+            state.next_due_at = max(expected, now + timedelta(seconds=self.min_interval))
+        else:
+            state.idle_polls += 1
+            backoff = min(self.max_interval, state.interval_seconds * 2 ** min(state.idle_polls - 1, 20))
+            state.next_due_at = now + timedelta(seconds=self.clamp(backoff))
+
+def newest_reading_time(measurements):
+    """Newest timestamp in a /latest response (None if there is none)"""
+    newest = None
+    for measurement in measurements:
+        try:
+            timestamp = parse_measurement_timestamp(measurement)
+        except (KeyError, TypeError, ValueError):
+            continue
+        if timestamp is not None and (newest is None or timestamp > newest):
+            newest = timestamp
+    return newest
+
+def ensure_poll_states(policy, now=None):
+    """Create poll states for locations that have none, learning intervals from stored history
+
+    The first guess is the average gap between distinct reading times over the
+    last HISTORY_DAYS, at most default_interval: that history was sampled at the
+    old fixed poll spacing, so it only bounds the cadence from above and
+    observe() corrects it either way. Locations silent for DORMANT_AFTER start
+    backed off.
+    Returns the number of states created.
+    """
+    now = now or datetime.utcnow()
+    missing = select(Location.id).where(
+        ~select(LocationPollState.location_id).where(LocationPollState.location_id == Location.id).exists()
+    )
+    location_ids = [location_id for (location_id,) in db.session.execute(missing).all()]
+    if not location_ids:
+        return 0
+
+    last_observed = dict(db.session.execute(
+        select(Sensor.location_id, func.max(Sensor.last_updated))
+        .where(Sensor.location_id.in_(location_ids))
+        .group_by(Sensor.location_id)
+    ).all())
+
+    history = db.session.execute(
+        select(
+            Sensor.location_id,
+            func.min(Measurement.timestamp),
+            func.max(Measurement.timestamp),
+            func.count(distinct(Measurement.timestamp))
+        )
+        .join(Measurement, Measurement.sensor_id == Sensor.id)
+        .where(Sensor.location_id.in_(location_ids), Measurement.timestamp >= now - timedelta(days=HISTORY_DAYS))
+        .group_by(Sensor.location_id)
+    ).all()
+    learned = {
+        location_id: (newest - oldest).total_seconds() / (readings - 1)
+        for location_id, oldest, newest, readings in history if readings > 1
+    }
+
+    rows = []
+    for location_id in location_ids:
+        observed = last_observed.get(location_id)
+        dormant = observed is None or now - observed > DORMANT_AFTER
+        rows.append({
+            'location_id': location_id,
+            'interval_seconds': policy.clamp(min(learned.get(location_id, policy.default_interval), policy.default_interval)),
+            'next_due_at': now,  # Everyone is polled once, dormant ones then back off quickly
+            'last_observed_at': observed,
+            'idle_polls': DORMANT_IDLE_POLLS if dormant else 0
+        })
+
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        db.session.execute(
+            insert(LocationPollState.__table__).values(rows[start:start + INSERT_CHUNK_SIZE]).on_conflict_do_nothing()
+        )
+    db.session.commit()
+    return len(rows)
+
+def claim_due_locations(limit, now=None):
+    """Take up to `limit` due locations, most overdue first, and lease them
+
+    Leasing pushes next_due_at out by LEASE so the next dispatch does not hand the
+    same locations out again while their batch is still running; the batch's
+    record_polls() sets the real next due time. SKIP LOCKED keeps concurrent
+    dispatchers apart. Returns our location ids.
+    """
+    now = now or datetime.utcnow()
+    states = db.session.execute(
+        select(LocationPollState)
+        .where(LocationPollState.next_due_at <= now)
+        .order_by(LocationPollState.next_due_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+
+    for state in states:
+        state.next_due_at = now + LEASE
+    db.session.commit()
+    return [state.location_id for state in states]
+
+def record_polls(policy, newest_by_location, now=None):
+    """Feed poll outcomes ({our location id: newest reading or None}) back into the schedule"""
+    if not newest_by_location:
+        return 0
+    now = now or datetime.utcnow()
+    states = LocationPollState.query.filter(LocationPollState.location_id.in_(list(newest_by_location))).all()
+    for state in states:
+        policy.observe(state, newest_by_location[state.location_id], now)
+    db.session.commit()
+    return len(states)
+
+def poll_summary(policy, now=None):
+    """How the schedule looks: due now, interval buckets, backed-off locations, expected calls/day"""
+    now = now or datetime.utcnow()
+    states = db.session.execute(
+        select(LocationPollState.interval_seconds, LocationPollState.idle_polls, LocationPollState.next_due_at)
+    ).all()
+
+    buckets = {'<=1h': 0, '<=6h': 0, '<=1d': 0, '>1d': 0}
+    calls_per_day = 0.0
+    for interval, idle_polls, _ in states:
+        effective = policy.clamp(interval * 2 ** min(max(idle_polls - 1, 0), 20))
+        calls_per_day += 86400 / effective
+        if effective <= 3600:
+            buckets['<=1h'] += 1
+        elif effective <= 6 * 3600:
+            buckets['<=6h'] += 1
+        elif effective <= 86400:
+            buckets['<=1d'] += 1
+        else:
+            buckets['>1d'] += 1
+
+    return {
+        'locations': len(states),
+        'due_now': sum(1 for _, _, next_due_at in states if next_due_at <= now),
+        'backed_off': sum(1 for _, idle_polls, _ in states if idle_polls > 0),
+        'intervals': buckets,
+        'expected_calls_per_day': round(calls_per_day)
+    }
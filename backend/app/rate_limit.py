@@ -0,0 +1,173 @@
+import time
+import redis
+from celery.utils.log import get_task_logger
+
+logger = get_task_logger(__name__)
+
+class RateLimitExceeded(Exception):
+    """The shared OpenAQ budget is exhausted - retry the work after `retry_after` seconds"""
+
+    def __init__(self, retry_after):
+        self.retry_after = max(1, int(retry_after + 0.999))
+        super().__init__(f"OpenAQ rate limit reached, retry in {self.retry_after}s")
+
+# Refill the bucket from the Redis clock and take `requested` tokens if available.
+# Returns the number of seconds to wait (0 when the tokens were granted).
+ACQUIRE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated', 'blocked_until')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+local blocked_until = tonumber(state[3]) or 0
+
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+
+local wait = 0
+if blocked_until > now then
+    wait = blocked_until - now
+elseif tokens < requested then
+    wait = (requested - tokens) / rate
+else
+    tokens = tokens - requested
+    redis.call('HINCRBY', KEYS[2], 'tokens_consumed', requested)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(wait)
+"""
+
+# Clamp the bucket to what the API says is left for this key and, when it says
+# nothing is left, block everyone until the window resets.
+OBSERVE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local remaining = tonumber(ARGV[1])
+local reset = tonumber(ARGV[2])
+
+if remaining then
+    local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+    if tokens == nil or tokens > remaining then
+        redis.call('HSET', KEYS[1], 'tokens', remaining, 'updated', now)
+    end
+end
+
+if reset and (remaining == nil or remaining <= 0) then
+    local blocked_until = tonumber(redis.call('HGET', KEYS[1], 'blocked_until')) or 0
+    if now + reset > blocked_until then
+        redis.call('HSET', KEYS[1], 'blocked_until', now + reset)
+    end
+end
+
+redis.call('EXPIRE', KEYS[1], 3600)
+return 1
+"""
+
+class RedisTokenBucket:
+    """Cluster-wide token bucket for the OpenAQ API key, stored in Redis
+
+    Every worker process and thread draws from the same bucket, so N workers share
+    one budget instead of each assuming its own 60 requests/minute. Short waits are
+    slept off; anything longer raises RateLimitExceeded so the Celery task can be
+    retried later instead of blocking a worker slot.
+    """
+
+    def __init__(self, redis_url, key='openaq', per_minute=60, burst=10, max_wait=5.0):
+        self.redis = redis.Redis.from_url(redis_url)
+        self.bucket_key = f"ratelimit:{key}:bucket"
+        self.metrics_key = f"ratelimit:{key}:metrics"
+        self.capacity = burst
+        self.refill_per_second = per_minute / 60.0
+        self.max_wait = max_wait
+        self._acquire = self.redis.register_script(ACQUIRE_SCRIPT)
+        self._observe = self.redis.register_script(OBSERVE_SCRIPT)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config['REDIS_URL'],
+            per_minute=config['OPENAQ_RATE_LIMIT_PER_MINUTE'],
+            burst=config['OPENAQ_RATE_LIMIT_BURST'],
+            max_wait=config['OPENAQ_RATE_LIMIT_MAX_WAIT']
+        )
+
+    def acquire(self, tokens=1, max_wait=None):
+        """Take tokens from the shared bucket
+
+        Sleeps while the total wait stays under `max_wait` seconds (None = the
+        configured default, float('inf') = block like a script would), otherwise
+        raises RateLimitExceeded with the time until tokens are available.
+        Returns the seconds spent waiting.
+        """
+        max_wait = self.max_wait if max_wait is None else max_wait
+        waited = 0.0
+
+        while True:
+            try:
+                wait = float(self._acquire(
+                    keys=[self.bucket_key, self.metrics_key],
+                    args=[self.capacity, self.refill_per_second, tokens]
+                ))
+            except redis.exceptions.RedisError as e:
+                # Fail open - the API's own 429 handling still protects us
+                logger.warning(f"Rate limiter unavailable, continuing without it: {e}")
+                return waited
+
+            if wait <= 0:
+                if waited:
+                    self._record('wait_seconds', waited)
+                return waited
+
+            if waited + wait > max_wait:
+                self._record('wait_seconds', waited)
+                self._record('deferred', 1)
+                self._record('deferred_seconds', wait)
+                raise RateLimitExceeded(wait)
+
+            logger.info(f"Rate limit wait: {wait:.1f}s")
+            time.sleep(wait)
+            waited += wait
+
+    def observe(self, headers):
+        """Sync the bucket with the x-ratelimit-remaining/x-ratelimit-reset response headers"""
+        remaining = headers.get('x-ratelimit-remaining')
+        reset = headers.get('x-ratelimit-reset')
+        if remaining is None and reset is None:
+            return
+        try:
+            self._observe(
+                keys=[self.bucket_key],
+                args=[remaining if remaining is not None else '', reset if reset is not None else '']
+            )
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Could not update rate limiter from headers: {e}")
+
+    def block_for(self, seconds):
+        """Stop every worker from calling the API for `seconds` (after a 429)"""
+        self._record('rate_limited', 1)
+        try:
+            self._observe(keys=[self.bucket_key], args=[0, seconds])
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Could not update rate limiter after 429: {e}")
+
+    def metrics(self):
+        """Counters since the last reset: tokens consumed, time waited, deferrals and 429s"""
+        raw = self.redis.hgetall(self.metrics_key)
+        metrics = {key.decode(): float(value) for key, value in raw.items()}
+        for name in ('tokens_consumed', 'wait_seconds', 'deferred', 'deferred_seconds', 'rate_limited'):
+            metrics.setdefault(name, 0.0)
+        return metrics
+
+    def reset_metrics(self):
+        self.redis.delete(self.metrics_key)
+
+    def _record(self, name, amount):
+        try:
+            self.redis.hincrbyfloat(self.metrics_key, name, amount)
+        except redis.exceptions.RedisError:
+            pass
@@ -0,0 +1,126 @@
+import time
+from datetime import datetime, timedelta
+from celery.utils.log import get_task_logger
+from app.database import db
+from app.partitions import is_partitioned, list_partitions, month_start, add_months, PARENT_TABLE, DEFAULT_PARTITION
+from app.rollups import rebuild_rollups
+
+logger = get_task_logger(__name__)
+
+DELETE_BATCH_ROWS = 10000  # Unpartitioned tables: rows per DELETE statement
+
+def retention_cutoff(config, now=None):
+    """Start of the oldest month whose raw readings are kept (None = keep everything)
+
+    Raw rows are only ever removed a whole month at a time, so the boundary is a
+    month start at least RAW_RETENTION_DAYS in the past. Older readings are read
+    from the hourly rollups.
+    """
+    days = config.get('RAW_RETENTION_DAYS')
+    if not days:
+        return None
+    return month_start((now or datetime.utcnow()) - timedelta(days=days))
+
+def expired_months(cutoff):
+    """Months before `cutoff` that still hold raw rows: [{month, rows, bytes, partition}]
+
+    Rows/bytes come from the catalog for monthly partitions (estimates) and from
+    a count plus the table's average row size otherwise - the unpartitioned
+    table, or the default partition, which holds rows of months that have no
+    partition of their own (partition=None: compacted with batched DELETEs).
+    """
+    if not is_partitioned():
+        return counted_months(PARENT_TABLE, cutoff)
+
+    months = []
+    for partition in list_partitions():
+        if partition['month'] is None:
+            if partition['name'] == DEFAULT_PARTITION:
+                months.extend(counted_months(DEFAULT_PARTITION, cutoff))
+        elif partition['month'] < cutoff:
+            months.append({
+                'month': partition['month'],
+                'rows': partition['rows_estimate'],
+                'bytes': partition['bytes'],
+                'partition': partition['name']
+            })
+    return sorted(months, key=lambda expired: expired['month'])
+
+def counted_months(table, cutoff):
+    """Months before `cutoff` with raw rows in `table`, counted (bytes from its average row size)"""
+    row_bytes = db.session.execute(db.text(
+        f"SELECT pg_total_relation_size('{table}') / GREATEST(reltuples, 1) FROM pg_class WHERE relname = '{table}'"
+    )).scalar() or 0
+    counts = db.session.execute(db.text(
+        f"SELECT date_trunc('month', timestamp) AS month, count(*) FROM {table} "
+        f"WHERE timestamp < :cutoff GROUP BY 1 ORDER BY 1"
+    ), {'cutoff': cutoff}).all()
+    return [
+        {'month': month, 'rows': rows, 'bytes': int(rows * row_bytes), 'partition': None}
+        for month, rows in counts
+    ]
+
+def compact_month(month, partition=None, pause_seconds=0.0):
+    """Make sure the month is fully rolled up, then remove its raw rows
+
+    Partitions are detached and dropped (no row-by-row delete); an unpartitioned
+    table, or a month in the default partition, is deleted from in
+    DELETE_BATCH_ROWS batches with a pause in between.
+    Returns the number of raw rows removed.
+    """
+    end = add_months(month, 1)
+    rebuild_rollups(month, end, cutoff=end)  # A half-compacted month must not shrink its buckets
+
+    if partition:
+        rows = db.session.execute(db.text(f"SELECT count(*) FROM {partition}")).scalar()
+        try:
+            db.session.execute(db.text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {partition}"))
+            db.session.execute(db.text(f"DROP TABLE {partition}"))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return rows
+
+    removed = 0
+    while True:
+        try:
+            deleted = db.session.execute(db.text(
+                # The outer range lets a partitioned table prune to the partition holding the month
+                f"DELETE FROM {PARENT_TABLE} WHERE timestamp >= :start AND timestamp < :end AND id IN ("
+                f"SELECT id FROM {PARENT_TABLE} WHERE timestamp >= :start AND timestamp < :end LIMIT {DELETE_BATCH_ROWS})"
+            ), {'start': month, 'end': end}).rowcount
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        removed += deleted
+        if deleted < DELETE_BATCH_ROWS:
+            return removed
+        if pause_seconds:
+            time.sleep(pause_seconds)
+
+def apply_retention(config, max_months=None, pause_seconds=0.0, now=None):
+    """Compact up to `max_months` expired months, oldest first; returns what was done"""
+    cutoff = retention_cutoff(config, now)
+    if cutoff is None:
+        return {'status': 'disabled'}
+
+    months = expired_months(cutoff)
+    if max_months is not None:
+        months = months[:max_months]
+
+    compacted = []
+    for expired in months:
+        started = time.time()
+        rows = compact_month(expired['month'], expired['partition'], pause_seconds)
+        compacted.append({'month': expired['month'].strftime('%Y-%m'), 'rows': rows, 'bytes': expired['bytes']})
+        logger.info(f"Retention: compacted {expired['month']:%Y-%m} ({rows} raw rows) in {time.time() - started:.1f}s")
+
+    return {
+        'status': 'success',
+        'cutoff': cutoff.isoformat(),
+        'months': compacted,
+        'rows_removed': sum(month['rows'] for month in compacted),
+        'bytes_reclaimed': sum(month['bytes'] for month in compacted)
+    }
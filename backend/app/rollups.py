@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from app.database import db
+from app.models import MeasurementHourly, MeasurementDaily
+
+# Rows per upsert statement (6 bind params per row)
+ROLLUP_CHUNK_SIZE = 1000
+
+ROLLUP_MODELS = {
+    'hour': MeasurementHourly,
+    'day': MeasurementDaily
+}
+
+def bucket_start(timestamp, resolution):
+    if resolution == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def apply_rollups(rows):
+    """Fold newly inserted (sensor_id, timestamp, value) rows into the hourly and daily rollups
+
+    Must only see rows that were actually inserted (duplicates would be counted
+    twice), in the writer's transaction. Each touched bucket is one upsert row:
+    min/max merge with least/greatest, sum and count add up. Returns the number
+    of buckets touched.
+    """
+    touched = 0
+    for resolution, model in ROLLUP_MODELS.items():
+        buckets = {}
+        for sensor_id, timestamp, value in rows:
+            key = (sensor_id, bucket_start(timestamp, resolution))
+            current = buckets.get(key)
+            if current is None:
+                buckets[key] = [value, value, value, 1]
+            else:
+                current[0] = min(current[0], value)
+                current[1] = max(current[1], value)
+                current[2] += value
+                current[3] += 1
+
+        # Sorted so concurrent writers lock buckets in the same order
+        upserts = [
+            {'sensor_id': sensor_id, 'bucket': bucket, 'min_value': low, 'max_value': high, 'sum_value': total, 'count': count}
+            for (sensor_id, bucket), (low, high, total, count) in sorted(buckets.items())
+        ]
+        table = model.__table__
+        for start in range(0, len(upserts), ROLLUP_CHUNK_SIZE):
+            stmt = insert(table).values(upserts[start:start + ROLLUP_CHUNK_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['sensor_id', 'bucket'],
+                set_={
+                    'min_value': func.least(table.c.min_value, stmt.excluded.min_value),
+                    'max_value': func.greatest(table.c.max_value, stmt.excluded.max_value),
+                    'sum_value': table.c.sum_value + stmt.excluded.sum_value,
+                    'count': table.c.count + stmt.excluded.count
+                }
+            )
+            db.session.execute(stmt)
+        touched += len(upserts)
+    return touched
+
+def rebuild_rollups(since, until, cutoff=None):
+    """Recompute both rollups from raw measurements for whole days in [since, until)
+
+    For data written outside the ingestion writer (migrations, manual fixes).
+    Works a month at a time, each month in its own transaction. Only the
+    (sensor, bucket) pairs that have raw rows are rewritten - buckets without
+    raw rows may be all that is left after retention compacted them, so they
+    are never deleted. In months before the retention `cutoff` raw rows can be
+    incomplete (a compaction interrupted half way), so there a bucket is only
+    replaced when raw holds at least as many readings as it does. Returns
+    {resolution: buckets written}.
+    """
+    start = bucket_start(since, 'day')
+    end = bucket_start(until, 'day')
+    if end < until:
+        end += timedelta(days=1)
+
+    written = {resolution: 0 for resolution in ROLLUP_MODELS}
+    while start < end:
+        chunk_end = min(end, datetime(start.year + start.month // 12, start.month % 12 + 1, 1))
+        bounds = {'start': start, 'end': chunk_end}
+        compacted = cutoff is not None and start < cutoff
+        try:
+            for resolution, model in ROLLUP_MODELS.items():
+                table = model.__tablename__
+                guard = f" WHERE {table}.count <= EXCLUDED.count" if compacted else ""
+                written[resolution] += db.session.execute(db.text(
+                    f"INSERT INTO {table} (sensor_id, bucket, min_value, max_value, sum_value, count) "
+                    f"SELECT sensor_id, date_trunc('{resolution}', timestamp), min(value), max(value), sum(value), count(*) "
+                    f"FROM measurements WHERE timestamp >= :start AND timestamp < :end "
+                    f"GROUP BY 1, 2 "
+                    f"ON CONFLICT (sensor_id, bucket) DO UPDATE SET "
+                    f"min_value = EXCLUDED.min_value, max_value = EXCLUDED.max_value, "
+                    f"sum_value = EXCLUDED.sum_value, count = EXCLUDED.count{guard}"
+                ), bounds).rowcount
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        start = chunk_end
+    return written
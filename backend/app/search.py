@@ -0,0 +1,126 @@
+import heapq
+import math
+import re
+import unicodedata
+from collections import defaultdict
+from difflib import SequenceMatcher
+import numpy as np
+
+MIN_SIMILARITY = 0.3  # Share of the query's trigrams a candidate must contain
+MIN_SHARED = 2  # ... and at least this many of them - one shared '  n' matches every word starting with n
+MIN_WORD_MATCH = 0.6  # Typo candidates (no literal match) whose words are further off than this are dropped
+RERANK = 30  # Best trigram candidates re-scored word by word
+MAX_CANDIDATES = 1000  # Short prefixes match thousands of names - score only the most similar, shortest ones
+WORD = re.compile(r'[^\W_]+')
+
+def normalize(text):
+    """Lower case words without accents or punctuation, single spaced"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return ' '.join(WORD.findall(text))
+
+def trigrams(normalized, prefix=False):
+    """pg_trgm-style trigrams of every word ('  w', ' wo', 'wor', ..., 'rd ')
+
+    With `prefix` the last word loses its closing trigram, so a half-typed
+    word ('pitts') fully matches the words it starts ('pittsburgh').
+    """
+    words = normalized.split()
+    grams = set()
+    for i, word in enumerate(words):
+        padded = f"  {word}" if prefix and i == len(words) - 1 else f"  {word} "
+        grams.update(padded[j:j + 3] for j in range(len(padded) - 2))
+    return grams
+
+def word_match(query_words, text_words, memo):
+    """Mean over query words of the closest text word (SequenceMatcher ratio)
+
+    The last query word is compared with word prefixes of its length, as it
+    may still be half-typed. Catches typos trigrams miss, like swapped letters
+    near the start of a short word ('huoston'). `memo` caches ratios across
+    the candidates of one query, which share most of their words.
+    """
+    if not query_words or not text_words:
+        return 0.0
+    total = 0.0
+    for i, query_word in enumerate(query_words):
+        last = i == len(query_words) - 1
+        matcher = SequenceMatcher(None, b=query_word)  # b is the side SequenceMatcher preprocesses
+        best = 0.0
+        for word in text_words:
+            key = (i, word)
+            if key not in memo:
+                matcher.set_seq1(word[:len(query_word)] if last else word)
+                # quick_ratio() is a cheap upper bound - skip words that cannot beat the best one
+                memo[key] = matcher.ratio() if matcher.quick_ratio() > best else 0.0
+            best = max(best, memo[key])
+        total += best
+    return total / len(query_words)
+
+class TrigramIndex:
+    """In-memory trigram index over the name and locality of location records
+
+    Postings are NumPy arrays of record positions, and one bincount over the
+    query's postings gives every record's shared-trigram count. A lookup
+    touches only records that share a trigram with the query, never every name.
+    Score = share of the query's trigrams a record contains, plus 1 for an
+    exact name, 0.5 for a name starting with the query and 0.25 for a plain
+    substring match. When no candidate contains the query literally (a typo),
+    the best RERANK candidates also add word_match() and those below
+    MIN_WORD_MATCH are dropped. Ties go to shorter names, then lower ids.
+    """
+
+    def __init__(self, records):
+        self.size = len(records)
+        self.names = [normalize(record['name']) for record in records]
+        self.texts = [
+            f"{name} {normalize(record.get('locality'))}".strip() for name, record in zip(self.names, records)
+        ]
+        postings = defaultdict(list)
+        for position, text in enumerate(self.texts):
+            for gram in trigrams(text):
+                postings[gram].append(position)
+        self.postings = {gram: np.array(positions, dtype=np.int32) for gram, positions in postings.items()}
+        self.name_lengths = np.array([len(name) for name in self.names], dtype=np.float64)
+
+    def search(self, text, limit=10, min_similarity=MIN_SIMILARITY):
+        """[(score, position)] of the best `limit` matches for a (possibly half-typed) query"""
+        query = normalize(text)
+        grams = trigrams(query, prefix=True)
+        lists = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not lists or limit < 1:
+            return []
+
+        shared = np.bincount(np.concatenate(lists), minlength=self.size)
+        similarity = shared / len(grams)
+        # A short query has few trigrams, so a fixed share lets a single shared one through
+        required = max(min(MIN_SHARED, len(grams)), math.ceil(min_similarity * len(grams) - 1e-9))
+        matches = np.flatnonzero(shared >= required)
+        if len(matches) > MAX_CANDIDATES:
+            # Equal similarity goes to the shorter name, which is where exact and prefix matches are
+            preference = similarity[matches] * 1000 - np.minimum(self.name_lengths[matches], 999)
+            matches = matches[np.argpartition(-preference, MAX_CANDIDATES)[:MAX_CANDIDATES]]
+
+        candidates = []
+        literal = False
+        for position in matches.tolist():
+            name = self.names[position]
+            score = float(similarity[position])
+            if name == query:
+                score += 1.0
+            elif name.startswith(query):
+                score += 0.5
+            elif query in self.texts[position]:
+                score += 0.25
+            literal = literal or score > 1.0
+            candidates.append((-score, len(name), position))
+
+        scored = candidates
+        if not literal:
+            query_words, memo = query.split(), {}
+            scored = []
+            for score, length, position in heapq.nsmallest(RERANK, candidates):
+                closeness = word_match(query_words, self.texts[position].split(), memo)
+                if closeness >= MIN_WORD_MATCH:
+                    scored.append((score - closeness, length, position))
+        return [(round(-score, 3), position) for score, _, position in heapq.nsmallest(limit, scored)]
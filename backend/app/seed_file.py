@@ -0,0 +1,168 @@
+import csv
+import io
+import json
+from app.database import db
+from app.ingest import location_fingerprint
+
+# Rows buffered per table before they are streamed to PostgreSQL with COPY
+COPY_BATCH_ROWS = 5000
+
+def iter_json_array(path, chunk_size=65536):
+    """Yield the elements of a top-level JSON array without loading the whole document"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+
+    with open(path, encoding='utf-8') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            buffer += chunk
+            pos = 0
+
+            while True:
+                # Skip whitespace, the opening bracket and separators between elements
+                while pos < len(buffer) and buffer[pos] in ' \t\r\n,[':
+                    if buffer[pos] == '[':
+                        if started:
+                            break
+                        started = True
+                    pos += 1
+                if pos >= len(buffer) or buffer[pos] == ']':
+                    break
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    break  # Element continues in the next chunk
+                if end == len(buffer) and chunk:
+                    break  # A scalar cut at the chunk boundary would decode early
+                yield item
+                pos = end
+
+            buffer = buffer[pos:]
+            if not chunk:
+                if buffer.strip() not in ('', ']'):
+                    raise ValueError(f"Unexpected trailing data in {path}: {buffer[:50]!r}")
+                return
+
+class CopyStager:
+    """Buffer rows as CSV and COPY them into a staging table every COPY_BATCH_ROWS rows"""
+
+    def __init__(self, cursor, table, columns):
+        self.cursor = cursor
+        self.sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.pending = 0
+        self.total = 0
+
+    def add(self, row):
+        self.writer.writerow(row)
+        self.pending += 1
+        if self.pending >= COPY_BATCH_ROWS:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        self.buffer.seek(0)
+        self.cursor.copy_expert(self.sql, self.buffer)
+        self.total += self.pending
+        self.pending = 0
+        self.buffer.seek(0)
+        self.buffer.truncate()
+
+STAGING_TABLES = [
+    """CREATE TEMP TABLE staging_locations (
+        openaq_id integer, name text, locality text, country_code text,
+        latitude numeric(9,6), longitude numeric(9,6), is_mobile boolean, fingerprint text
+    ) ON COMMIT DROP""",
+    "CREATE TEMP TABLE staging_parameters (name text, display_name text, unit text) ON COMMIT DROP",
+    "CREATE TEMP TABLE staging_sensors (openaq_id integer, location_openaq_id integer, parameter_name text) ON COMMIT DROP",
+]
+
+MERGE_PARAMETERS = """
+INSERT INTO parameters (name, display_name, unit)
+SELECT DISTINCT ON (name) name, display_name, unit FROM staging_parameters
+ON CONFLICT (name) DO NOTHING
+"""
+
+MERGE_LOCATIONS = """
+INSERT INTO locations (openaq_id, name, locality, country_code, latitude, longitude, is_mobile, fingerprint, last_updated)
+SELECT DISTINCT ON (openaq_id) openaq_id, name, locality, country_code, latitude, longitude, is_mobile, fingerprint, now()
+FROM staging_locations
+ON CONFLICT (openaq_id) DO UPDATE SET
+    name = EXCLUDED.name,
+    locality = EXCLUDED.locality,
+    latitude = EXCLUDED.latitude,
+    longitude = EXCLUDED.longitude,
+    is_mobile = EXCLUDED.is_mobile,
+    fingerprint = EXCLUDED.fingerprint,
+    last_updated = EXCLUDED.last_updated
+WHERE locations.fingerprint IS DISTINCT FROM EXCLUDED.fingerprint
+"""
+
+MERGE_SENSORS = """
+INSERT INTO sensors (openaq_id, location_id, parameter_id)
+SELECT DISTINCT ON (s.openaq_id) s.openaq_id, l.id, p.id
+FROM staging_sensors s
+JOIN locations l ON l.openaq_id = s.location_openaq_id
+JOIN parameters p ON p.name = s.parameter_name
+ON CONFLICT (openaq_id) DO NOTHING
+"""
+
+def seed_from_file(path):
+    """Seed locations, parameters and sensors from an OpenAQ /locations snapshot
+
+    The file is parsed incrementally and staged through COPY into temp tables,
+    then merged into the real tables with three set-based statements in a single
+    transaction. No network access needed.
+    """
+    cursor = db.session.connection().connection.dbapi_connection.cursor()
+    try:
+        for ddl in STAGING_TABLES:
+            cursor.execute(ddl)
+
+        locations = CopyStager(cursor, 'staging_locations', [
+            'openaq_id', 'name', 'locality', 'country_code', 'latitude', 'longitude', 'is_mobile', 'fingerprint'
+        ])
+        parameters = CopyStager(cursor, 'staging_parameters', ['name', 'display_name', 'unit'])
+        sensors = CopyStager(cursor, 'staging_sensors', ['openaq_id', 'location_openaq_id', 'parameter_name'])
+        seen_parameters = set()
+
+        for loc in iter_json_array(path):
+            locations.add([
+                loc['id'], loc['name'], loc.get('locality'), loc['country']['code'],
+                loc['coordinates']['latitude'], loc['coordinates']['longitude'],
+                loc['isMobile'], location_fingerprint(loc)
+            ])
+            for sensor in loc.get('sensors', []):
+                param = sensor['parameter']
+                if param['name'] not in seen_parameters:
+                    seen_parameters.add(param['name'])
+                    parameters.add([param['name'], param.get('displayName', param['name']), param['units']])
+                sensors.add([sensor['id'], loc['id'], param['name']])
+
+        for stager in (locations, parameters, sensors):
+            stager.flush()
+
+        cursor.execute(MERGE_PARAMETERS)
+        parameters_created = cursor.rowcount
+        cursor.execute(MERGE_LOCATIONS)
+        locations_written = cursor.rowcount
+        cursor.execute(MERGE_SENSORS)
+        sensors_created = cursor.rowcount
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    return {
+        'locations_in_file': locations.total,
+        'sensors_in_file': sensors.total,
+        'parameters_created': parameters_created,
+        'locations_written': locations_written,
+        'sensors_created': sensors_created
+    }
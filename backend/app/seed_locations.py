@@ -6,26 +6,13 @@ from datetime import datetime, timezone, timedelta
 from sqlalchemy.exc import IntegrityError
 from app import create_app
 from app.models import db, Location, Parameter, Sensor, Measurement
+from app.rate_limit import RedisTokenBucket
+from app.partitions import ensure_partitions
 
 app = create_app()
 
-# Rate limit tracking
-class RateLimiter:
-    def __init__(self):
-        self.last_request = time.time()
-        self.remaining = 60  # Start with max free tier limit
-    
-    def wait_if_needed(self):
-        elapsed = time.time() - self.last_request
-        if self.remaining <= 5:  # Leave buffer
-            wait_time = 60 - elapsed  # Reset every minute
-            if wait_time > 0:
-                print(f"Preemptive rate limit wait: {wait_time:.1f}s")
-                time.sleep(wait_time)
-                self.remaining = 60  # Reset counter
-        self.last_request = time.time()
-
-rate_limiter = RateLimiter()
+# Same Redis token bucket as the Celery workers, so seeding never steals their budget
+rate_limiter = RedisTokenBucket.from_config(app.config)
 
 def parse_found_value(found):
     """Handle OpenAQ's 'found' values which can be strings like '>1000'"""
@@ -53,17 +40,16 @@ def process_parameter(param_data):
 
 def fetch_api_data(url, headers, params):
     """Handle requests with rate limiting and retries"""
-    global rate_limiter
     for attempt in range(3):  # Max 3 retries
-        rate_limiter.wait_if_needed()
+        rate_limiter.acquire(max_wait=float('inf'))  # A script can afford to block
         try:
             response = requests.get(url, headers=headers, params=params)
-            rate_limiter.remaining = int(response.headers.get('x-ratelimit-remaining', 60))
+            rate_limiter.observe(response.headers)
             
             if response.status_code == 429:
                 reset = int(response.headers.get('x-ratelimit-reset', 60))
                 print(f"Rate limited. Waiting {reset}s...")
-                time.sleep(reset + 1)
+                rate_limiter.block_for(reset + 1)  # Next acquire() waits out the reset
                 continue
                 
             if response.status_code == 404:
@@ -294,6 +280,7 @@ def fetch_locations(start_page=1, end_page=None, fetch_history_pages=None):
 if __name__ == "__main__":
     with app.app_context():
         db.create_all()
+        ensure_partitions()
     
     # You can customize which pages to process and which to fetch history for
     # For example, to process pages 2-5 with no historical data:
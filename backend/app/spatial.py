@@ -0,0 +1,269 @@
+import heapq
+import math
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+import redis
+from celery.utils.log import get_task_logger
+from app.database import db
+from app.search import TrigramIndex
+
+logger = get_task_logger(__name__)
+
+VERSION_KEY = 'locations:index-version'
+EARTH_RADIUS_KM = 6371.0088  # Mean radius, what haversine distances are computed with
+
+def unit_vector(lat, lon):
+    """Point on the unit sphere for a latitude/longitude in degrees"""
+    phi, lam = math.radians(lat), math.radians(lon)
+    return math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi)
+
+def chord_to_km(chord_squared):
+    """Great-circle (haversine) distance for a squared chord length between unit vectors"""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(chord_squared) / 2))
+
+class SphereTree:
+    """KD-tree over unit vectors - exact k nearest neighbours by great-circle distance
+
+    The straight-line (chord) distance between two points on the sphere grows
+    monotonically with their haversine distance, so a plain 3-D Euclidean
+    KD-tree finds the same neighbours without special cases at the poles or the
+    antimeridian. Leaves hold up to LEAF_SIZE record positions.
+    """
+
+    LEAF_SIZE = 8
+
+    def __init__(self, positions, lat, lon):
+        self.points = {p: unit_vector(lat[p], lon[p]) for p in positions}
+        self.root = self._build(list(positions)) if positions else None
+
+    def _build(self, positions):
+        if len(positions) <= self.LEAF_SIZE:
+            return None, positions
+        points = self.points
+        # Split on the axis with the widest spread, at the median
+        axis = max(range(3), key=lambda a: max(points[p][a] for p in positions) - min(points[p][a] for p in positions))
+        positions.sort(key=lambda p: points[p][axis])
+        middle = len(positions) // 2
+        return axis, points[positions[middle]][axis], self._build(positions[:middle]), self._build(positions[middle:])
+
+    def nearest(self, lat, lon, k, accept=None):
+        """[(distance_km, position)] of the k nearest accepted records, nearest first
+
+        `accept(position)` filters records during the search, so a selective
+        filter still returns k results when that many exist.
+        """
+        if self.root is None or k < 1:
+            return []
+        query = unit_vector(lat, lon)
+        points = self.points
+        best = []  # Max-heap of (-chord², position) holding the k best so far
+
+        def visit(node):
+            if node[0] is None:
+                for p in node[1]:
+                    if accept is not None and not accept(p):
+                        continue
+                    x, y, z = points[p]
+                    d2 = (x - query[0]) ** 2 + (y - query[1]) ** 2 + (z - query[2]) ** 2
+                    if len(best) < k:
+                        heapq.heappush(best, (-d2, p))
+                    elif d2 < -best[0][0]:
+                        heapq.heapreplace(best, (-d2, p))
+                return
+            axis, split, left, right = node
+            diff = query[axis] - split
+            near, far = (left, right) if diff < 0 else (right, left)
+            visit(near)
+            # The far side can only hold closer points if the splitting plane is closer than the k-th best
+            if len(best) < k or diff * diff < -best[0][0]:
+                visit(far)
+
+        visit(self.root)
+        return [(chord_to_km(d2), p) for d2, p in sorted((-neg, p) for neg, p in best)]
+
+class LocationGrid:
+    """Uniform latitude/longitude grid over prebuilt /locations records
+
+    Records are kept sorted by id and every cell lists the positions of its
+    records in ascending order, so a bbox query returns positions in id order -
+    the same order (and therefore the same offset/cursor pages) as the SQL path.
+    Cells completely inside the box are taken whole, only the cells on its edge
+    compare coordinates. The same snapshot carries a SphereTree for nearest-
+    station queries, a TrigramIndex for name search and, per record, when each
+    parameter was last reported.
+    """
+
+    def __init__(self, records, cell_degrees=0.5):
+        self.records = sorted(records, key=lambda record: record['id'])
+        self.ids = [record['id'] for record in self.records]
+        self.lat = [record['latitude'] for record in self.records]
+        self.lon = [record['longitude'] for record in self.records]
+        self.cell_degrees = cell_degrees
+        self.cells = defaultdict(list)  # (row, col) -> record positions
+        for position, (lat, lon) in enumerate(zip(self.lat, self.lon)):
+            if lat is not None and lon is not None:
+                self.cells[self._cell(lat, lon)].append(position)
+        self.cells = dict(self.cells)
+        self.placed = sorted(p for positions in self.cells.values() for p in positions)  # Records with coordinates
+        self.extent = (
+            min(self.lat[p] for p in self.placed), max(self.lat[p] for p in self.placed),
+            min(self.lon[p] for p in self.placed), max(self.lon[p] for p in self.placed)
+        ) if self.placed else None
+        self.tree = SphereTree(self.placed, self.lat, self.lon)
+        self.text_index = TrigramIndex(self.records)
+
+        # Per record: parameter id -> newest sensor reading time (None if it never reported)
+        self.parameter_ids = {}  # name -> id
+        self.reported = []
+        for record in self.records:
+            reported = {}
+            for sensor in record.get('sensors', []):
+                parameter = sensor['parameter']
+                self.parameter_ids[parameter['name']] = parameter['id']
+                updated = datetime.fromisoformat(sensor['last_updated']) if sensor['last_updated'] else None
+                previous = reported.get(parameter['id'])
+                reported[parameter['id']] = max(previous, updated) if previous and updated else previous or updated
+            self.reported.append(reported)
+        self.built_at = time.time()
+
+    def __len__(self):
+        return len(self.records)
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees)
+
+    def query(self, bounds=None):
+        """Positions (ascending, i.e. by location id) of the records inside `bounds`
+
+        `bounds` is parse_bounds() output; None means every record. Like the SQL
+        filter, a box with west > east (crossing the antimeridian) matches nothing.
+        """
+        if bounds is None:
+            return list(range(len(self.records)))
+        south, north, west, east = bounds['south'], bounds['north'], bounds['west'], bounds['east']
+        if south > north or west > east or self.extent is None:
+            return []
+        lat_min, lat_max, lon_min, lon_max = self.extent
+        lat, lon = self.lat, self.lon
+        if south <= lat_min and lat_max <= north and west <= lon_min and lon_max <= east:
+            return list(self.placed)
+
+        row_lo, col_lo = self._cell(south, west)
+        row_hi, col_hi = self._cell(north, east)
+        if (row_hi - row_lo + 1) * (col_hi - col_lo + 1) <= len(self.cells):
+            keys = ((row, col) for row in range(row_lo, row_hi + 1) for col in range(col_lo, col_hi + 1))
+            cells = [(key, self.cells[key]) for key in keys if key in self.cells]
+        else:
+            # Country-sized boxes span more cells than are occupied - walk the occupied ones
+            cells = [
+                (key, positions) for key, positions in self.cells.items()
+                if row_lo <= key[0] <= row_hi and col_lo <= key[1] <= col_hi
+            ]
+        if len(cells) * 4 > len(self.cells):
+            # Most of the map is in view: one pass over the coordinates beats merging cells
+            return [p for p in self.placed if south <= lat[p] <= north and west <= lon[p] <= east]
+
+        size = self.cell_degrees
+        matched = []
+        for (row, col), positions in cells:
+            if south <= row * size and (row + 1) * size <= north and west <= col * size and (col + 1) * size <= east:
+                matched.extend(positions)
+            else:
+                matched.extend(p for p in positions if south <= lat[p] <= north and west <= lon[p] <= east)
+        matched.sort()
+        return matched
+
+    def nearest(self, lat, lon, k, parameter_id=None, since=None):
+        """[(distance_km, position)] of the k closest records, nearest first
+
+        With `parameter_id` only records with a sensor for that parameter count;
+        with `since` only records whose sensor (for that parameter, or any
+        sensor) reported at or after it.
+        """
+        reported = self.reported
+        accept = None
+        if parameter_id is not None and since is not None:
+            accept = lambda p: (reported[p].get(parameter_id) or datetime.min) >= since
+        elif parameter_id is not None:
+            accept = lambda p: parameter_id in reported[p]
+        elif since is not None:
+            accept = lambda p: any(updated and updated >= since for updated in reported[p].values())
+        return self.tree.nearest(lat, lon, k, accept)
+
+class IndexVersion:
+    """Shared counter in Redis, bumped by ingestion whenever locations or latest values changed
+
+    Redis errors are logged and swallowed: a failed bump must not fail the
+    ingestion task, and a failed read just keeps the current grid.
+    """
+
+    def __init__(self, redis_url, key=VERSION_KEY):
+        self.redis = redis.Redis.from_url(redis_url, socket_timeout=2)
+        self.key = key
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config['REDIS_URL'])
+
+    def current(self):
+        try:
+            return self.redis.get(self.key)
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Location index version unavailable: {e}")
+            return None
+
+    def bump(self):
+        try:
+            return self.redis.incr(self.key)
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Could not bump location index version: {e}")
+            return None
+
+class LocationIndex:
+    """Per-process LocationGrid, rebuilt when the shared IndexVersion changes
+
+    get() checks the version at most every SPATIAL_INDEX_CHECK_SECONDS. One
+    thread rebuilds while the others keep answering from the previous grid (the
+    grid is never modified in place, the reference is swapped). get() returns
+    None when the index is disabled or could not be built yet - the caller then
+    falls back to SQL.
+    """
+
+    def __init__(self, loader):
+        self.loader = loader  # () -> list of /locations records, called inside an app context
+        self.grid = None
+        self.built_version = None
+        self.next_check = 0.0
+        self.version = None
+        self._lock = threading.Lock()
+
+    def get(self, config):
+        if not config['SPATIAL_INDEX_ENABLED']:
+            return None
+        if self.grid is not None and time.monotonic() < self.next_check:
+            return self.grid
+        if not self._lock.acquire(blocking=self.grid is None):
+            return self.grid
+        try:
+            if self.grid is not None and time.monotonic() < self.next_check:
+                return self.grid  # Refreshed while we waited for the lock
+            if self.version is None:
+                self.version = IndexVersion.from_config(config)
+            version = self.version.current()
+            if self.grid is None or version != self.built_version:
+                started = time.perf_counter()
+                self.grid = LocationGrid(self.loader(), config['SPATIAL_GRID_CELL_DEGREES'])
+                self.built_version = version
+                logger.info(
+                    f"Location index built: {len(self.grid)} locations, {len(self.grid.cells)} cells "
+                    f"in {(time.perf_counter() - started) * 1000:.0f} ms"
+                )
+        except Exception as e:
+            db.session.rollback()  # Leave the session usable for the SQL fallback
+            logger.error(f"Location index refresh failed: {e}")
+        finally:
+            self.next_check = time.monotonic() + config['SPATIAL_INDEX_CHECK_SECONDS']
+            self._lock.release()
+        return self.grid
@@ -0,0 +1,221 @@
+import json
+import time
+from datetime import datetime
+import redis
+from celery.utils.log import get_task_logger
+from app.ingest import MeasurementBatch
+
+logger = get_task_logger(__name__)
+
+STREAM_KEY = 'ingest:readings'
+WRITER_GROUP = 'ingest-writers'
+READINGS_PER_ENTRY = 500  # Readings packed into one stream entry
+DEAD_LETTER_SUFFIX = ':dead'  # Entries that failed max_deliveries times are parked on <key>:dead
+
+class StreamBatch(MeasurementBatch):
+    """MeasurementBatch that hands its readings to the writer instead of the database
+
+    Used by the fetch tasks when INGEST_WRITE_MODE is 'stream': flush() appends the
+    queued readings to the Redis Stream and returns immediately, the batch writer
+    (drain_reading_stream) does the INSERTs and sensor updates.
+    """
+
+    def __init__(self, stream):
+        super().__init__()
+        self.stream = stream
+
+    def flush(self):
+        stats = {
+            'readings': len(self.readings),
+            'inserted': 0,
+            'skipped': 0,
+            'invalid': self.invalid,
+            'sensors_updated': 0,
+            'rollup_buckets': 0,
+            'queued': 0
+        }
+        if self.readings:
+            stats['queued'] = self.stream.publish(
+                (sensor_id, timestamp, value) for (sensor_id, timestamp), value in self.readings.items()
+            )
+        self.readings = {}
+        self.invalid = 0
+        return stats
+
+class ReadingStream:
+    """Write-behind buffer of raw readings on a Redis Stream, drained by a consumer group
+
+    Producers XADD packed readings; writers XREADGROUP them in large batches, write
+    them with one MeasurementBatch flush and XACK + XDEL only after the commit. An
+    entry whose writer died is claimed by another writer once it has been pending
+    for `claim_idle_ms`; replaying it is safe because inserts skip duplicates. An
+    entry claimed more than `max_deliveries` times keeps failing its batch, so it
+    is moved to the dead-letter stream instead and the rest are written without it.
+    """
+
+    def __init__(self, redis_url, key=STREAM_KEY, group=WRITER_GROUP, max_deliveries=5):
+        self.redis = redis.Redis.from_url(redis_url)
+        self.key = key
+        self.dead_key = key + DEAD_LETTER_SUFFIX
+        self.group = group
+        self.max_deliveries = max_deliveries
+        self._group_ready = False
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config['REDIS_URL'], max_deliveries=config['INGEST_STREAM_MAX_DELIVERIES'])
+
+    def ensure_group(self):
+        if self._group_ready:
+            return
+        try:
+            self.redis.xgroup_create(self.key, self.group, id='0', mkstream=True)
+        except redis.exceptions.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._group_ready = True
+
+    def publish(self, readings):
+        """Append (sensor_id, timestamp, value) tuples; returns how many were queued"""
+        readings = [
+            [sensor_id, timestamp.isoformat(), value] for sensor_id, timestamp, value in readings
+        ]
+        if not readings:
+            return 0
+
+        pipe = self.redis.pipeline(transaction=False)
+        for start in range(0, len(readings), READINGS_PER_ENTRY):
+            pipe.xadd(self.key, {'r': json.dumps(readings[start:start + READINGS_PER_ENTRY])})
+        pipe.execute()
+        return len(readings)
+
+    def drain_once(self, consumer, max_rows=5000, max_seconds=2.0, claim_idle_ms=60000):
+        """Collect up to `max_rows` readings or for `max_seconds`, write them, then acknowledge
+
+        Returns the write statistics plus the number of stream entries handled.
+        Nothing is acknowledged if the write fails, so the entries stay pending
+        and are claimed again - or dead-lettered once they ran out of deliveries.
+        """
+        self.ensure_group()
+        entries, dead = self._claim_stale(consumer, claim_idle_ms)
+        rows = sum(len(readings) for _, readings in entries)
+        claimed = len(entries)
+        deadline = time.monotonic() + max_seconds
+
+        while rows < max_rows:
+            remaining_ms = int((deadline - time.monotonic()) * 1000)
+            if remaining_ms <= 0:
+                break
+            response = self.redis.xreadgroup(
+                self.group, consumer, {self.key: '>'},
+                count=max(1, (max_rows - rows) // READINGS_PER_ENTRY + 1),
+                block=remaining_ms
+            )
+            if not response:
+                break  # Nothing arrived before the deadline
+            for entry_id, fields in response[0][1]:
+                readings = self._decode(entry_id, fields)
+                entries.append((entry_id, readings))
+                rows += len(readings)
+
+        stats = {'entries': len(entries), 'claimed': claimed, 'dead_lettered': dead, 'readings': rows,
+                 'inserted': 0, 'skipped': 0, 'sensors_updated': 0}
+        if not entries:
+            return stats
+
+        batch = MeasurementBatch()
+        for _, readings in entries:
+            for sensor_id, timestamp, value in readings:
+                batch.add_reading(sensor_id, value, datetime.fromisoformat(timestamp))
+        write_stats = batch.flush()  # Commits (or rolls back and raises - nothing acknowledged)
+
+        entry_ids = [entry_id for entry_id, _ in entries]
+        pipe = self.redis.pipeline()
+        pipe.xack(self.key, self.group, *entry_ids)
+        pipe.xdel(self.key, *entry_ids)
+        pipe.execute()
+
+        for key in ('inserted', 'skipped', 'sensors_updated'):
+            stats[key] = write_stats[key]
+        return stats
+
+    def status(self):
+        """Backlog of the stream: entries waiting, pending (read but not acknowledged), consumers"""
+        self.ensure_group()
+        groups = {group['name'].decode(): group for group in self.redis.xinfo_groups(self.key)}
+        group = groups.get(self.group, {})
+        return {
+            'entries': self.redis.xlen(self.key),
+            'pending': group.get('pending', 0),
+            'consumers': group.get('consumers', 0),
+            'lag': group.get('lag'),
+            'dead_letters': self.redis.xlen(self.dead_key)
+        }
+
+    def requeue_dead_letters(self, count=1000):
+        """Move up to `count` dead-lettered entries back onto the stream; returns how many moved
+
+        For after the cause is fixed - a requeued entry starts with a fresh delivery count.
+        """
+        entries = self.redis.xrange(self.dead_key, count=count)
+        if not entries:
+            return 0
+        pipe = self.redis.pipeline()
+        for _, fields in entries:
+            pipe.xadd(self.key, {'r': fields[b'r']})
+        pipe.xdel(self.dead_key, *[entry_id for entry_id, _ in entries])
+        pipe.execute()
+        return len(entries)
+
+    def _claim_stale(self, consumer, claim_idle_ms):
+        """Take over entries another writer read but never acknowledged
+
+        Returns (entries, number dead-lettered). XAUTOCLAIM counts every claim as
+        a delivery; entries past max_deliveries go to the dead-letter stream.
+        """
+        try:
+            response = self.redis.xautoclaim(self.key, self.group, consumer, claim_idle_ms, start_id='0-0', count=100)
+        except redis.exceptions.ResponseError as e:
+            logger.warning(f"Could not claim stale stream entries: {e}")
+            return [], 0
+
+        claimed = [(entry_id, fields) for entry_id, fields in response[1] if fields]  # Deleted meanwhile = empty
+        if not claimed:
+            return [], 0
+        pending = self.redis.xpending_range(
+            self.key, self.group, min=claimed[0][0], max=claimed[-1][0], count=len(claimed), consumername=consumer
+        )
+        deliveries = {entry['message_id']: entry['times_delivered'] for entry in pending}
+
+        entries, dead = [], []
+        for entry_id, fields in claimed:
+            if deliveries.get(entry_id, 0) > self.max_deliveries:
+                dead.append((entry_id, fields, deliveries[entry_id]))
+            else:
+                entries.append((entry_id, self._decode(entry_id, fields)))
+        if dead:
+            self._dead_letter(dead)
+        if entries:
+            logger.warning(f"Claimed {len(entries)} stale stream entries from other writers")
+        return entries, len(dead)
+
+    def _dead_letter(self, dead):
+        """Park (entry_id, fields, deliveries) entries on the dead-letter stream and acknowledge them"""
+        entry_ids = [entry_id for entry_id, _, _ in dead]
+        pipe = self.redis.pipeline()
+        for entry_id, fields, deliveries in dead:
+            pipe.xadd(self.dead_key, {'r': fields.get(b'r', b''), 'source_id': entry_id, 'deliveries': deliveries})
+        pipe.xack(self.key, self.group, *entry_ids)
+        pipe.xdel(self.key, *entry_ids)
+        pipe.execute()
+        logger.error(f"Moved {len(dead)} stream entries that failed {self.max_deliveries} deliveries "
+                     f"to {self.dead_key}: {[entry_id.decode() for entry_id in entry_ids]}")
+
+    @staticmethod
+    def _decode(entry_id, fields):
+        try:
+            return json.loads(fields[b'r'])
+        except (KeyError, ValueError) as e:
+            # Acknowledged with the rest of the batch so it is not redelivered forever
+            logger.error(f"Dropping malformed stream entry {entry_id}: {e}")
+            return []
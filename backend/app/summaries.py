@@ -0,0 +1,95 @@
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from app.database import db
+from app.models import SensorDataSummary, LocationDataSummary
+
+def apply_summaries(rows, sensors):
+    """Fold newly inserted (sensor_id, timestamp, value) rows into the data-range summaries
+
+    `sensors` maps sensor_id -> (location_id, parameter_id). Runs in the writer's
+    transaction with the rollups: oldest/newest merge with least/greatest, counts
+    add up. Returns the number of summary rows touched.
+    """
+    per_sensor = {}
+    for sensor_id, timestamp, _ in rows:
+        current = per_sensor.get(sensor_id)
+        if current is None:
+            per_sensor[sensor_id] = [timestamp, timestamp, 1]
+        else:
+            current[0] = min(current[0], timestamp)
+            current[1] = max(current[1], timestamp)
+            current[2] += 1
+
+    per_location = {}
+    for sensor_id, (oldest, newest, count) in per_sensor.items():
+        location_id = sensors[sensor_id][0]
+        current = per_location.get(location_id)
+        if current is None:
+            per_location[location_id] = [oldest, newest, count]
+        else:
+            current[0] = min(current[0], oldest)
+            current[1] = max(current[1], newest)
+            current[2] += count
+
+    touched = 0
+    for model, key, summaries in (
+        (SensorDataSummary, 'sensor_id', per_sensor),
+        (LocationDataSummary, 'location_id', per_location)
+    ):
+        if not summaries:
+            continue
+        table = model.__table__
+        # Sorted so concurrent writers lock summary rows in the same order
+        stmt = insert(table).values([
+            {key: owner_id, 'oldest': oldest, 'newest': newest, 'count': count}
+            for owner_id, (oldest, newest, count) in sorted(summaries.items())
+        ])
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=[key],
+            set_={
+                'oldest': func.least(table.c.oldest, stmt.excluded.oldest),
+                'newest': func.greatest(table.c.newest, stmt.excluded.newest),
+                'count': table.c.count + stmt.excluded.count
+            }
+        ))
+        touched += len(summaries)
+    return touched
+
+def rebuild_summaries():
+    """Recompute both summaries from scratch; returns (sensor rows, location rows)
+
+    Oldest/newest come from the raw readings (index lookups per sensor), or from
+    the daily rollups where retention already compacted the oldest months
+    (day precision); counts are summed from the daily rollups. Both tables are locked meanwhile, so writers
+    wait instead of having their increments overwritten.
+    """
+    try:
+        db.session.execute(db.text(
+            "LOCK TABLE sensor_data_summary, location_data_summary IN EXCLUSIVE MODE"
+        ))
+        db.session.execute(db.text("DELETE FROM sensor_data_summary"))
+        db.session.execute(db.text("DELETE FROM location_data_summary"))
+        sensor_rows = db.session.execute(db.text(
+            "WITH daily AS ("
+            "  SELECT sensor_id, min(bucket) AS first_day, max(bucket) AS last_day, sum(count) AS count "
+            "  FROM measurements_daily GROUP BY sensor_id"
+            ") "
+            "INSERT INTO sensor_data_summary (sensor_id, oldest, newest, count) "
+            "SELECT daily.sensor_id, "
+            "  CASE WHEN raw.oldest IS NULL OR daily.first_day < date_trunc('day', raw.oldest) "
+            "       THEN daily.first_day ELSE raw.oldest END, "
+            "  COALESCE(raw.newest, daily.last_day), daily.count "
+            "FROM daily CROSS JOIN LATERAL ("
+            "  SELECT min(timestamp) AS oldest, max(timestamp) AS newest FROM measurements m WHERE m.sensor_id = daily.sensor_id"
+            ") raw"
+        )).rowcount
+        location_rows = db.session.execute(db.text(
+            "INSERT INTO location_data_summary (location_id, oldest, newest, count) "
+            "SELECT s.location_id, min(ds.oldest), max(ds.newest), sum(ds.count) "
+            "FROM sensor_data_summary ds JOIN sensors s ON s.id = ds.sensor_id GROUP BY s.location_id"
+        )).rowcount
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return sensor_rows, location_rows
@@ -1,11 +1,24 @@
 import os
 import time
 import re
+import socket
+import threading
 import requests
-from datetime import datetime, timezone, timedelta
-from sqlalchemy.exc import IntegrityError
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from celery import chord, group
+from celery.exceptions import Retry
 from celery.utils.log import get_task_logger
-from app.models import db, Location, Parameter, Sensor, Measurement
+from app.models import db, Location, Parameter, Sensor
+from app.ingest import MeasurementBatch, LookupCache
+from app.rate_limit import RedisTokenBucket, RateLimitExceeded
+from app.stream_buffer import ReadingStream, StreamBatch
+from app.partitions import ensure_partitions
+from app.retention import apply_retention
+from app.counters import reconcile_counters
+from app.summaries import rebuild_summaries
+from app.spatial import IndexVersion
+from app.poll_scheduler import PollPolicy, ensure_poll_states, claim_due_locations, record_polls, newest_reading_time
 from app import create_app
 
 logger = get_task_logger(__name__)
@@ -13,22 +26,36 @@ logger = get_task_logger(__name__)
 # Create app instance for context
 app = create_app()
 
-class RateLimiter:
-    def __init__(self):
-        self.last_request = time.time()
-        self.remaining = 60  # Start with max free tier limit
-    
-    def wait_if_needed(self):
-        elapsed = time.time() - self.last_request
-        if self.remaining <= 5:  # Leave buffer
-            wait_time = 60 - elapsed  # Reset every minute
-            if wait_time > 0:
-                logger.info(f"Preemptive rate limit wait: {wait_time:.1f}s")
-                time.sleep(wait_time)
-                self.remaining = 60  # Reset counter
-        self.last_request = time.time()
-
-rate_limiter = RateLimiter()
+OPENAQ_BASE_URL = app.config['OPENAQ_BASE_URL'].rstrip('/')
+
+# Shared by every worker process and fetch thread - one budget for the API key
+rate_limiter = RedisTokenBucket.from_config(app.config)
+RATE_LIMIT_MAX_RETRIES = 10  # "Retry later" reschedules are cheap, allow more of them than for errors
+
+# Interval limits of the adaptive scheduler (OPENAQ_INGEST_MODE='adaptive')
+poll_policy = PollPolicy.from_config(app.config)
+
+# Write-behind buffer between fetch tasks and the batch writer (INGEST_WRITE_MODE='stream')
+reading_stream = ReadingStream.from_config(app.config)
+
+# Web workers rebuild their in-memory location grid when this changes
+location_index_version = IndexVersion.from_config(app.config)
+
+def new_measurement_batch():
+    """Batch for fetched readings - written inline, or queued for the batch writer in 'stream' mode"""
+    if app.config['INGEST_WRITE_MODE'] == 'stream':
+        return StreamBatch(reading_stream)
+    return MeasurementBatch()
+
+# One keep-alive session per fetch thread (requests.Session is not thread-safe)
+_thread_local = threading.local()
+
+def get_http_session():
+    session = getattr(_thread_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        _thread_local.session = session
+    return session
 
 def parse_found_value(found):
     """Handle OpenAQ's 'found' values which can be strings like '>1000'"""
@@ -37,24 +64,29 @@ def parse_found_value(found):
         return int(match.group()) if match else 0
     return found
 
-def fetch_api_data(url, headers, params):
-    """Handle requests with rate limiting and retries"""
-    global rate_limiter
+def fetch_api_data(url, headers, params, max_wait=None, not_found=None):
+    """Handle requests with rate limiting and retries
+
+    Raises RateLimitExceeded when the shared budget would need a longer wait than
+    `max_wait`, so the calling task can be retried later instead of sleeping.
+    Returns None when the request kept failing, and `not_found` for a 404 -
+    callers that must tell the two apart pass something other than None.
+    """
     for attempt in range(3):  # Max 3 retries
-        rate_limiter.wait_if_needed()
+        rate_limiter.acquire(max_wait=max_wait)
         try:
-            response = requests.get(url, headers=headers, params=params, timeout=30)
-            rate_limiter.remaining = int(response.headers.get('x-ratelimit-remaining', 60))
+            response = get_http_session().get(url, headers=headers, params=params, timeout=30)
+            rate_limiter.observe(response.headers)
             
             if response.status_code == 429:
                 reset = int(response.headers.get('x-ratelimit-reset', 60))
-                logger.warning(f"Rate limited. Waiting {reset}s...")
-                time.sleep(reset + 1)
-                continue
+                logger.warning(f"Rate limited. Pausing all workers for {reset}s...")
+                rate_limiter.block_for(reset + 1)
+                continue  # acquire() now waits or raises RateLimitExceeded
                 
             if response.status_code == 404:
                 logger.warning(f"Resource not found: {url} with params {params}")
-                return None
+                return not_found
                 
             response.raise_for_status()
             return response.json()
@@ -64,98 +96,9 @@ def fetch_api_data(url, headers, params):
             time.sleep(2 ** attempt)  # Exponential backoff
     return None
 
-def process_parameter(param_data):
-    """Upsert parameter with conflict handling"""
-    try:
-        parameter = Parameter.query.filter_by(name=param_data['name']).first()
-        if not parameter:
-            parameter = Parameter(
-                name=param_data['name'],
-                display_name=param_data.get('displayName', param_data['name']),
-                unit=param_data['units']
-            )
-            db.session.add(parameter)
-            db.session.commit()
-        return parameter
-    except IntegrityError:
-        db.session.rollback()
-        return Parameter.query.filter_by(name=param_data['name']).first()
-
-def process_sensor(location, sensor_data):
-    """Upsert sensor with conflict handling"""
-    if location is None:
-        logger.warning(f"Location is None for sensor {sensor_data['id']}")
-        return None
-        
-    parameter = process_parameter(sensor_data['parameter'])
-    
-    try:
-        sensor = Sensor.query.filter_by(openaq_id=sensor_data['id']).first()
-        if not sensor:
-            sensor = Sensor(
-                openaq_id=sensor_data['id'],
-                location_id=location.id,
-                parameter_id=parameter.id
-            )
-            db.session.add(sensor)
-            db.session.commit()
-            logger.info(f"Created new sensor {sensor.id} for {parameter.name} at {location.name}")
-        
-        return sensor
-    except IntegrityError:
-        db.session.rollback()
-        return Sensor.query.filter_by(openaq_id=sensor_data['id']).first()
-
-def update_sensor_with_measurement(sensor, measurement):
-    """Update sensor with latest measurement data AND create measurement record - NO DATE FILTERING"""
-    if sensor is None:
-        return
-        
-    try:
-        # Get datetime from measurement
-        if 'date' in measurement:
-            timestamp = datetime.fromisoformat(measurement['date']['utc'].replace('Z', '+00:00'))
-        elif 'datetime' in measurement:
-            timestamp = datetime.fromisoformat(measurement['datetime']['utc'].replace('Z', '+00:00'))
-        else:
-            logger.warning(f"Unknown timestamp format in measurement: {measurement}")
-            return
-        
-        # NO DATE FILTERING - ACCEPT ALL DATA FROM ANY DATE
-        # Check if measurement already exists
-        existing_measurement = Measurement.query.filter_by(
-            sensor_id=sensor.id,
-            timestamp=timestamp
-        ).first()
-        
-        if not existing_measurement:
-            new_measurement = Measurement(
-                sensor_id=sensor.id,
-                value=float(measurement['value']),
-                timestamp=timestamp
-            )
-            db.session.add(new_measurement)
-            logger.info(f"✅ Created measurement for sensor {sensor.openaq_id}: {measurement['value']} at {timestamp}")
-        
-        # Update sensor's last value if this is newer
-        sensor_last_updated = sensor.last_updated
-        if sensor_last_updated and sensor_last_updated.tzinfo is None:
-            sensor_last_updated = sensor_last_updated.replace(tzinfo=timezone.utc)
-        
-        if not sensor.last_updated or timestamp > sensor_last_updated:
-            sensor.last_value = float(measurement['value'])
-            sensor.last_updated = timestamp
-            logger.info(f"✅ Updated sensor {sensor.openaq_id} last_value to {measurement['value']} at {timestamp}")
-        
-        db.session.commit()
-        
-    except Exception as e:
-        db.session.rollback()
-        logger.error(f"Error updating sensor with measurement: {e}")
-
 def fetch_latest_measurements(location_id):
     """Fetch ONLY latest measurements for a location - NO HISTORICAL DATA"""
-    url = f"https://api.openaq.org/v3/locations/{location_id}/latest"
+    url = f"{OPENAQ_BASE_URL}/locations/{location_id}/latest"
     headers = {'X-API-Key': os.getenv('OPENAQ_API_KEY')}
     
     data = fetch_api_data(url, headers, {})
@@ -165,67 +108,121 @@ def fetch_latest_measurements(location_id):
         
     return data['results']
 
-def process_location(loc_data, fetch_history=False):
-    """Process location with all related data - NO HISTORICAL FETCHING"""
-    # Upsert location
-    try:
-        location = Location.query.filter_by(openaq_id=loc_data['id']).first()
-        if not location:
-            location = Location(
-                openaq_id=loc_data['id'],
-                name=loc_data['name'],
-                locality=loc_data.get('locality'),
-                country_code=loc_data['country']['code'],
-                latitude=loc_data['coordinates']['latitude'],
-                longitude=loc_data['coordinates']['longitude'],
-                is_mobile=loc_data['isMobile']
-            )
-            db.session.add(location)
-            db.session.commit()
-            logger.info(f"Created new location: {location.name}")
-        else:
-            location.name = loc_data['name']
-            location.locality = loc_data.get('locality')
-            location.latitude = loc_data['coordinates']['latitude']
-            location.longitude = loc_data['coordinates']['longitude']
-            location.is_mobile = loc_data['isMobile']
-            location.last_updated = datetime.now(timezone.utc)
-            db.session.commit()
-            logger.info(f"Updated location: {location.name}")
-    except IntegrityError:
-        db.session.rollback()
-        location = Location.query.filter_by(openaq_id=loc_data['id']).first()
+def resolve_openaq_parameter_ids():
+    """Map our parameter names to every matching OpenAQ parameter id (one API call)
+
+    OpenAQ has several ids per name (e.g. o3 in ppm and in µg/m³) while our
+    parameters are unique by name, so one name can expand to several ids.
+    Returns None when the parameter list is unavailable.
+    """
+    data = fetch_api_data(f"{OPENAQ_BASE_URL}/parameters", {'X-API-Key': os.getenv('OPENAQ_API_KEY')}, {'limit': 1000})
+    if not data or 'results' not in data:
+        return None
     
-    if location is None:
-        logger.error(f"Could not create or retrieve location for ID {loc_data['id']}")
-        return
+    our_names = {name for (name,) in db.session.query(Parameter.name).all()}
+    return sorted(param['id'] for param in data['results'] if param.get('name') in our_names)
+
+def fetch_parameter_latest(parameter_id, sensor_index, country_id=155, page_size=1000):
+    """Write the latest value of every sensor for one OpenAQ parameter, a page at a time
+
+    `sensor_index` maps OpenAQ sensor ids to our sensor ids. Returns the write
+    statistics, or None when the endpoint is unavailable. When a later page fails
+    the pages written so far are kept and the statistics say complete=False - in
+    both cases the caller falls back to the per-location path.
+    """
+    url = f"{OPENAQ_BASE_URL}/parameters/{parameter_id}/latest"
+    headers = {'X-API-Key': os.getenv('OPENAQ_API_KEY')}
+    params = {'countries_id': country_id, 'limit': page_size, 'page': 1}
+    stats = {'api_calls': 0, 'readings': 0, 'unknown_sensors': 0, 'inserted': 0, 'skipped': 0, 'sensors_updated': 0, 'queued': 0,
+             'complete': True}
     
-    # Process sensors
-    sensor_map = {}  # Map OpenAQ sensor IDs to our DB sensors
+    while True:
+        data = fetch_api_data(url, headers, params)
+        stats['api_calls'] += 1
+        if not data or 'results' not in data:
+            if params['page'] == 1:
+                return None
+            logger.warning(f"Bulk latest for parameter {parameter_id} failed on page {params['page']}")
+            return dict(stats, complete=False)
+        
+        batch = new_measurement_batch()
+        for measurement in data['results']:
+            sensor_id = sensor_index.get(measurement.get('sensorsId'))
+            if sensor_id is None:
+                stats['unknown_sensors'] += 1  # Not synced yet - picked up after the weekly location sync
+                continue
+            batch.add(sensor_id, measurement)
+        
+        write_stats = batch.flush()
+        for key in ('readings', 'inserted', 'skipped', 'sensors_updated'):
+            stats[key] += write_stats[key]
+        stats['queued'] += write_stats.get('queued', 0)
+        
+        found = parse_found_value(data.get('meta', {}).get('found', 0))
+        if len(data['results']) < page_size or params['page'] * page_size >= found:
+            return stats
+        params['page'] += 1
+
+def fetch_latest_measurements_concurrently(location_ids, max_workers=None):
+    """Fetch latest measurements for many locations with a bounded thread pool
+
+    Keeps up to `max_workers` /latest requests in flight. All threads go through the
+    shared rate limiter, so concurrency only overlaps network latency and never
+    raises the request rate above the API key's budget.
+    Returns ({openaq_location_id: results}, {openaq_location_id: retry_after}) where
+    the second dict holds locations skipped because the budget ran out.
+    """
+    max_workers = max_workers or app.config['OPENAQ_FETCH_CONCURRENCY']
+    results = {}
+    rate_limited = {}
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(fetch_latest_measurements, location_id): location_id
+            for location_id in location_ids
+        }
+        for future in as_completed(futures):
+            location_id = futures[future]
+            try:
+                results[location_id] = future.result()
+            except RateLimitExceeded as e:
+                rate_limited[location_id] = e.retry_after
+            except Exception as e:
+                logger.error(f"Error fetching latest measurements for location {location_id}: {e}")
+                results[location_id] = []
     
-    for sensor_data in loc_data.get('sensors', []):
-        sensor = process_sensor(location, sensor_data)
-        if sensor:
-            sensor_map[sensor_data['id']] = sensor
+    if rate_limited:
+        logger.warning(f"Rate limit reached - deferred {len(rate_limited)}/{len(location_ids)} locations")
     
-    # Fetch ONLY latest measurements for this location - NO HISTORICAL DATA
-    latest_measurements = fetch_latest_measurements(loc_data['id'])
+    return results, rate_limited
+
+def queue_latest_measurements(batch, latest_measurements, sensor_index):
+    """Queue /latest readings on the batch writer; returns how many matched our sensors"""
+    queued = 0
     for measurement in latest_measurements:
-        sensor_id = measurement.get('sensorsId')
-        if sensor_id in sensor_map:
-            update_sensor_with_measurement(sensor_map[sensor_id], measurement)
+        sensor_id = sensor_index.get(measurement.get('sensorsId'))
+        if sensor_id is not None and batch.add(sensor_id, measurement):
+            queued += 1
+    return queued
 
 # Import celery from celery_app after app is created
 from celery_app import celery
 
 @celery.task(bind=True, autoretry_for=(Exception,), retry_kwargs={'max_retries': 2, 'countdown': 300})
-def fetch_locations_page(self, page_number, fetch_history=False):
-    """Fetch and process a single page of locations - NO HISTORICAL DATA"""
+def fetch_locations_page(self, page_number, fetch_history=False, metadata_only=None):
+    """Fetch and process a single page of locations - NO HISTORICAL DATA
+
+    With `metadata_only` (default LOCATION_SYNC_METADATA_ONLY) only new or changed
+    locations and sensors are written and /latest is left to the 2-hourly job.
+    """
+    if metadata_only is None:
+        metadata_only = app.config['LOCATION_SYNC_METADATA_ONLY']
+    
     with app.app_context():
         try:
             logger.info(f"Starting to fetch locations page {page_number}")
             
-            url = "https://api.openaq.org/v3/locations"
+            url = f"{OPENAQ_BASE_URL}/locations"
             headers = {'X-API-Key': os.getenv('OPENAQ_API_KEY')}
             
             params = {
@@ -245,38 +242,62 @@ def fetch_locations_page(self, page_number, fetch_history=False):
                     'locations_processed': 0
                 }
 
-            # Process locations on this page - NO HISTORICAL DATA FETCHING
-            locations_processed = 0
+            # Upsert the page's locations, parameters and sensors in one transaction -
+            # ids come from a preloaded identity map, unchanged fingerprints are skipped
+            lookups = LookupCache.load()
+            location_map = lookups.sync_locations(data['results'])
+            locations_processed = len(location_map)
+            logger.info(f"Page {page_number}: synced {locations_processed} locations, lookups {lookups.stats()}")
             
-            for loc in data['results']:
-                try:
-                    process_location(loc, fetch_history=False)  # NEVER fetch history in tasks
-                    locations_processed += 1
-                    
-                    if locations_processed % 10 == 0:
-                        logger.info(f"Page {page_number}: Processed {locations_processed}/{len(data['results'])} locations")
-                        
-                except Exception as e:
-                    logger.error(f"Error processing location {loc.get('id', 'unknown')}: {e}")
-                    continue
-
             result = {
                 'status': 'success',
                 'page': page_number,
+                'metadata_only': metadata_only,
                 'locations_processed': locations_processed,
                 'total_locations_on_page': len(data['results']),
+                'locations_created': lookups.counters['locations_created'],
+                'locations_updated': lookups.counters['locations_updated'],
+                'locations_unchanged': lookups.counters['locations_unchanged'],
+                'locations_invalid': lookups.counters['locations_invalid'],
+                'sensors_created': lookups.counters['sensors_created'],
+                'lookups': lookups.stats(),
                 'timestamp': datetime.utcnow().isoformat()
             }
             
+            if not metadata_only:
+                # Fetch /latest for the whole page concurrently - NO HISTORICAL DATA FETCHING
+                latest_by_location, rate_limited = fetch_latest_measurements_concurrently(list(location_map))
+                
+                batch = new_measurement_batch()
+                for openaq_id in location_map:
+                    # Deferred (rate limited) locations refresh in the 2-hourly run
+                    queue_latest_measurements(batch, latest_by_location.get(openaq_id, []), lookups.sensors)
+                
+                # Write all latest readings for the page in one transaction
+                write_stats = batch.flush()
+                result.update({
+                    'rows_queued': write_stats.get('queued', 0),
+                    'rows_inserted': write_stats['inserted'],
+                    'rows_skipped': write_stats['skipped'],
+                    'sensors_updated': write_stats['sensors_updated'],
+                    'rate_limited_locations': len(rate_limited)
+                })
+            
+            if result['locations_created'] or result['locations_updated'] or result['sensors_created'] or result.get('sensors_updated'):
+                location_index_version.bump()
+            
             logger.info(f"Page {page_number} completed: {result}")
             return result
-            
+        
+        except RateLimitExceeded as e:
+            logger.warning(f"Page {page_number} rate limited, retrying in {e.retry_after}s")
+            raise self.retry(exc=e, countdown=e.retry_after, max_retries=RATE_LIMIT_MAX_RETRIES)
         except Exception as e:
             logger.error(f"Critical error processing page {page_number}: {str(e)}")
             raise
 
 @celery.task(bind=True)
-def fetch_all_locations(self, fetch_history_pages=None):
+def fetch_all_locations(self, fetch_history_pages=None, metadata_only=None):
     """Orchestrate fetching all location pages - ALL 4,877 LOCATIONS - NO HISTORICAL DATA"""
     with app.app_context():
         try:
@@ -288,8 +309,8 @@ def fetch_all_locations(self, fetch_history_pages=None):
             
             # Schedule page tasks - NO HISTORICAL DATA FETCHING
             for page in range(1, total_pages + 1):
-                fetch_locations_page.delay(page, fetch_history=False)  # NEVER fetch history
-                logger.info(f"Scheduled page {page} (latest data only)")
+                fetch_locations_page.delay(page, fetch_history=False, metadata_only=metadata_only)  # NEVER fetch history
+                logger.info(f"Scheduled page {page} (metadata_only={metadata_only})")
             
             return {
                 'status': 'scheduled',
@@ -303,30 +324,80 @@ def fetch_all_locations(self, fetch_history_pages=None):
             logger.error(f"Error scheduling location fetch: {str(e)}")
             raise
 
+def dispatch_location_batches(location_ids, batch_size=100):
+    """Fetch latest for explicit location ids: one chord of batch tasks plus a summary callback
+
+    Returns the chord result and the id partitions that were dispatched.
+    """
+    partitions = [location_ids[i:i + batch_size] for i in range(0, len(location_ids), batch_size)]
+    header = group(
+        fetch_measurements_with_offset.s(
+            offset=i * batch_size,
+            batch_size=batch_size,
+            location_ids=partition
+        )
+        for i, partition in enumerate(partitions)
+    )
+    run = chord(header)(summarize_measurement_run.s(
+        started_at=datetime.utcnow().isoformat(),
+        total_locations=len(location_ids)
+    ))
+    return run, partitions
+
 @celery.task(bind=True)
-def fetch_all_measurements_orchestrator(self):
-    """Process ALL 4,877 locations by scheduling multiple batch tasks - LATEST DATA ONLY"""
+def fetch_all_measurements_orchestrator(self, mode=None):
+    """Process ALL 4,877 locations by scheduling multiple batch tasks - LATEST DATA ONLY
+
+    mode 'bulk' (default, OPENAQ_INGEST_MODE) refreshes everything from the
+    parameter-level endpoints; 'per_location' calls /locations/{id}/latest for
+    every location and is also the fallback when the bulk endpoints fail.
+    """
+    mode = mode or app.config['OPENAQ_INGEST_MODE']
+    
+    if mode == 'adaptive':
+        task = dispatch_due_locations.delay()
+        logger.info(f"Scheduled adaptive dispatch of due locations: {task.id}")
+        return {
+            'status': 'scheduled',
+            'mode': 'adaptive',
+            'task_id': task.id,
+            'timestamp': datetime.utcnow().isoformat()
+        }
+    
+    if mode == 'bulk':
+        task = fetch_latest_by_parameter.delay()
+        logger.info(f"Scheduled bulk latest-by-parameter refresh: {task.id}")
+        return {
+            'status': 'scheduled',
+            'mode': 'bulk',
+            'task_id': task.id,
+            'timestamp': datetime.utcnow().isoformat()
+        }
+    
     with app.app_context():
         try:
-            # Get total count of ALL locations
-            total_locations = Location.query.count()
+            # Partition ALL location ids up front - deterministic coverage, no OFFSET scans
+            location_ids = [location_id for (location_id,) in db.session.query(Location.id).order_by(Location.id).all()]
+            total_locations = len(location_ids)
             batch_size = 100
             total_batches = (total_locations + batch_size - 1) // batch_size
             
             logger.info(f"Total locations: {total_locations}")
             logger.info(f"Scheduling {total_batches} batches of {batch_size} to process ALL locations (LATEST DATA ONLY)")
             
-            # Schedule batch tasks with offsets to cover ALL locations
-            for i in range(total_batches):
-                offset = i * batch_size
-                fetch_measurements_with_offset.delay(offset=offset, batch_size=batch_size)
-                logger.info(f"Scheduled batch {i+1}/{total_batches} (offset {offset})")
+            if not location_ids:
+                return {'status': 'no_locations', 'mode': 'per_location'}
+            
+            run, partitions = dispatch_location_batches(location_ids, batch_size)
             
             return {
                 'status': 'scheduled',
+                'mode': 'per_location',
+                'summary_task_id': run.id,
                 'total_locations': total_locations,
                 'total_batches': total_batches,
                 'batch_size': batch_size,
+                'id_ranges': [[partition[0], partition[-1]] for partition in partitions],
                 'note': 'Latest measurements only - no historical fetching',
                 'timestamp': datetime.utcnow().isoformat()
             }
@@ -334,15 +405,61 @@ def fetch_all_measurements_orchestrator(self):
             logger.error(f"Error in orchestrator: {str(e)}")
             raise
 
+@celery.task(bind=True)
+def summarize_measurement_run(self, batch_results, started_at=None, total_locations=None):
+    """Chord callback - aggregate the per-batch results of one run into a summary"""
+    summary = {
+        'status': 'success',
+        'batches': len(batch_results),
+        'total_locations': total_locations,
+        'locations_processed': 0,
+        'locations_with_data': 0,
+        'rows_queued': 0,
+        'rows_inserted': 0,
+        'rows_skipped': 0,
+        'sensors_updated': 0,
+        'fetch_seconds': 0.0
+    }
+    
+    for result in batch_results:
+        if not result or result.get('status') != 'success':
+            continue
+        for key in ('locations_processed', 'locations_with_data', 'rows_queued', 'rows_inserted', 'rows_skipped', 'sensors_updated', 'fetch_seconds'):
+            summary[key] += result.get(key, 0)
+    
+    if started_at:
+        elapsed = (datetime.utcnow() - datetime.fromisoformat(started_at)).total_seconds()
+        summary['elapsed_seconds'] = round(elapsed, 1)
+        summary['rows_per_second'] = round(summary['rows_inserted'] / elapsed, 1) if elapsed > 0 else None
+    summary['fetch_seconds'] = round(summary['fetch_seconds'], 1)
+    summary['timestamp'] = datetime.utcnow().isoformat()
+    
+    if summary['sensors_updated']:
+        location_index_version.bump()  # New latest values for the map
+    
+    logger.info(f"Measurement run completed: {summary}")
+    return summary
+
 @celery.task(bind=True, autoretry_for=(Exception,), retry_kwargs={'max_retries': 2, 'countdown': 300})
-def fetch_measurements_with_offset(self, offset=0, batch_size=100):
-    """Fetch LATEST measurements for a batch of ALL locations - NO HISTORICAL DATA"""
+def fetch_measurements_with_offset(self, offset=0, batch_size=100, location_ids=None, carried=None):
+    """Fetch LATEST measurements for a batch of ALL locations - NO HISTORICAL DATA
+
+    The orchestrator passes an explicit `location_ids` partition; `offset` is then
+    only a label. Without ids, the batch is the `offset`-th slice by id (manual runs).
+    When the shared rate limit runs out mid-batch, the readings fetched so far are
+    written and the task is rescheduled for just the remaining ids, `carried`
+    holding the counts of the earlier attempts.
+    """
     with app.app_context():
         try:
             logger.info(f"Processing batch: offset={offset}, batch_size={batch_size} (LATEST DATA ONLY)")
             
-            # Get ALL locations with offset
-            locations = db.session.query(Location).offset(offset).limit(batch_size).all()
+            if location_ids is not None:
+                # Explicit partition (or the rest of a rate limited batch) - primary key lookups
+                locations = Location.query.filter(Location.id.in_(location_ids)).order_by(Location.id).all()
+            else:
+                # Get ALL locations with offset, ordered so slices never overlap
+                locations = db.session.query(Location).order_by(Location.id).offset(offset).limit(batch_size).all()
             
             if not locations:
                 logger.info(f"No more locations at offset {offset}")
@@ -351,13 +468,29 @@ def fetch_measurements_with_offset(self, offset=0, batch_size=100):
             logger.info(f"Processing {len(locations)} locations for LATEST measurements only")
             
             processed_count = 0
-            new_measurements = 0
+            readings_collected = 0
             locations_with_data = 0
             
+            # Sensor mapping for the whole batch in one query (OpenAQ sensor id -> our sensor id)
+            sensors = db.session.query(Sensor.openaq_id, Sensor.id).filter(
+                Sensor.location_id.in_([location.id for location in locations])
+            ).all()
+            sensor_map = {openaq_id: sensor_id for openaq_id, sensor_id in sensors}
+            batch = new_measurement_batch()
+            
+            # Fetch ONLY latest measurements - N requests in flight instead of one at a time
+            fetch_started = time.time()
+            latest_by_location, rate_limited = fetch_latest_measurements_concurrently(
+                [location.openaq_id for location in locations]
+            )
+            fetch_seconds = time.time() - fetch_started
+            
             for location in locations:
+                if location.openaq_id in rate_limited:
+                    continue
+                
                 try:
-                    # Fetch ONLY latest measurements for this location - NO HISTORICAL DATA
-                    latest_measurements = fetch_latest_measurements(location.openaq_id)
+                    latest_measurements = latest_by_location.get(location.openaq_id, [])
                     
                     if not latest_measurements:
                         logger.debug(f"No latest measurements for location {location.id} ({location.name})")
@@ -366,16 +499,12 @@ def fetch_measurements_with_offset(self, offset=0, batch_size=100):
                     
                     locations_with_data += 1
                     
-                    # Get sensor mapping for this location
-                    sensors = Sensor.query.filter_by(location_id=location.id).all()
-                    sensor_map = {sensor.openaq_id: sensor for sensor in sensors}
-                    
-                    # Process ONLY latest measurements - NO HISTORICAL DATA
+                    # Queue ONLY latest measurements - written together after the loop
                     for measurement in latest_measurements:
                         sensor_id = measurement.get('sensorsId')
                         if sensor_id in sensor_map:
-                            update_sensor_with_measurement(sensor_map[sensor_id], measurement)
-                            new_measurements += 1
+                            if batch.add(sensor_map[sensor_id], measurement):
+                                readings_collected += 1
                         else:
                             logger.debug(f"Sensor {sensor_id} not found in location {location.id}")
                     
@@ -389,25 +518,268 @@ def fetch_measurements_with_offset(self, offset=0, batch_size=100):
                     processed_count += 1
                     continue
             
+            # One multi-row INSERT ... ON CONFLICT DO NOTHING + one sensors UPDATE for the batch
+            write_stats = batch.flush()
+            
+            # Teach the adaptive scheduler when each polled location last reported
+            try:
+                record_polls(poll_policy, {
+                    location.id: newest_reading_time(latest_by_location.get(location.openaq_id, []))
+                    for location in locations if location.openaq_id not in rate_limited
+                })
+            except Exception as e:
+                db.session.rollback()
+                logger.warning(f"Batch {offset}: could not update poll schedule: {e}")
+            
+            if rate_limited:
+                deferred_ids = [location.id for location in locations if location.openaq_id in rate_limited]
+                retry_after = max(rate_limited.values())
+                logger.warning(f"Batch {offset}: wrote {write_stats['inserted']} rows, "
+                               f"retrying {len(deferred_ids)} rate limited locations in {retry_after}s")
+                carried = carried or {}
+                raise self.retry(
+                    kwargs={
+                        'offset': offset,
+                        'batch_size': batch_size,
+                        'location_ids': deferred_ids,
+                        'carried': {
+                            'locations_processed': carried.get('locations_processed', 0) + processed_count,
+                            'locations_with_data': carried.get('locations_with_data', 0) + locations_with_data,
+                            'readings_collected': carried.get('readings_collected', 0) + readings_collected,
+                            'rows_queued': carried.get('rows_queued', 0) + write_stats.get('queued', 0),
+                            'rows_inserted': carried.get('rows_inserted', 0) + write_stats['inserted'],
+                            'rows_skipped': carried.get('rows_skipped', 0) + write_stats['skipped'],
+                            'sensors_updated': carried.get('sensors_updated', 0) + write_stats['sensors_updated'],
+                            'fetch_seconds': carried.get('fetch_seconds', 0) + fetch_seconds
+                        }
+                    },
+                    countdown=retry_after,
+                    max_retries=RATE_LIMIT_MAX_RETRIES
+                )
+            
             result = {
                 'status': 'success',
                 'offset': offset,
                 'batch_size': batch_size,
                 'locations_processed': processed_count,
                 'locations_with_data': locations_with_data,
-                'new_measurements': new_measurements,
+                'readings_collected': readings_collected,
+                'new_measurements': write_stats['inserted'],
+                'rows_queued': write_stats.get('queued', 0),
+                'rows_inserted': write_stats['inserted'],
+                'rows_skipped': write_stats['skipped'],
+                'sensors_updated': write_stats['sensors_updated'],
+                'fetch_seconds': round(fetch_seconds, 2),
                 'note': 'Latest measurements only - no historical data',
                 'timestamp': datetime.utcnow().isoformat()
             }
             
+            # Fold in the counts of earlier attempts of this batch
+            for key, value in (carried or {}).items():
+                result[key] = round(result[key] + value, 2)
+            result['new_measurements'] = result['rows_inserted']
+            
             logger.info(f"Batch {offset} completed: {result}")
             return result
             
+        except Retry:
+            raise
         except Exception as e:
             logger.error(f"Error in batch at offset {offset}: {str(e)}")
             raise
 
-# Configure periodic tasks - NO CLEANUP TASKS
+@celery.task(bind=True)
+def dispatch_due_locations(self):
+    """Adaptive mode - poll the locations that are due, within the API budget
+
+    Every POLL_DISPATCH_MINUTES the most overdue locations are leased, up to
+    POLL_BUDGET_SHARE of the API calls available until the next dispatch, and
+    fetched in batches. Each batch reports the newest reading per location back
+    so active stations are polled about as often as they publish and silent ones
+    back off exponentially.
+    """
+    with app.app_context():
+        try:
+            created = ensure_poll_states(poll_policy)
+            budget = int(
+                app.config['OPENAQ_RATE_LIMIT_PER_MINUTE'] * app.config['POLL_DISPATCH_MINUTES'] * app.config['POLL_BUDGET_SHARE']
+            )
+            location_ids = claim_due_locations(max(1, budget))
+            
+            result = {
+                'mode': 'adaptive',
+                'poll_states_created': created,
+                'budget': budget,
+                'locations_due': len(location_ids),
+                'timestamp': datetime.utcnow().isoformat()
+            }
+            if not location_ids:
+                result['status'] = 'nothing_due'
+                return result
+            
+            run, partitions = dispatch_location_batches(sorted(location_ids))
+            result.update({'status': 'scheduled', 'summary_task_id': run.id, 'total_batches': len(partitions)})
+            logger.info(f"Adaptive dispatch: {result}")
+            return result
+        except Exception as e:
+            logger.error(f"Error in adaptive dispatch: {str(e)}")
+            raise
+
+@celery.task(bind=True, autoretry_for=(Exception,), retry_kwargs={'max_retries': 2, 'countdown': 300})
+def fetch_latest_by_parameter(self, parameter_ids=None):
+    """Refresh LATEST measurements for the whole country from parameter-level endpoints
+
+    Each /parameters/{id}/latest page covers up to 1,000 sensors, so a full refresh
+    takes a few dozen API calls instead of one call per location. Readings are
+    matched to our sensors through an in-memory openaq_id -> id index.
+    """
+    with app.app_context():
+        try:
+            started = time.time()
+            
+            if parameter_ids is None:
+                parameter_ids = resolve_openaq_parameter_ids()
+                if not parameter_ids:
+                    logger.warning("Parameter list unavailable - falling back to per-location fetch")
+                    fetch_all_measurements_orchestrator.delay(mode='per_location')
+                    return {'status': 'fallback', 'reason': 'no_parameters'}
+            
+            # openaq sensor id -> our sensor id, one query for the whole run
+            sensor_index = dict(db.session.query(Sensor.openaq_id, Sensor.id).all())
+            logger.info(f"Bulk refresh of {len(parameter_ids)} parameters for {len(sensor_index)} sensors")
+            
+            totals = {'api_calls': 0, 'readings': 0, 'unknown_sensors': 0, 'inserted': 0, 'skipped': 0, 'sensors_updated': 0, 'queued': 0}
+            failed = []
+            
+            for i, parameter_id in enumerate(parameter_ids):
+                try:
+                    stats = fetch_parameter_latest(parameter_id, sensor_index)
+                except RateLimitExceeded as e:
+                    logger.warning(f"Rate limited after {i}/{len(parameter_ids)} parameters, retrying in {e.retry_after}s")
+                    raise self.retry(
+                        kwargs={'parameter_ids': parameter_ids[i:]},
+                        countdown=e.retry_after,
+                        max_retries=RATE_LIMIT_MAX_RETRIES
+                    )
+                
+                if stats is None:
+                    logger.warning(f"Bulk latest unavailable for parameter {parameter_id}")
+                    failed.append(parameter_id)
+                    continue
+                
+                for key in totals:
+                    totals[key] += stats[key]
+                logger.info(f"Parameter {parameter_id}: {stats}")
+                if not stats['complete']:
+                    failed.append(parameter_id)  # Pages after the failed one were never read
+            
+            if failed:
+                # Per-location path covers every parameter, duplicates are skipped on insert
+                fetch_all_measurements_orchestrator.delay(mode='per_location')
+            
+            result = {
+                'status': 'success' if not failed else 'partial_fallback',
+                'parameters': len(parameter_ids),
+                'failed_parameters': failed,
+                'api_calls': totals['api_calls'],
+                'readings': totals['readings'],
+                'unknown_sensors': totals['unknown_sensors'],
+                'rows_queued': totals['queued'],
+                'rows_inserted': totals['inserted'],
+                'rows_skipped': totals['skipped'],
+                'sensors_updated': totals['sensors_updated'],
+                'seconds': round(time.time() - started, 1),
+                'timestamp': datetime.utcnow().isoformat()
+            }
+            
+            if totals['sensors_updated']:
+                location_index_version.bump()
+            
+            logger.info(f"Bulk latest refresh completed: {result}")
+            return result
+        
+        except Retry:
+            raise
+        except Exception as e:
+            logger.error(f"Error in bulk latest refresh: {str(e)}")
+            raise
+
+@celery.task(bind=True)
+def drain_reading_stream(self, run_seconds=55):
+    """Batch writer for INGEST_WRITE_MODE='stream' - drain the reading stream into PostgreSQL
+
+    Runs on the 'writer' queue for `run_seconds`, writing up to
+    INGEST_STREAM_BATCH_ROWS readings (or whatever arrived within
+    INGEST_STREAM_BATCH_SECONDS) per transaction. Several writers can run at once,
+    the consumer group hands each entry to exactly one of them.
+    """
+    consumer = f"{socket.gethostname()}-{os.getpid()}"
+    totals = {'batches': 0, 'entries': 0, 'claimed': 0, 'dead_lettered': 0, 'readings': 0,
+              'inserted': 0, 'skipped': 0, 'sensors_updated': 0}
+    
+    with app.app_context():
+        deadline = time.monotonic() + run_seconds
+        while time.monotonic() < deadline:
+            stats = reading_stream.drain_once(
+                consumer,
+                max_rows=app.config['INGEST_STREAM_BATCH_ROWS'],
+                max_seconds=min(app.config['INGEST_STREAM_BATCH_SECONDS'], max(0.1, deadline - time.monotonic()))
+            )
+            for key in stats:
+                totals[key] += stats[key]
+            if stats['entries']:
+                totals['batches'] += 1
+                logger.info(f"Stream writer {consumer}: {stats}")
+    
+    if totals['sensors_updated']:
+        location_index_version.bump()
+    
+    return dict(totals, status='success', consumer=consumer, timestamp=datetime.utcnow().isoformat())
+
+@celery.task(bind=True)
+def maintain_measurement_partitions(self):
+    """Create the monthly measurement partitions PARTITION_MONTHS_AHEAD months ahead"""
+    with app.app_context():
+        created = ensure_partitions(months_ahead=app.config['PARTITION_MONTHS_AHEAD'])
+        if created:
+            logger.info(f"Created measurement partitions: {created}")
+        return {'status': 'success', 'created': created, 'timestamp': datetime.utcnow().isoformat()}
+
+@celery.task(bind=True)
+def enforce_raw_retention(self):
+    """Compact raw readings older than RAW_RETENTION_DAYS into the rollups, a few months per run
+
+    Throttled: at most RETENTION_MONTHS_PER_RUN months per run (a month is one
+    partition drop, or batched DELETEs with RETENTION_PAUSE_SECONDS in between on
+    an unpartitioned table), so a large backlog is worked off over several nights.
+    """
+    with app.app_context():
+        result = apply_retention(
+            app.config,
+            max_months=app.config['RETENTION_MONTHS_PER_RUN'],
+            pause_seconds=app.config['RETENTION_PAUSE_SECONDS']
+        )
+        if result.get('months'):
+            logger.info(f"Retention removed {result['rows_removed']} raw rows ({result['bytes_reclaimed']} bytes) "
+                        f"from {', '.join(month['month'] for month in result['months'])}")
+        return dict(result, timestamp=datetime.utcnow().isoformat())
+
+@celery.task(bind=True)
+def reconcile_measurement_counters(self):
+    """Correct drift in the dashboard counters and data-range summaries by recomputing them"""
+    with app.app_context():
+        counters = reconcile_counters()
+        sensor_rows, location_rows = rebuild_summaries()
+        return {
+            'status': 'success',
+            'total': counters['total'],
+            'parameters': len(counters['parameters']),
+            'sensor_summaries': sensor_rows,
+            'location_summaries': location_rows,
+            'timestamp': datetime.utcnow().isoformat()
+        }
+
+# Configure periodic tasks - NO CLEANUP TASKS unless RAW_RETENTION_DAYS is set
 from celery.schedules import crontab
 
 celery.conf.beat_schedule = {
@@ -419,7 +791,40 @@ celery.conf.beat_schedule = {
         'task': 'app.tasks.fetch_all_locations',  # Gets all 4,877 locations
         'schedule': crontab(hour=2, minute=0, day_of_week=0),  # Weekly on Sunday at 2 AM
     },
-    # NO CLEANUP TASKS - DATA PRESERVED FOREVER
+    'create-measurement-partitions-daily': {
+        'task': 'app.tasks.maintain_measurement_partitions',  # Creates future months, never drops
+        'schedule': crontab(hour=3, minute=30),  # Daily at 3:30 AM
+    },
+    'reconcile-measurement-counters': {
+        'task': 'app.tasks.reconcile_measurement_counters',
+        'schedule': crontab(minute=45, hour='*/6'),  # Every 6 hours
+    },
+    # NO CLEANUP TASKS BY DEFAULT - DATA PRESERVED FOREVER
 }
 
+if app.config['OPENAQ_INGEST_MODE'] == 'adaptive':
+    # Poll due locations every few minutes instead of everything every 2 hours
+    del celery.conf.beat_schedule['fetch-latest-measurements-every-2-hours']
+    celery.conf.beat_schedule['dispatch-due-locations'] = {
+        'task': 'app.tasks.dispatch_due_locations',
+        'schedule': crontab(minute=f"*/{app.config['POLL_DISPATCH_MINUTES']}"),
+        'options': {'expires': app.config['POLL_DISPATCH_MINUTES'] * 60},
+    }
+
+if app.config['INGEST_WRITE_MODE'] == 'stream':
+    # Keep one writer draining the reading stream (start a worker with -Q writer)
+    celery.conf.beat_schedule['drain-reading-stream-every-minute'] = {
+        'task': 'app.tasks.drain_reading_stream',
+        'schedule': 60.0,
+        'kwargs': {'run_seconds': 55},
+        'options': {'queue': 'writer', 'expires': 60},
+    }
+
+if app.config['RAW_RETENTION_DAYS']:
+    # Old raw readings live on as hourly/daily rollups; the raw rows are removed month by month
+    celery.conf.beat_schedule['compact-expired-measurements-nightly'] = {
+        'task': 'app.tasks.enforce_raw_retention',
+        'schedule': crontab(hour=4, minute=15),  # Daily at 4:15 AM, after partition maintenance
+    }
+
 celery.conf.timezone = 'UTC'
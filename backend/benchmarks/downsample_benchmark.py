@@ -0,0 +1,100 @@
+"""Latency of server-side chart downsampling (/api/measurements?points=N)
+
+Two parts:
+
+    algorithm   lttb / minmax over synthetic 1M-point NumPy series (no database)
+    endpoint    points=N requests for one synthetic sensor with --readings
+                per-minute readings (--db), for several window lengths, so the
+                raw, hourly and daily sources are all exercised
+
+    cd backend
+    python -m benchmarks.downsample_benchmark                          # algorithm only
+    python -m benchmarks.downsample_benchmark --db --readings 1000000  # + endpoint on a 1M-row sensor
+
+The endpoint part needs a scratch DATABASE_URL: it seeds the sensor with
+benchmarks.export_benchmark's helpers, rebuilds its rollups and deletes it
+again unless --keep is given.
+"""
+import argparse
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return result, statistics.median(samples), max(samples)
+
+def algorithm_benchmark(rows, point_counts, repeat):
+    from app.downsample import Series, lttb, bucket_minmax, to_epoch
+
+    start = datetime(2024, 1, 1)
+    t = to_epoch(start) + np.arange(rows) * 60.0
+    y = 40 + 30 * np.sin(np.arange(rows) / 500.0) + np.random.default_rng(7).random(rows) * 10
+    series = Series(t, y, y, y, np.ones(rows), 'raw')
+    end = start + timedelta(minutes=rows)
+
+    print(f"Algorithm on {rows} points (median / max of {repeat} runs):")
+    for points in point_counts:
+        _, lttb_ms, lttb_max = timed(lambda: lttb(series, points), repeat)
+        _, minmax_ms, minmax_max = timed(lambda: bucket_minmax(series, points, start, end), repeat)
+        print(f"  points={points:5}  lttb {lttb_ms:7.1f} ms (max {lttb_max:.1f})  "
+              f"minmax {minmax_ms:7.1f} ms (max {minmax_max:.1f})")
+
+def endpoint_benchmark(readings, point_counts, repeat, keep):
+    from benchmarks.export_benchmark import bench_app, seed, cleanup
+    from app.models import db, Sensor
+    from app.rollups import rebuild_rollups
+
+    app = bench_app()
+    parameter_id = seed(app, 1, readings, step_minutes=1)
+    try:
+        with app.app_context():
+            sensor = Sensor.query.filter_by(parameter_id=parameter_id).one()
+            oldest, newest = db.session.execute(db.text(
+                "SELECT min(timestamp), max(timestamp) FROM measurements WHERE sensor_id = :s"
+            ), {'s': sensor.id}).one()
+            started = time.time()
+            rebuild_rollups(oldest, newest + timedelta(seconds=1))
+            print(f"Rolled up sensor {sensor.id} ({readings} rows) in {time.time() - started:.1f}s")
+
+        client = app.test_client()
+        windows = [('1 day', timedelta(days=1)), ('30 days', timedelta(days=30)), ('whole history', newest - oldest)]
+        print(f"Endpoint (median / max of {repeat} requests, response cache disabled):")
+        for label, window in windows:
+            for points in point_counts:
+                query = (f"/api/measurements?sensor_id={sensor.id}&points={points}"
+                         f"&start={(newest - window).isoformat()}&end={(newest + timedelta(seconds=1)).isoformat()}")
+                response, median_ms, max_ms = timed(lambda: client.get(query), repeat)
+                meta = response.get_json()['meta']
+                print(f"  {label:14} points={points:5}  {median_ms:7.1f} ms (max {max_ms:.1f})  "
+                      f"source={meta['source']:4} rows read={meta['rows_read']:8} returned={meta['found']} "
+                      f"({len(response.data) / 1024:.0f} KB)")
+    finally:
+        if not keep:
+            cleanup(app)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark server-side downsampling')
+    parser.add_argument('--rows', type=int, default=1000000, help='Points in the in-memory series')
+    parser.add_argument('--points', default='200,1000,5000', help='Comma separated output sizes')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement')
+    parser.add_argument('--db', action='store_true', help='Also benchmark the endpoint against DATABASE_URL')
+    parser.add_argument('--readings', type=int, default=1000000, help='Per-minute readings of the synthetic sensor')
+    parser.add_argument('--keep', action='store_true', help='Keep the synthetic sensor for the next run')
+    args = parser.parse_args()
+
+    point_counts = [int(points) for points in args.points.split(',')]
+    algorithm_benchmark(args.rows, point_counts, args.repeat)
+    if args.db:
+        endpoint_benchmark(args.readings, point_counts, args.repeat, args.keep)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""Memory and time of /api/measurements as one JSON list vs streamed NDJSON/CSV
+
+Seeds a synthetic parameter with --sensors sensors x --hours hourly readings
+(server-side generate_series, so millions of rows load in seconds), then asks
+for all of them (parameter_id only, no limit) once per format. Every format runs
+in a fresh child process, which reports:
+
+    seconds         until the last byte of the response was read
+    MB sent         response size
+    peak RSS        ru_maxrss of the child (the web worker's memory high-water mark)
+    peak Python     tracemalloc peak while serving
+
+    cd backend
+    python -m benchmarks.export_benchmark --sensors 200 --hours 10000   # 2M rows
+    python -m benchmarks.export_benchmark --formats ndjson,csv --keep   # reuse the rows next time
+
+Use a scratch database - rows are written directly (no rollups/counters) and
+deleted again unless --keep is given. The response cache is disabled.
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+SYNTHETIC_PARAMETER = 'bench_synthetic'
+SYNTHETIC_OPENAQ_ID = -1000000  # Synthetic locations/sensors get openaq ids at and below this
+
+def bench_app():
+    from app import create_app, cache
+
+    app = create_app()
+    app.config['CACHE_TYPE'] = 'NullCache'
+    cache.init_app(app)
+    return app
+
+def seed(app, sensors, readings, step_minutes=60):
+    """Create the synthetic parameter/location/sensors with `readings` readings each; returns the parameter id"""
+    from datetime import datetime, timedelta
+    from app.models import db, Parameter
+    from app.partitions import ensure_partitions
+
+    with app.app_context():
+        parameter = Parameter.query.filter_by(name=SYNTHETIC_PARAMETER).first()
+        if parameter is not None:
+            existing = db.session.execute(db.text(
+                "SELECT count(*) FROM measurements m JOIN sensors s ON s.id = m.sensor_id WHERE s.parameter_id = :p"
+            ), {'p': parameter.id}).scalar()
+            if existing == sensors * readings:
+                print(f"Reusing {existing} synthetic rows")
+                return parameter.id
+            cleanup(app)
+
+        end = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        start = end - timedelta(minutes=readings * step_minutes)
+        ensure_partitions(start=start, end=end, months_ahead=0)
+
+        started = time.time()
+        parameter_id = db.session.execute(db.text(
+            "INSERT INTO parameters (name, display_name, unit) VALUES (:name, 'Synthetic', 'µg/m³') RETURNING id"
+        ), {'name': SYNTHETIC_PARAMETER}).scalar()
+        location_id = db.session.execute(db.text(
+            "INSERT INTO locations (openaq_id, name, country_code, latitude, longitude, is_mobile) "
+            "VALUES (:openaq_id, 'Synthetic benchmark location', 'US', 40.0, -100.0, false) RETURNING id"
+        ), {'openaq_id': SYNTHETIC_OPENAQ_ID}).scalar()
+        db.session.execute(db.text(
+            "INSERT INTO sensors (openaq_id, location_id, parameter_id) "
+            "SELECT :base - n, :location_id, :parameter_id FROM generate_series(1, :sensors) n"
+        ), {'base': SYNTHETIC_OPENAQ_ID, 'location_id': location_id, 'parameter_id': parameter_id, 'sensors': sensors})
+        db.session.execute(db.text(
+            "INSERT INTO measurements (sensor_id, value, timestamp) "
+            "SELECT s.id, round((40 + 30 * sin(h / 500.0) + random() * 10)::numeric, 3), "
+            "  :start + make_interval(mins => h * :step) "
+            "FROM sensors s CROSS JOIN generate_series(0, :readings - 1) h WHERE s.parameter_id = :parameter_id"
+        ), {'start': start, 'readings': readings, 'step': step_minutes, 'parameter_id': parameter_id})
+        db.session.commit()
+        db.session.execute(db.text("ANALYZE measurements"))
+        db.session.commit()
+        print(f"Seeded {sensors * readings} rows in {time.time() - started:.1f}s")
+        return parameter_id
+
+def cleanup(app):
+    from app.models import db
+
+    with app.app_context():
+        params = {'name': SYNTHETIC_PARAMETER}
+        db.session.execute(db.text(
+            "DELETE FROM measurements WHERE sensor_id IN ("
+            "SELECT s.id FROM sensors s JOIN parameters p ON p.id = s.parameter_id WHERE p.name = :name)"
+        ), params)
+        db.session.execute(db.text(
+            "DELETE FROM sensors WHERE parameter_id IN (SELECT id FROM parameters WHERE name = :name)"
+        ), params)
+        db.session.execute(db.text("DELETE FROM locations WHERE openaq_id = :openaq_id"), {'openaq_id': SYNTHETIC_OPENAQ_ID})
+        db.session.execute(db.text("DELETE FROM parameters WHERE name = :name"), params)
+        db.session.commit()
+
+def measure(output_format, parameter_id):
+    """Child process: serve one request and print its numbers as JSON"""
+    app = bench_app()
+    client = app.test_client()
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    response = client.get(f"/api/measurements?parameter_id={parameter_id}&format={output_format}", buffered=False)
+    size = 0
+    for chunk in response.iter_encoded():
+        size += len(chunk)
+    response.close()
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(json.dumps({
+        'format': output_format,
+        'status': response.status_code,
+        'seconds': round(seconds, 2),
+        'mb_sent': round(size / 1024 / 1024, 1),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),  # KiB on Linux
+        'peak_python_mb': round(peak / 1024 / 1024, 1)
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark JSON vs streamed /api/measurements exports')
+    parser.add_argument('--sensors', type=int, default=200, help='Synthetic sensors')
+    parser.add_argument('--hours', type=int, default=10000, help='Hourly readings per sensor')
+    parser.add_argument('--formats', default='json,ndjson,csv', help='Comma separated formats to compare')
+    parser.add_argument('--keep', action='store_true', help='Keep the synthetic rows for the next run')
+    parser.add_argument('--child', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--parameter-id', type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        measure(args.child, args.parameter_id)
+        return 0
+
+    app = bench_app()
+    parameter_id = seed(app, args.sensors, args.hours)
+    try:
+        print(f"{'format':8} {'status':>6} {'seconds':>8} {'MB sent':>8} {'peak RSS MB':>12} {'peak Python MB':>15}")
+        for output_format in args.formats.split(','):
+            child = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.export_benchmark', '--child', output_format,
+                 '--parameter-id', str(parameter_id)],
+                capture_output=True, text=True
+            )
+            if child.returncode != 0:
+                print(f"{output_format:8} failed:\n{child.stderr[-2000:]}")
+                continue
+            result = json.loads(child.stdout.strip().splitlines()[-1])
+            print(f"{result['format']:8} {result['status']:>6} {result['seconds']:>8} {result['mb_sent']:>8} "
+                  f"{result['peak_rss_mb']:>12} {result['peak_python_mb']:>15}")
+    finally:
+        if not args.keep:
+            cleanup(app)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,301 @@
+"""Local stand-in for the OpenAQ v3 API, generated from usa_locations.json
+
+Serves the endpoints our tasks call so ingestion can be exercised and benchmarked
+without the real API or an API key:
+
+    /v3/locations                         paginated locations (countries_id is ignored)
+    /v3/locations/{id}/latest             one reading per sensor of the location
+    /v3/measurements?locations_id=...     same readings in the older 'date' format
+    /v3/parameters                        parameters seen in the snapshot
+    /v3/parameters/{id}/latest            latest reading of every sensor of a parameter
+    /v3/sensors/{id}/measurements         hourly history between datetime_from/datetime_to
+    /_stats                               request counters of this server (not OpenAQ)
+
+Readings are deterministic per (sensor, timestamp). Timestamps are "now" rounded
+down to --tick-seconds, so with the default of 1 every run writes new rows.
+
+    python -m benchmarks.fake_openaq --port 8900 --latency-ms 80 --rate-limit 60
+    OPENAQ_API_URL=http://127.0.0.1:8900/v3 celery -A celery_app worker
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+DEFAULT_SNAPSHOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'usa_locations.json')
+
+def iso_utc(moment):
+    return moment.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+class FakeOpenAQ:
+    """State shared by all request handlers: the snapshot, knobs and counters"""
+
+    def __init__(self, snapshot=DEFAULT_SNAPSHOT, latency_ms=0, jitter_ms=0, rate_limit=None,
+                 window_seconds=60, error_rate=0.0, tick_seconds=1, seed=42):
+        with open(snapshot, encoding='utf-8') as f:
+            self.locations = json.load(f)
+        self.locations.sort(key=lambda loc: loc['id'])
+        self.locations_by_id = {loc['id']: loc for loc in self.locations}
+
+        self.parameters = {}
+        self.sensors_by_parameter = {}
+        for loc in self.locations:
+            for sensor in loc.get('sensors', []):
+                param = sensor['parameter']
+                self.parameters[param['id']] = param
+                self.sensors_by_parameter.setdefault(param['id'], []).append((loc, sensor))
+        self.sensors = {
+            sensor['id']: (loc, sensor) for loc in self.locations for sensor in loc.get('sensors', [])
+        }
+
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit = rate_limit  # requests per window, None = unlimited
+        self.window_seconds = window_seconds
+        self.error_rate = error_rate  # probability of an injected 429
+        self.tick_seconds = max(1, tick_seconds)
+        self.random = random.Random(seed)
+
+        self.lock = threading.Lock()
+        self.window_started = time.time()
+        self.window_used = 0
+        self.stats = {'requests': 0, 'responses_200': 0, 'responses_404': 0, 'responses_429': 0, 'injected_429': 0}
+
+    # Rate limiting ---------------------------------------------------------
+
+    def admit(self):
+        """Count a request against the window; returns (status, headers)"""
+        with self.lock:
+            self.stats['requests'] += 1
+            now = time.time()
+            if now - self.window_started >= self.window_seconds:
+                self.window_started = now
+                self.window_used = 0
+            reset = max(1, int(self.window_seconds - (now - self.window_started) + 0.999))
+
+            headers = {}
+            if self.rate_limit is not None:
+                self.window_used += 1
+                remaining = max(0, self.rate_limit - self.window_used)
+                headers = {
+                    'x-ratelimit-limit': str(self.rate_limit),
+                    'x-ratelimit-remaining': str(remaining),
+                    'x-ratelimit-reset': str(reset)
+                }
+                if self.window_used > self.rate_limit:
+                    self.stats['responses_429'] += 1
+                    return 429, headers
+
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.stats['responses_429'] += 1
+                self.stats['injected_429'] += 1
+                headers.setdefault('x-ratelimit-reset', str(reset))
+                return 429, headers
+
+            return 200, headers
+
+    def delay(self):
+        if self.latency_ms or self.jitter_ms:
+            with self.lock:
+                jitter = self.random.uniform(0, self.jitter_ms)
+            time.sleep((self.latency_ms + jitter) / 1000.0)
+
+    # Payloads --------------------------------------------------------------
+
+    def current_timestamp(self):
+        now = int(time.time())
+        return datetime.fromtimestamp(now - now % self.tick_seconds, tz=timezone.utc)
+
+    @staticmethod
+    def reading_value(sensor_id, timestamp):
+        digest = hashlib.sha1(f"{sensor_id}:{timestamp.isoformat()}".encode()).digest()
+        return round(int.from_bytes(digest[:4], 'big') / 2 ** 32 * 80, 3)
+
+    def latest_reading(self, loc, sensor, timestamp):
+        return {
+            'datetime': {'utc': iso_utc(timestamp), 'local': iso_utc(timestamp)},
+            'value': self.reading_value(sensor['id'], timestamp),
+            'coordinates': loc['coordinates'],
+            'sensorsId': sensor['id'],
+            'locationsId': loc['id']
+        }
+
+    def measurement_reading(self, loc, sensor, timestamp):
+        return {
+            'locationId': loc['id'],
+            'location': loc['name'],
+            'parameter': sensor['parameter']['name'],
+            'value': self.reading_value(sensor['id'], timestamp),
+            'date': {'utc': iso_utc(timestamp), 'local': iso_utc(timestamp)},
+            'unit': sensor['parameter']['units'],
+            'coordinates': loc['coordinates'],
+            'sensorsId': sensor['id']
+        }
+
+    def history_reading(self, sensor, period_end):
+        period_start = period_end - timedelta(hours=1)
+        return {
+            'value': self.reading_value(sensor['id'], period_end),
+            'parameter': sensor['parameter'],
+            'period': {
+                'label': 'raw',
+                'interval': '01:00:00',
+                'datetimeFrom': {'utc': iso_utc(period_start), 'local': iso_utc(period_start)},
+                'datetimeTo': {'utc': iso_utc(period_end), 'local': iso_utc(period_end)}
+            }
+        }
+
+    @staticmethod
+    def page(items, query, default_limit=100):
+        limit = int(query.get('limit', [default_limit])[0])
+        page = int(query.get('page', [1])[0])
+        results = items[(page - 1) * limit:page * limit]
+        return {'meta': {'name': 'openaq-api', 'page': page, 'limit': limit, 'found': len(items)}, 'results': results}
+
+    def route(self, path, query):
+        """Return the JSON body for a request, or None for 404"""
+        path = path.rstrip('/')
+        if path.startswith('/v3'):
+            path = path[3:]
+
+        if path == '/locations':
+            return self.page(self.locations, query)
+
+        match = re.fullmatch(r'/locations/(\d+)/latest', path)
+        if match:
+            loc = self.locations_by_id.get(int(match.group(1)))
+            if loc is None:
+                return None
+            timestamp = self.current_timestamp()
+            results = [self.latest_reading(loc, sensor, timestamp) for sensor in loc.get('sensors', [])]
+            return {'meta': {'found': len(results)}, 'results': results}
+
+        if path == '/measurements':
+            loc = self.locations_by_id.get(int(query.get('locations_id', [0])[0]))
+            if loc is None:
+                return {'meta': {'found': 0}, 'results': []}
+            timestamp = self.current_timestamp()
+            results = [self.measurement_reading(loc, sensor, timestamp) for sensor in loc.get('sensors', [])]
+            return self.page(results, query)
+
+        if path == '/parameters':
+            return self.page(sorted(self.parameters.values(), key=lambda p: p['id']), query)
+
+        match = re.fullmatch(r'/parameters/(\d+)/latest', path)
+        if match:
+            pairs = self.sensors_by_parameter.get(int(match.group(1)))
+            if pairs is None:
+                return None
+            timestamp = self.current_timestamp()
+            return self.page([self.latest_reading(loc, sensor, timestamp) for loc, sensor in pairs], query)
+
+        match = re.fullmatch(r'/sensors/(\d+)/measurements', path)
+        if match:
+            pair = self.sensors.get(int(match.group(1)))
+            if pair is None:
+                return None
+            start = datetime.fromisoformat(query['datetime_from'][0].replace('Z', '+00:00'))
+            end = datetime.fromisoformat(query['datetime_to'][0].replace('Z', '+00:00'))
+            period_end = start.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+            readings = []
+            while period_end <= end:
+                readings.append(self.history_reading(pair[1], period_end))
+                period_end += timedelta(hours=1)
+            return self.page(readings, query)
+
+        return None
+
+    def snapshot_stats(self):
+        with self.lock:
+            return dict(self.stats)
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+
+            if url.path == '/_stats':
+                return self.send_json(200, fake.snapshot_stats())
+
+            status, headers = fake.admit()
+            fake.delay()
+            if status == 429:
+                return self.send_json(429, {'detail': 'Too many requests'}, headers)
+
+            try:
+                body = fake.route(url.path, query)
+            except (KeyError, ValueError) as e:
+                return self.send_json(422, {'detail': str(e)}, headers)
+
+            with fake.lock:
+                fake.stats['responses_404' if body is None else 'responses_200'] += 1
+            if body is None:
+                return self.send_json(404, {'detail': 'Not found'}, headers)
+            self.send_json(200, body, headers)
+
+        def send_json(self, status, body, headers=None):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass  # One line per request would dominate the benchmark output
+
+    return Handler
+
+def start_server(fake, host='127.0.0.1', port=0):
+    """Serve `fake` from a background thread; returns the server (port 0 = pick a free one)"""
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def add_server_arguments(parser):
+    parser.add_argument('--snapshot', default=DEFAULT_SNAPSHOT, help='Locations JSON to serve')
+    parser.add_argument('--latency-ms', type=float, default=50, help='Added latency per request')
+    parser.add_argument('--jitter-ms', type=float, default=20, help='Random extra latency (0..jitter)')
+    parser.add_argument('--rate-limit', type=int, default=None, help='Requests per window before 429s (default unlimited)')
+    parser.add_argument('--window-seconds', type=int, default=60, help='Rate limit window')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with an injected 429')
+    parser.add_argument('--tick-seconds', type=int, default=1, help='Reading timestamps are rounded down to this')
+
+def fake_from_args(args):
+    return FakeOpenAQ(
+        snapshot=args.snapshot,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        rate_limit=args.rate_limit,
+        window_seconds=args.window_seconds,
+        error_rate=args.error_rate,
+        tick_seconds=args.tick_seconds
+    )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local OpenAQ v3 stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_server(fake_from_args(args), args.host, args.port)
+    print(f"Fake OpenAQ serving {args.snapshot} at http://{args.host}:{server.server_port}/v3 (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,216 @@
+"""End-to-end ingestion benchmark against the local OpenAQ stand-in
+
+Runs the real Celery tasks in-process (task.apply) against benchmarks.fake_openaq
+and the database in DATABASE_URL, and reports per scenario:
+
+    requests/s      API requests served by the fake server per wall-clock second
+    rows/s          measurement rows inserted per second
+    DB round trips  statements executed + commits (SQLAlchemy engine events)
+    p50/p95         per-location /latest fetch time as seen by the task
+
+    cd backend
+    python -m benchmarks.ingest_benchmark --scenario all --latency-ms 80 --batches 5
+    python -m benchmarks.ingest_benchmark --scenario measurements --json before.json
+
+Use a scratch database - the benchmark writes locations, sensors and measurements.
+Redis (REDIS_URL) is used for the shared rate limiter; its budget is raised to
+--client-rate-limit so the client, not the fake server, is what gets measured.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from urllib.parse import urlparse
+
+import requests
+
+from benchmarks.fake_openaq import add_server_arguments, fake_from_args, start_server
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method='inclusive')[pct - 1]
+
+class RoundTripCounter:
+    """Count statements and commits sent to the database"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.statements = 0
+        self.commits = 0
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+        event.listen(engine, 'commit', self._on_commit)
+
+    def _on_execute(self, *args):
+        self.statements += 1
+
+    def _on_commit(self, *args):
+        self.commits += 1
+
+    @property
+    def total(self):
+        return self.statements + self.commits
+
+class ServerStats:
+    """Read the fake server's request counters (None against a real API)"""
+
+    def __init__(self, base_url):
+        parts = urlparse(base_url)
+        self.url = f"{parts.scheme}://{parts.netloc}/_stats"
+
+    def read(self):
+        try:
+            return requests.get(self.url, timeout=5).json()
+        except (requests.RequestException, ValueError):
+            return None
+
+def run_scenario(name, run, counter, server_stats, fetch_timings):
+    """Run one scenario and collect its metrics"""
+    fetch_timings.clear()
+    statements_before, commits_before = counter.statements, counter.commits
+    server_before = server_stats.read()
+
+    started = time.perf_counter()
+    results = run()
+    elapsed = time.perf_counter() - started
+
+    server_after = server_stats.read()
+    requests_made = server_after['requests'] - server_before['requests'] if server_before and server_after else None
+    responses_429 = server_after['responses_429'] - server_before['responses_429'] if server_before and server_after else None
+    rows = sum(result.get('rows_inserted', 0) for result in results if result)
+    timings = sorted(fetch_timings)
+
+    return {
+        'scenario': name,
+        'tasks': len(results),
+        'seconds': round(elapsed, 3),
+        'api_requests': requests_made,
+        'responses_429': responses_429,
+        'requests_per_second': round(requests_made / elapsed, 1) if requests_made is not None and elapsed else None,
+        'rows_inserted': rows,
+        'rows_per_second': round(rows / elapsed, 1) if elapsed else None,
+        'db_statements': counter.statements - statements_before,
+        'db_commits': counter.commits - commits_before,
+        'db_round_trips': (counter.statements - statements_before) + (counter.commits - commits_before),
+        'locations_timed': len(timings),
+        'p50_location_ms': round(percentile(timings, 50) * 1000, 1) if timings else None,
+        'p95_location_ms': round(percentile(timings, 95) * 1000, 1) if timings else None
+    }
+
+def print_report(report):
+    print(f"\n{report['scenario']} ({report['tasks']} tasks, {report['seconds']}s)")
+    print(f"  API Requests: {report['api_requests']} ({report['requests_per_second']}/s, {report['responses_429']} x 429)")
+    print(f"  Rows Inserted: {report['rows_inserted']} ({report['rows_per_second']}/s)")
+    print(f"  DB Round Trips: {report['db_round_trips']} ({report['db_statements']} statements, {report['db_commits']} commits)")
+    if report['locations_timed']:
+        print(f"  Per-location Fetch: p50 {report['p50_location_ms']} ms, p95 {report['p95_location_ms']} ms "
+              f"over {report['locations_timed']} locations")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark OpenAQ ingestion end to end')
+    parser.add_argument('--scenario', choices=['locations', 'measurements', 'bulk', 'all'], default='all')
+    parser.add_argument('--base-url', default=None, help='Use a running server instead of starting the fake in-process')
+    parser.add_argument('--pages', type=int, default=1, help='Location pages of 1,000 to sync (locations scenario)')
+    parser.add_argument('--with-latest', action='store_true', help='Locations scenario also fetches /latest')
+    parser.add_argument('--batches', type=int, default=5, help='Batches to run (measurements scenario)')
+    parser.add_argument('--batch-size', type=int, default=100, help='Locations per batch (measurements scenario)')
+    parser.add_argument('--client-rate-limit', type=int, default=1000000, help='Shared limiter budget per minute')
+    parser.add_argument('--concurrency', type=int, default=None, help='OPENAQ_FETCH_CONCURRENCY override')
+    parser.add_argument('--json', dest='json_path', default=None, help='Also write the reports to this file')
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server = start_server(fake_from_args(args))
+        base_url = f"http://127.0.0.1:{server.server_port}/v3"
+        print(f"Fake OpenAQ at {base_url} (latency {args.latency_ms}+{args.jitter_ms} ms, "
+              f"rate limit {args.rate_limit or 'off'}, error rate {args.error_rate})")
+
+    # Configuration is read when app.tasks is imported
+    os.environ['OPENAQ_API_URL'] = base_url
+    os.environ.setdefault('OPENAQ_API_KEY', 'benchmark')
+    os.environ['OPENAQ_RATE_LIMIT_PER_MINUTE'] = str(args.client_rate_limit)
+    os.environ['OPENAQ_RATE_LIMIT_BURST'] = str(max(10, args.client_rate_limit // 60))
+    os.environ['OPENAQ_RATE_LIMIT_MAX_WAIT'] = '300'  # Tasks run eagerly here - sleep instead of rescheduling
+    if args.concurrency:
+        os.environ['OPENAQ_FETCH_CONCURRENCY'] = str(args.concurrency)
+
+    from app import tasks
+    from app.models import db, Location
+    from app.partitions import ensure_partitions
+
+    # Time every /latest call the tasks make (looked up through the module at call time)
+    fetch_timings = []
+    fetch_latest_measurements = tasks.fetch_latest_measurements
+
+    def timed_fetch_latest_measurements(location_id):
+        started = time.perf_counter()
+        try:
+            return fetch_latest_measurements(location_id)
+        finally:
+            fetch_timings.append(time.perf_counter() - started)
+
+    tasks.fetch_latest_measurements = timed_fetch_latest_measurements
+
+    reports = []
+    with tasks.app.app_context():
+        db.create_all()
+        ensure_partitions()  # measurements is range-partitioned - inserts need this month's partition
+        counter = RoundTripCounter(db.engine)
+        server_stats = ServerStats(base_url)
+
+        def run_locations():
+            return [
+                tasks.fetch_locations_page.apply(args=(page,), kwargs={'metadata_only': not args.with_latest}).get()
+                for page in range(1, args.pages + 1)
+            ]
+
+        def run_measurements():
+            location_ids = [location_id for (location_id,) in db.session.query(Location.id).order_by(Location.id).all()]
+            db.session.remove()
+            partitions = [
+                location_ids[i:i + args.batch_size]
+                for i in range(0, len(location_ids), args.batch_size)
+            ][:args.batches]
+            return [
+                tasks.fetch_measurements_with_offset.apply(kwargs={
+                    'offset': i * args.batch_size,
+                    'batch_size': args.batch_size,
+                    'location_ids': partition
+                }).get()
+                for i, partition in enumerate(partitions)
+            ]
+
+        def run_bulk():
+            return [tasks.fetch_latest_by_parameter.apply().get()]
+
+        scenarios = {
+            'locations': run_locations,
+            'measurements': run_measurements,
+            'bulk': run_bulk
+        }
+        selected = list(scenarios) if args.scenario == 'all' else [args.scenario]
+
+        for name in selected:
+            report = run_scenario(name, scenarios[name], counter, server_stats, fetch_timings)
+            print_report(report)
+            reports.append(report)
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(reports, f, indent=2)
+        print(f"\nWrote {args.json_path}")
+
+    if server:
+        server.shutdown()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""Search-as-you-type latency and typo hit rate of /api/locations/search
+
+Two parts:
+
+    index       TrigramIndex.search against the substring scan the old ILIKE
+                query did, over --locations records whose names and localities
+                are sampled from usa_locations.json (no database)
+    endpoint    /api/locations/search with the in-memory index disabled (SQL)
+                and enabled, over the locations in DATABASE_URL (--db)
+
+Queries are prefixes of random station names as they are typed (3, 5 and 8
+characters, then the whole name) and whole names with two adjacent letters
+swapped. 'hit' is the share of queries whose station is in the top --limit.
+
+    cd backend
+    python -m benchmarks.search_benchmark                      # 20k synthetic stations
+    python -m benchmarks.search_benchmark --locations 50000 --db
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+SNAPSHOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'usa_locations.json')
+
+def synthetic_records(count, rng):
+    with open(SNAPSHOT) as f:
+        snapshot = json.load(f)
+    names = [loc['name'] for loc in snapshot if loc.get('name')]
+    localities = [loc.get('locality') for loc in snapshot]
+    # Station codes keep the names distinct, like the 'C619' suffixes in the real data
+    return [
+        {'id': i, 'name': f"{rng.choice(names)} S{i}", 'locality': rng.choice(localities)}
+        for i in range(1, count + 1)
+    ]
+
+def typo(name, rng):
+    """Swap two adjacent letters inside the longest word"""
+    word = max(name.split(), key=len)
+    if len(word) < 4:
+        return name
+    i = rng.randrange(1, len(word) - 2)
+    return name.replace(word, word[:i] + word[i + 1] + word[i] + word[i + 2:], 1)
+
+def query_sets(records, queries, rng):
+    sample = rng.sample(records, min(queries, len(records)))
+    sets = [(f"prefix {n}", [(r['name'][:n], r['id']) for r in sample]) for n in (3, 5, 8)]
+    sets.append(('whole name', [(r['name'], r['id']) for r in sample]))
+    sets.append(('typo', [(typo(r['name'], rng), r['id']) for r in sample]))
+    return sets
+
+def timed(search, queries):
+    """Median / p95 milliseconds of search(text) -> ids, and the share of queries that found their station"""
+    samples, hits = [], 0
+    for text, wanted in queries:
+        started = time.perf_counter()
+        ids = search(text)
+        samples.append((time.perf_counter() - started) * 1000)
+        hits += wanted in ids
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1], hits / len(queries)
+
+def index_benchmark(count, queries, limit):
+    from app.search import TrigramIndex
+
+    rng = random.Random(11)
+    records = synthetic_records(count, rng)
+    started = time.perf_counter()
+    index = TrigramIndex(records)
+    print(f"Trigram index over {count} stations ({len(index.postings)} trigrams) built in "
+          f"{(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def indexed(text):
+        return [records[position]['id'] for _, position in index.search(text, limit)]
+
+    def substring(text):
+        # What ILIKE '%term%' on name or locality did: unranked, first `limit` in table order
+        term = text.lower()
+        found = []
+        for r in records:
+            if term in r['name'].lower() or term in (r['locality'] or '').lower():
+                found.append(r['id'])
+                if len(found) == limit:
+                    break
+        return found
+
+    print(f"{'queries':12} {'index ms':>9} {'p95':>7} {'hit':>6} {'scan ms':>9} {'p95':>7} {'hit':>6}")
+    for label, texts in query_sets(records, queries, rng):
+        index_ms, index_p95, index_hit = timed(indexed, texts)
+        scan_ms, scan_p95, scan_hit = timed(substring, texts)
+        print(f"{label:12} {index_ms:>9.2f} {index_p95:>7.2f} {index_hit:>6.0%} "
+              f"{scan_ms:>9.2f} {scan_p95:>7.2f} {scan_hit:>6.0%}")
+
+def endpoint_benchmark(queries, limit):
+    from urllib.parse import quote
+    from benchmarks.export_benchmark import bench_app
+    from app.models import Location
+    from app.api.locations import location_index
+
+    app = bench_app()
+    with app.app_context():
+        records = [{'id': loc.id, 'name': loc.name} for loc in Location.query.filter(Location.name.isnot(None)).all()]
+        if location_index.get(app.config) is None:
+            print("Location index could not be built - see the log")
+            return
+
+    client = app.test_client()
+
+    def search(text):
+        response = client.get(f"/api/locations/search?q={quote(text)}&limit={limit}")
+        return [r['id'] for r in response.get_json()['results']]
+
+    print(f"Endpoint over {len(records)} locations, limit={limit}")
+    print(f"{'queries':12} {'SQL ms':>9} {'p95':>7} {'hit':>6} {'memory ms':>10} {'p95':>7} {'hit':>6}")
+    for label, texts in query_sets(records, queries, random.Random(11)):
+        app.config['SPATIAL_INDEX_ENABLED'] = False
+        sql_ms, sql_p95, sql_hit = timed(search, texts)
+        app.config['SPATIAL_INDEX_ENABLED'] = True
+        mem_ms, mem_p95, mem_hit = timed(search, texts)
+        print(f"{label:12} {sql_ms:>9.2f} {sql_p95:>7.2f} {sql_hit:>6.0%} {mem_ms:>10.2f} {mem_p95:>7.2f} {mem_hit:>6.0%}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark location search')
+    parser.add_argument('--locations', type=int, default=20000, help='Synthetic stations in the index part')
+    parser.add_argument('--queries', type=int, default=200, help='Queries per kind')
+    parser.add_argument('--limit', type=int, default=10, help='Results per query')
+    parser.add_argument('--db', action='store_true', help='Also benchmark the endpoint against DATABASE_URL')
+    args = parser.parse_args()
+
+    index_benchmark(args.locations, args.queries, args.limit)
+    if args.db:
+        endpoint_benchmark(args.queries, args.limit)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""Bbox and nearest-station lookups: in-memory index vs linear scan vs the SQL path
+
+Two parts:
+
+    grid        LocationGrid.query and k-nearest (SphereTree) against linear scans
+                over --locations synthetic locations spread over the contiguous US
+                (no database)
+    endpoint    /api/locations?north=..&south=..&east=..&west=.. and
+                /api/locations/nearest with the index disabled (SQL) and enabled,
+                over the locations in DATABASE_URL (--db)
+
+Viewports are centred on random locations and sized like typical map views:
+
+    street 0.05 deg, city 0.5 deg, metro 2 deg, state 8 deg, country (the whole US)
+
+    cd backend
+    python -m benchmarks.spatial_benchmark                       # grid only
+    python -m benchmarks.spatial_benchmark --locations 100000    # a denser grid
+    python -m benchmarks.spatial_benchmark --db                  # + endpoint on the real locations
+
+The endpoint part only reads. The response cache is disabled.
+"""
+import argparse
+import math
+import random
+import statistics
+import sys
+import time
+
+US_BOUNDS = {'south': 24.5, 'north': 49.5, 'west': -125.0, 'east': -66.9}
+VIEWPORTS = [('street', 0.05), ('city', 0.5), ('metro', 2.0), ('state', 8.0), ('country', None)]
+
+def viewports(centres, size, count, rng):
+    if size is None:
+        return [US_BOUNDS] * count
+    boxes = []
+    for lat, lon in rng.sample(centres, min(count, len(centres))):
+        boxes.append({'south': lat - size / 2, 'north': lat + size / 2, 'west': lon - size, 'east': lon + size})
+    return boxes
+
+def timed_us(fn, queries):
+    """Median / max microseconds of fn(query) over the queries, and the median result size"""
+    samples, sizes = [], []
+    for query in queries:
+        started = time.perf_counter()
+        found = fn(query)
+        samples.append((time.perf_counter() - started) * 1e6)
+        sizes.append(found)
+    return statistics.median(samples), max(samples), statistics.median(sizes)
+
+def grid_benchmark(count, cell_degrees, queries):
+    from app.spatial import LocationGrid
+
+    rng = random.Random(7)
+    records = [
+        {
+            'id': i,
+            'latitude': rng.uniform(US_BOUNDS['south'], US_BOUNDS['north']),
+            'longitude': rng.uniform(US_BOUNDS['west'], US_BOUNDS['east'])
+        }
+        for i in range(1, count + 1)
+    ]
+    started = time.perf_counter()
+    grid = LocationGrid(records, cell_degrees)
+    print(f"Grid over {count} synthetic locations: {len(grid.cells)} cells of {cell_degrees} deg, "
+          f"built in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def scan(box):
+        return len([
+            r for r in records
+            if box['south'] <= r['latitude'] <= box['north'] and box['west'] <= r['longitude'] <= box['east']
+        ])
+
+    centres = [(r['latitude'], r['longitude']) for r in records]
+    print(f"{'viewport':9} {'found':>7} {'grid us':>10} {'(max)':>9} {'scan us':>10} {'speed-up':>9}")
+    for label, size in VIEWPORTS:
+        boxes = viewports(centres, size, queries, rng)
+        grid_us, grid_max, found = timed_us(lambda box: len(grid.query(box)), boxes)
+        scan_us, _, _ = timed_us(scan, boxes)
+        print(f"{label:9} {found:>7.0f} {grid_us:>10.1f} {grid_max:>9.1f} {scan_us:>10.1f} {scan_us / grid_us:>8.0f}x")
+
+    def haversine_scan(point, k):
+        lat, lon = math.radians(point[0]), math.radians(point[1])
+        distances = []
+        for r in records:
+            phi, lam = math.radians(r['latitude']), math.radians(r['longitude'])
+            a = math.sin((phi - lat) / 2) ** 2 + math.cos(lat) * math.cos(phi) * math.sin((lam - lon) / 2) ** 2
+            distances.append((a, r['id']))
+        return len(sorted(distances)[:k])
+
+    points = rng.sample(centres, min(queries, len(centres)))
+    print(f"{'nearest':9} {'k':>7} {'tree us':>10} {'(max)':>9} {'scan us':>10} {'speed-up':>9}")
+    for k in (1, 10, 100):
+        tree_us, tree_max, _ = timed_us(lambda point: len(grid.nearest(point[0], point[1], k)), points)
+        scan_us, _, _ = timed_us(lambda point: haversine_scan(point, k), points)
+        print(f"{'':9} {k:>7} {tree_us:>10.1f} {tree_max:>9.1f} {scan_us:>10.1f} {scan_us / tree_us:>8.0f}x")
+
+def endpoint_benchmark(queries, limit):
+    from benchmarks.export_benchmark import bench_app
+    from app.models import db, Location
+    from app.api.locations import location_index
+
+    app = bench_app()
+    with app.app_context():
+        centres = [(float(lat), float(lon)) for lat, lon in db.session.query(Location.latitude, Location.longitude)
+                   .filter(Location.latitude.isnot(None), Location.longitude.isnot(None)).all()]
+        started = time.perf_counter()
+        grid = location_index.get(app.config)
+        if grid is None:
+            print("Location index could not be built - see the log")
+            return
+        print(f"Index over {len(grid)} locations built in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    client = app.test_client()
+    rng = random.Random(7)
+
+    def request(box):
+        query = '&'.join(f"{key}={value}" for key, value in box.items())
+        response = client.get(f"/api/locations?{query}&limit={limit}")
+        return len(response.get_json()['results'])
+
+    print(f"Endpoint, limit={limit} (median / max of {queries} requests)")
+    print(f"{'viewport':9} {'found':>7} {'SQL ms':>9} {'(max)':>9} {'memory ms':>10} {'(max)':>9}")
+    for label, size in VIEWPORTS:
+        boxes = viewports(centres, size, queries, rng)
+        app.config['SPATIAL_INDEX_ENABLED'] = False
+        sql_us, sql_max, found = timed_us(request, boxes)
+        app.config['SPATIAL_INDEX_ENABLED'] = True
+        mem_us, mem_max, _ = timed_us(request, boxes)
+        print(f"{label:9} {found:>7.0f} {sql_us / 1000:>9.2f} {sql_max / 1000:>9.2f} "
+              f"{mem_us / 1000:>10.2f} {mem_max / 1000:>9.2f}")
+
+    def nearest(point):
+        response = client.get(f"/api/locations/nearest?lat={point[0]}&lon={point[1]}&k=10&max_age_hours=24")
+        return len(response.get_json()['results'])
+
+    points = rng.sample(centres, min(queries, len(centres)))
+    for label, enabled in (('SQL', False), ('memory', True)):
+        app.config['SPATIAL_INDEX_ENABLED'] = enabled
+        median_us, max_us, found = timed_us(nearest, points)
+        print(f"nearest k=10 fresh<24h {label:7} {median_us / 1000:7.2f} ms (max {max_us / 1000:.2f})  found {found:.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark bbox and nearest-station queries')
+    parser.add_argument('--locations', type=int, default=5000, help='Synthetic locations in the grid part')
+    parser.add_argument('--cell-degrees', type=float, default=0.5, help='Grid cell size')
+    parser.add_argument('--queries', type=int, default=200, help='Viewports per size / nearest-station queries')
+    parser.add_argument('--db', action='store_true', help='Also benchmark /api/locations against DATABASE_URL')
+    parser.add_argument('--limit', type=int, default=1000, help='limit= of the endpoint requests')
+    args = parser.parse_args()
+
+    grid_benchmark(args.locations, args.cell_degrees, args.queries)
+    if args.db:
+        endpoint_benchmark(args.queries, args.limit)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
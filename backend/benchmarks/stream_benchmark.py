@@ -0,0 +1,99 @@
+"""Direct writes vs the Redis Stream write-behind buffer
+
+Generates synthetic readings for existing sensors and measures:
+
+    direct    MeasurementBatch.flush() per fetch-sized batch (what fetch tasks do inline)
+    publish   StreamBatch.flush() per fetch-sized batch (what fetch tasks pay in stream mode)
+    drain     ReadingStream.drain_once() until the stream is empty (the batch writer)
+
+    cd backend
+    python -m benchmarks.stream_benchmark --readings 100000 --fetch-batch 300 --writer-batch 5000
+
+Needs REDIS_URL and a scratch DATABASE_URL with sensors (e.g. after seed-from-file).
+A private stream key is used, so a running writer is not disturbed.
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark direct vs stream-buffered measurement writes')
+    parser.add_argument('--readings', type=int, default=100000, help='Readings per mode')
+    parser.add_argument('--fetch-batch', type=int, default=300, help='Readings per fetch task flush')
+    parser.add_argument('--writer-batch', type=int, default=5000, help='Readings per writer transaction')
+    parser.add_argument('--writer-seconds', type=float, default=2.0, help='Max time a writer collects a batch')
+    args = parser.parse_args()
+
+    from app.tasks import app
+    from app.models import db, Sensor
+    from app.ingest import MeasurementBatch
+    from app.stream_buffer import ReadingStream, StreamBatch
+
+    with app.app_context():
+        sensor_ids = [sensor_id for (sensor_id,) in db.session.query(Sensor.id).all()]
+        if not sensor_ids:
+            print("No sensors - run 'python manage.py seed-from-file' first")
+            return 1
+
+        # Distinct timestamps per mode so neither run only hits duplicates
+        rng = random.Random(7)
+        base = datetime.utcnow().replace(microsecond=0) - timedelta(days=365)
+
+        def readings(offset):
+            for i in range(args.readings):
+                yield rng.choice(sensor_ids), base + timedelta(seconds=offset + i), round(rng.uniform(0, 80), 3)
+
+        def flush_in_batches(make_batch, offset):
+            batch = make_batch()
+            flush_seconds = []
+            for sensor_id, timestamp, value in readings(offset):
+                batch.add_reading(sensor_id, value, timestamp)
+                if len(batch) >= args.fetch_batch:
+                    started = time.perf_counter()
+                    batch.flush()
+                    flush_seconds.append(time.perf_counter() - started)
+            if len(batch):
+                started = time.perf_counter()
+                batch.flush()
+                flush_seconds.append(time.perf_counter() - started)
+            return flush_seconds
+
+        def report(name, seconds, flushes=None):
+            line = f"  {name:8} {args.readings / seconds:10.0f} rows/s ({seconds:.2f}s)"
+            if flushes:
+                flushes = sorted(flushes)
+                line += f", per fetch flush p50 {flushes[len(flushes) // 2] * 1000:.1f} ms, p95 {flushes[int(len(flushes) * 0.95)] * 1000:.1f} ms"
+            print(line)
+
+        print(f"{args.readings} readings over {len(sensor_ids)} sensors, fetch batches of {args.fetch_batch}:")
+
+        direct = flush_in_batches(MeasurementBatch, 0)
+        report('direct', sum(direct), direct)
+
+        stream = ReadingStream(app.config['REDIS_URL'], key='bench:ingest:readings', group='bench-writers')
+        stream.redis.delete(stream.key)
+        try:
+            published = flush_in_batches(lambda: StreamBatch(stream), args.readings)
+            report('publish', sum(published), published)
+
+            started = time.perf_counter()
+            written = 0
+            transactions = 0
+            while True:
+                stats = stream.drain_once('bench-writer', max_rows=args.writer_batch, max_seconds=args.writer_seconds)
+                if not stats['entries']:
+                    break
+                written += stats['readings']
+                transactions += 1
+            drained = time.perf_counter() - started - args.writer_seconds  # Last empty read waits out the deadline
+            report('drain', max(drained, 1e-6))
+            print(f"  writer transactions: {transactions} for {written} readings")
+        finally:
+            stream.redis.delete(stream.key)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,7 +10,7 @@ def make_celery():
         app.import_name,
         broker=os.getenv('REDIS_URL', 'redis://localhost:6379/0'),
         backend=os.getenv('REDIS_URL', 'redis://localhost:6379/0'),
-        include=['app.tasks']
+        include=['app.tasks', 'app.backfill']
     )
     
     # Update configuration
@@ -25,6 +25,8 @@ def make_celery():
         task_soft_time_limit=25 * 60,
         worker_prefetch_multiplier=1,
         worker_max_tasks_per_child=1000,
+        # The batch writer gets its own worker(s) so DB writes scale apart from API fetching
+        task_routes={'app.tasks.drain_reading_stream': {'queue': 'writer'}},
     )
     
     # CRITICAL: Make celery work with Flask app context
@@ -10,7 +10,37 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     #Openaq
     OPENAQ_API_KEY = os.getenv('OPENAQ_API_KEY')
-    OPENAQ_BASE_URL = os.getenv('OPENAQ_API_URL')
+    OPENAQ_BASE_URL = os.getenv('OPENAQ_API_URL', 'https://api.openaq.org/v3')
+    OPENAQ_INGEST_MODE = os.getenv('OPENAQ_INGEST_MODE', 'bulk')  # 'bulk' (latest by parameter), 'per_location' or 'adaptive'
+    # Weekly location sync writes only new/changed metadata and skips /latest (the 2-hourly job covers it)
+    LOCATION_SYNC_METADATA_ONLY = os.getenv('LOCATION_SYNC_METADATA_ONLY', 'true').lower() == 'true'
+    OPENAQ_FETCH_CONCURRENCY = int(os.getenv('OPENAQ_FETCH_CONCURRENCY', 8))  # /latest requests in flight per task
+    # Adaptive polling: per-location intervals learned from reporting cadence, due locations dispatched every few minutes
+    POLL_MIN_INTERVAL_SECONDS = int(os.getenv('POLL_MIN_INTERVAL_SECONDS', 900))
+    POLL_MAX_INTERVAL_SECONDS = int(os.getenv('POLL_MAX_INTERVAL_SECONDS', 7 * 86400))
+    POLL_DEFAULT_INTERVAL_SECONDS = int(os.getenv('POLL_DEFAULT_INTERVAL_SECONDS', 3600))
+    POLL_DISPATCH_MINUTES = int(os.getenv('POLL_DISPATCH_MINUTES', 5))
+    POLL_BUDGET_SHARE = float(os.getenv('POLL_BUDGET_SHARE', 0.8))  # of the API budget, the rest is left for syncs/backfills
+    # Shared (Redis) rate limit for the API key across all workers
+    OPENAQ_RATE_LIMIT_PER_MINUTE = int(os.getenv('OPENAQ_RATE_LIMIT_PER_MINUTE', 60))
+    OPENAQ_RATE_LIMIT_BURST = int(os.getenv('OPENAQ_RATE_LIMIT_BURST', 10))
+    OPENAQ_RATE_LIMIT_MAX_WAIT = float(os.getenv('OPENAQ_RATE_LIMIT_MAX_WAIT', 5))  # seconds a task may sleep before retrying later
+    # 'direct' = fetch tasks write to PostgreSQL, 'stream' = they queue readings on a Redis Stream for drain_reading_stream
+    INGEST_WRITE_MODE = os.getenv('INGEST_WRITE_MODE', 'direct')
+    INGEST_STREAM_BATCH_ROWS = int(os.getenv('INGEST_STREAM_BATCH_ROWS', 5000))  # readings per writer transaction
+    INGEST_STREAM_BATCH_SECONDS = float(os.getenv('INGEST_STREAM_BATCH_SECONDS', 2))  # or whatever arrived in this time
+    INGEST_STREAM_MAX_DELIVERIES = int(os.getenv('INGEST_STREAM_MAX_DELIVERIES', 5))  # then an entry is dead-lettered
+    PARTITION_MONTHS_AHEAD = int(os.getenv('PARTITION_MONTHS_AHEAD', 3))  # monthly measurement partitions created in advance
+    # Tiered retention: raw readings older than this many days are compacted into the hourly/daily rollups (0 = keep forever)
+    RAW_RETENTION_DAYS = int(os.getenv('RAW_RETENTION_DAYS', 0))
+    RETENTION_MONTHS_PER_RUN = int(os.getenv('RETENTION_MONTHS_PER_RUN', 1))  # months compacted per nightly run
+    RETENTION_PAUSE_SECONDS = float(os.getenv('RETENTION_PAUSE_SECONDS', 0.5))  # between DELETE batches (unpartitioned table)
+    # In-memory grid index answering /locations bbox queries in the web workers (SQL is the fallback)
+    SPATIAL_INDEX_ENABLED = os.getenv('SPATIAL_INDEX_ENABLED', 'true').lower() == 'true'
+    SPATIAL_INDEX_CHECK_SECONDS = float(os.getenv('SPATIAL_INDEX_CHECK_SECONDS', 10))  # how often workers look for a newer version
+    SPATIAL_GRID_CELL_DEGREES = float(os.getenv('SPATIAL_GRID_CELL_DEGREES', 0.5))
+    # Redis
+    REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
     # Celery
     CELERY_BROKER_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
     CELERY_RESULT_BACKEND = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
@@ -1,5 +1,8 @@
 #!/usr/bin/env python
+import os
+import time
 import click
+from datetime import datetime
 from app import create_app
 from app.models import db
 from app.tasks import (
@@ -17,22 +20,33 @@ def cli():
     pass
 
 @cli.command()
-def fetch_data():
+@click.option('--mode', type=click.Choice(['bulk', 'per_location', 'adaptive']), default=None,
+              help='bulk = latest by parameter (few API calls), per_location = one call per location, '
+                   'adaptive = only locations that are due')
+def fetch_data(mode):
     """Manually trigger latest measurements fetch for ALL 4,877 locations"""
     with app.app_context():
-        result = fetch_all_measurements_orchestrator.delay()
-        click.echo(f"Started ALL 4,877 locations measurements task: {result.id}")
-        click.echo("This will process all locations in batches of 100. Monitor in Flower at http://localhost:5555")
+        mode = mode or app.config['OPENAQ_INGEST_MODE']
+        result = fetch_all_measurements_orchestrator.delay(mode=mode)
+        click.echo(f"Started ALL 4,877 locations measurements task ({mode}): {result.id}")
+        if mode == 'bulk':
+            click.echo("This will refresh all sensors from the parameter-level endpoints. Monitor in Flower at http://localhost:5555")
+        elif mode == 'adaptive':
+            click.echo("This will poll only the locations that are due (see poll-status). Monitor in Flower at http://localhost:5555")
+        else:
+            click.echo("This will process all locations in batches of 100. Monitor in Flower at http://localhost:5555")
         click.echo("⚠️  NOTE: This fetches LATEST data only, not historical data")
 
 @cli.command()
-def update_locs():
+@click.option('--with-latest', is_flag=True, help='Also fetch /latest for every location (full rewrite)')
+def update_locs(with_latest):
     """Manually trigger location update for ALL 4,877 locations"""
     with app.app_context():
-        result = fetch_all_locations.delay()
+        result = fetch_all_locations.delay(metadata_only=not with_latest)
         click.echo(f"Started ALL 4,877 locations update task: {result.id}")
-        click.echo("This will fetch/update all US locations from OpenAQ API")
-        click.echo("⚠️  NOTE: This fetches LATEST data only, not historical data")
+        click.echo("This will fetch all US locations from OpenAQ API and write only new/changed ones")
+        if with_latest:
+            click.echo("⚠️  NOTE: This fetches LATEST data only, not historical data")
 
 @cli.command()
 @click.option('--offset', default=0, help='Starting offset for batch processing')
@@ -46,34 +60,59 @@ def fetch_batch(offset, batch_size):
 
 @cli.command()
 @click.option('--page', default=1, help='Page number to fetch (1-5)')
-def fetch_page(page):
+@click.option('--with-latest', is_flag=True, help='Also fetch /latest for every location on the page')
+def fetch_page(page, with_latest):
     """Manually trigger a single page of locations fetch"""
     with app.app_context():
-        result = fetch_locations_page.delay(page, fetch_history=False)
+        result = fetch_locations_page.delay(page, fetch_history=False, metadata_only=not with_latest)
         click.echo(f"Started locations page {page} task: {result.id}")
-        click.echo(f"Fetching page {page} (latest data only)")
+        click.echo(f"Fetching page {page} ({'with latest data' if with_latest else 'metadata only'})")
+
+@cli.command()
+@click.option('--path', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'usa_locations.json'),
+              help='OpenAQ /locations snapshot (JSON array), e.g. produced by run1.py')
+def seed_from_file(path):
+    """Seed locations, parameters and sensors from a local snapshot - NO API CALLS"""
+    with app.app_context():
+        from app.seed_file import seed_from_file as seed
+        from app.partitions import ensure_partitions
+
+        db.create_all()
+        ensure_partitions()
+        started = time.time()
+        result = seed(path)
+
+        click.echo(f"Seeded from {path} in {time.time() - started:.1f}s:")
+        click.echo(f"  Locations in File: {result['locations_in_file']} ({result['locations_written']} new or changed)")
+        click.echo(f"  Sensors in File: {result['sensors_in_file']} ({result['sensors_created']} new)")
+        click.echo(f"  Parameters Created: {result['parameters_created']}")
+
+        if result['locations_written'] or result['sensors_created']:
+            from app.spatial import IndexVersion
+            IndexVersion.from_config(app.config).bump()  # Running web workers pick up the new locations
 
 @cli.command()
 def status():
     """Show current data status - NO DATA MODIFICATION"""
     with app.app_context():
-        from app.models import Location, Sensor, Measurement
-        from datetime import datetime, timezone
+        from app.models import Location, Sensor, LocationDataSummary
+        from app.counters import read_counters
         
-        # Basic counts
+        # Basic counts (measurements from the writer's counters, no full scan)
         total_locations = Location.query.count()
         total_sensors = Sensor.query.count()
-        total_measurements = Measurement.query.count()
+        counters = read_counters()
+        total_measurements = counters['total']
         
         # Count sensors with any data
         sensors_with_data = Sensor.query.filter(
             Sensor.last_value.is_not(None)
         ).count()
         
-        # Get date range of all data
+        # Date range of all data from the per-location summaries (like /measurements/data-range)
         date_range = db.session.query(
-            db.func.min(Measurement.timestamp).label('oldest'),
-            db.func.max(Measurement.timestamp).label('newest')
+            db.func.min(LocationDataSummary.oldest).label('oldest'),
+            db.func.max(LocationDataSummary.newest).label('newest')
         ).first()
         
         click.echo("Current Data Status:")
@@ -81,6 +120,8 @@ def status():
         click.echo(f"  Total Sensors: {total_sensors}")
         click.echo(f"  Sensors with Data: {sensors_with_data}")
         click.echo(f"  Total Measurements: {total_measurements}")
+        if counters['reconciled_at'] is None:
+            click.echo("  (counters never reconciled - run: python manage.py reconcile-counters)")
         
         if date_range.oldest and date_range.newest:
             click.echo(f"  Oldest Data: {date_range.oldest.strftime('%Y-%m-%d')}")
@@ -96,24 +137,277 @@ def status():
 def data_range():
     """Show data range for all locations"""
     with app.app_context():
-        from app.models import Location, Sensor, Measurement
+        from app.models import Location, LocationDataSummary
         
-        # Get locations with data range
+        # Get locations with data range (per-location summary, ranked via its oldest index)
         locations_with_data = db.session.query(
             Location.id,
             Location.name,
-            db.func.min(Measurement.timestamp).label('oldest'),
-            db.func.max(Measurement.timestamp).label('newest'),
-            db.func.count(Measurement.id).label('measurement_count')
-        ).join(Sensor).join(Measurement).group_by(
-            Location.id, Location.name
-        ).order_by(db.func.min(Measurement.timestamp)).limit(20).all()
+            LocationDataSummary.oldest,
+            LocationDataSummary.newest,
+            LocationDataSummary.count.label('measurement_count')
+        ).join(LocationDataSummary, LocationDataSummary.location_id == Location.id).order_by(
+            LocationDataSummary.oldest
+        ).limit(20).all()
         
         click.echo("📊 Data Range for Top 20 Locations (by oldest data):")
         for loc in locations_with_data:
             span_years = (loc.newest - loc.oldest).days / 365.25
             click.echo(f"  {loc.name[:30]:30} | {loc.oldest.strftime('%Y-%m-%d')} to {loc.newest.strftime('%Y-%m-%d')} | {span_years:.1f} years | {loc.measurement_count} measurements")
 
+@cli.command()
+@click.option('--since', required=True, type=click.DateTime(), help='Start of the history to load (UTC)')
+@click.option('--until', type=click.DateTime(), default=None, help='End of the history to load (UTC, default now)')
+@click.option('--parameter', default=None, help='Only sensors of this parameter, e.g. pm25')
+@click.option('--location-id', type=int, default=None, help='Only sensors of this location (our id)')
+@click.option('--window-days', default=30, help='Days of history per task')
+def backfill(since, until, parameter, location_id, window_days):
+    """Load historical measurements in parallel, resuming from checkpoints"""
+    with app.app_context():
+        from app.backfill import plan_backfill
+        
+        until = until or datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        if since >= until:
+            raise click.BadParameter('--since must be before --until')
+        
+        try:
+            plan = plan_backfill(since, until, parameter=parameter, location_id=location_id, window_days=window_days)
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+        click.echo(f"Backfill run {plan['run_id']}: {since:%Y-%m-%d} to {until:%Y-%m-%d}")
+        click.echo(f"  Sensors scheduled: {plan['sensors']} ({plan.get('resumed', 0)} resumed from checkpoints)")
+        click.echo(f"  Already complete: {plan.get('already_complete', 0)}")
+        click.echo(f"  Window tasks: {plan['windows']}")
+        click.echo(f"Track progress with: python manage.py backfill-status {plan['run_id']}")
+
+@cli.command()
+@click.argument('run_id')
+def backfill_status(run_id):
+    """Show progress and throughput of a backfill run"""
+    with app.app_context():
+        from app.backfill import backfill_progress
+        
+        progress = backfill_progress(run_id)
+        if progress is None:
+            click.echo(f"Unknown backfill run {run_id}")
+            return
+        
+        click.echo(f"Backfill {run_id} ({progress['since'][:10]} to {progress['until'][:10]} {progress['parameter']}):")
+        click.echo(f"  Windows: {progress['windows_done']}/{progress['windows_total']} ({progress['percent_done']}%)")
+        click.echo(f"  Rows Inserted: {progress['rows_inserted']} (skipped {progress['rows_skipped']} duplicates)")
+        click.echo(f"  API Calls: {progress['api_calls']}")
+        click.echo(f"  Throughput: {progress['rows_per_second']} rows/s over {progress['elapsed_seconds']}s")
+
+@cli.command()
+@click.option('--since', type=click.DateTime(), default=None, help='Start of the range to rebuild (default oldest measurement)')
+@click.option('--until', type=click.DateTime(), default=None, help='End of the range to rebuild (default newest measurement)')
+def rebuild_rollups(since, until):
+    """Recompute hourly/daily rollups from raw measurements (after migrations or manual fixes)"""
+    with app.app_context():
+        from app.models import Measurement, LocationDataSummary
+        from app.rollups import rebuild_rollups as rebuild
+        from app.retention import retention_cutoff
+        from datetime import timedelta
+        
+        # Default range from the data-range summaries - no scan of the measurements table.
+        # Right after upgrade_schema.py they are still empty (rebuild-summaries reads the
+        # rollups this command fills), so fall back to the raw readings then.
+        oldest, newest = db.session.query(
+            db.func.min(LocationDataSummary.oldest), db.func.max(LocationDataSummary.newest)
+        ).one()
+        if oldest is None:
+            oldest, newest = db.session.query(
+                db.func.min(Measurement.timestamp), db.func.max(Measurement.timestamp)
+            ).one()
+        since = since or oldest
+        until = until or (newest + timedelta(seconds=1) if newest else None)
+        if since is None or until is None:
+            click.echo("No measurements to roll up")
+            return
+        
+        started = time.time()
+        written = rebuild(since, until, cutoff=retention_cutoff(app.config))
+        click.echo(f"Rebuilt rollups {since:%Y-%m-%d} to {until:%Y-%m-%d} in {time.time() - started:.1f}s:")
+        click.echo(f"  Hourly Buckets: {written['hour']}")
+        click.echo(f"  Daily Buckets: {written['day']}")
+
+@cli.command()
+@click.option('--months-ahead', type=int, default=None, help='Create partitions this many months ahead (default PARTITION_MONTHS_AHEAD)')
+def partitions(months_ahead):
+    """List measurement partitions, creating missing future months"""
+    with app.app_context():
+        from app.partitions import is_partitioned, ensure_partitions, list_partitions
+        
+        if not is_partitioned():
+            click.echo("measurements is not partitioned yet - run partition_measurements.py")
+            return
+        
+        months_ahead = app.config['PARTITION_MONTHS_AHEAD'] if months_ahead is None else months_ahead
+        created = ensure_partitions(months_ahead=months_ahead)
+        if created:
+            click.echo(f"Created: {', '.join(created)}")
+        
+        click.echo("Measurement Partitions:")
+        for partition in list_partitions():
+            label = partition['month'].strftime('%Y-%m') if partition['month'] else 'default'
+            click.echo(f"  {partition['name']:28} | {label:7} | ~{partition['rows_estimate']} rows | "
+                       f"{partition['bytes'] / 1024 / 1024:.1f} MB | {partition['tablespace']}")
+
+@cli.command()
+@click.option('--before', required=True, type=click.DateTime(formats=['%Y-%m', '%Y-%m-%d']),
+              help='Archive months that end on or before this date')
+@click.option('--tablespace', default=None, help='Move the months to this (cheaper) tablespace')
+@click.option('--keep-attached', is_flag=True, help='With --tablespace: move but keep the months queryable')
+@click.option('--drop', is_flag=True, help='Drop the months instead of keeping detached tables')
+@click.option('--yes', is_flag=True, help='Do not ask for confirmation')
+def archive_partitions(before, tablespace, keep_attached, drop, yes):
+    """Detach, move or drop whole months of measurements - no long DELETE"""
+    with app.app_context():
+        from app.partitions import archive_partitions as archive, list_partitions, month_start
+        
+        if keep_attached and (drop or not tablespace):
+            raise click.BadParameter('--keep-attached needs --tablespace and cannot be combined with --drop')
+        
+        months = [p for p in list_partitions() if p['month'] and p['month'] < month_start(before)]
+        if not months:
+            click.echo(f"No monthly partitions before {before:%Y-%m}")
+            return
+        
+        action = 'DROP' if drop else ('move' if keep_attached else 'detach')
+        click.echo(f"Will {action} {len(months)} months: {months[0]['month']:%Y-%m} to {months[-1]['month']:%Y-%m} "
+                   f"(~{sum(p['rows_estimate'] for p in months)} rows)")
+        if not yes:
+            click.confirm('Continue?', abort=True)
+        
+        for name, result in archive(before, tablespace=tablespace, detach=not keep_attached, drop=drop):
+            click.echo(f"  {name}: {result}")
+
+@cli.command()
+@click.option('--dry-run', is_flag=True, help='Only report what would be compacted and reclaimed')
+@click.option('--days', type=int, default=None, help='Keep raw readings for this many days (default RAW_RETENTION_DAYS)')
+@click.option('--yes', is_flag=True, help='Do not ask for confirmation')
+def retention(dry_run, days, yes):
+    """Compact raw measurements older than the retention window into hourly/daily rollups"""
+    with app.app_context():
+        from app.retention import retention_cutoff, expired_months, apply_retention
+        
+        config = dict(app.config, RAW_RETENTION_DAYS=days if days is not None else app.config['RAW_RETENTION_DAYS'])
+        cutoff = retention_cutoff(config)
+        if cutoff is None:
+            click.echo("Retention is disabled (RAW_RETENTION_DAYS=0) - raw data is kept forever")
+            return
+        
+        months = expired_months(cutoff)
+        click.echo(f"Raw retention: {config['RAW_RETENTION_DAYS']} days - raw readings kept from {cutoff:%Y-%m-%d}")
+        if not months:
+            click.echo("Nothing to compact")
+            return
+        
+        for month in months:
+            source = month['partition'] or 'DELETE in batches'
+            click.echo(f"  {month['month']:%Y-%m} | ~{month['rows']} rows | {month['bytes'] / 1024 / 1024:.1f} MB | {source}")
+        click.echo(f"Total: ~{sum(m['rows'] for m in months)} rows, "
+                   f"{sum(m['bytes'] for m in months) / 1024 / 1024:.1f} MB reclaimable")
+        
+        if dry_run:
+            click.echo("Dry run - nothing changed")
+            return
+        if not yes:
+            click.confirm('Roll these months up and delete their raw rows?', abort=True)
+        
+        started = time.time()
+        result = apply_retention(config, pause_seconds=app.config['RETENTION_PAUSE_SECONDS'])
+        click.echo(f"Compacted {len(result['months'])} months in {time.time() - started:.1f}s:")
+        click.echo(f"  Raw Rows Removed: {result['rows_removed']}")
+        click.echo(f"  Space Reclaimed: {result['bytes_reclaimed'] / 1024 / 1024:.1f} MB")
+
+@cli.command()
+def rebuild_summaries():
+    """Recompute the per-sensor/per-location data-range summaries"""
+    with app.app_context():
+        from app.summaries import rebuild_summaries as rebuild
+        
+        started = time.time()
+        sensor_rows, location_rows = rebuild()
+        click.echo(f"Rebuilt data-range summaries in {time.time() - started:.1f}s:")
+        click.echo(f"  Sensors: {sensor_rows}")
+        click.echo(f"  Locations: {location_rows}")
+
+@cli.command()
+def reconcile_counters():
+    """Recompute the dashboard measurement counters from the daily rollups"""
+    with app.app_context():
+        from app.counters import reconcile_counters as reconcile, read_counters, recent_count
+        
+        before = read_counters()['total']
+        started = time.time()
+        counters = reconcile()
+        click.echo(f"Reconciled measurement counters in {time.time() - started:.1f}s:")
+        click.echo(f"  Total Measurements: {counters['total']} (drift {counters['total'] - before:+d})")
+        click.echo(f"  Parameters: {len(counters['parameters'])}")
+        click.echo(f"  Last 7 Days: {recent_count(counters)}")
+
+@cli.command()
+@click.option('--reset', is_flag=True, help='Clear the counters after printing them')
+def rate_limit_stats(reset):
+    """Show shared OpenAQ rate limiter metrics (all workers)"""
+    with app.app_context():
+        from app.rate_limit import RedisTokenBucket
+        
+        limiter = RedisTokenBucket.from_config(app.config)
+        metrics = limiter.metrics()
+        
+        click.echo("OpenAQ Rate Limiter:")
+        click.echo(f"  Budget: {app.config['OPENAQ_RATE_LIMIT_PER_MINUTE']}/min (burst {app.config['OPENAQ_RATE_LIMIT_BURST']})")
+        click.echo(f"  Tokens Consumed: {int(metrics['tokens_consumed'])}")
+        click.echo(f"  Time Spent Waiting: {metrics['wait_seconds']:.1f}s")
+        click.echo(f"  Deferred (retry later): {int(metrics['deferred'])} ({metrics['deferred_seconds']:.0f}s of countdowns)")
+        click.echo(f"  429 Responses: {int(metrics['rate_limited'])}")
+        
+        if reset:
+            limiter.reset_metrics()
+            click.echo("Counters reset")
+
+@cli.command()
+def poll_status():
+    """Show the adaptive polling schedule - NO DATA MODIFICATION"""
+    with app.app_context():
+        from app.poll_scheduler import PollPolicy, poll_summary
+        
+        summary = poll_summary(PollPolicy.from_config(app.config))
+        click.echo(f"Adaptive Polling ({app.config['OPENAQ_INGEST_MODE']} mode):")
+        click.echo(f"  Locations Scheduled: {summary['locations']}")
+        click.echo(f"  Due Now: {summary['due_now']}")
+        click.echo(f"  Backed Off (no new data last poll): {summary['backed_off']}")
+        for bucket, count in summary['intervals'].items():
+            click.echo(f"  Polled every {bucket}: {count}")
+        click.echo(f"  Expected API Calls/Day: {summary['expected_calls_per_day']} "
+                   f"(vs {summary['locations'] * 12} polling everything every 2 hours)")
+
+@cli.command()
+def stream_status():
+    """Show the write-behind reading stream backlog (INGEST_WRITE_MODE=stream)"""
+    with app.app_context():
+        from app.tasks import reading_stream
+        
+        status = reading_stream.status()
+        click.echo(f"Reading Stream ({app.config['INGEST_WRITE_MODE']} mode):")
+        click.echo(f"  Entries Buffered: {status['entries']}")
+        click.echo(f"  Pending (read, not yet committed): {status['pending']}")
+        click.echo(f"  Unread: {status['lag'] if status['lag'] is not None else 'unknown'}")
+        click.echo(f"  Writers Seen: {status['consumers']}")
+        click.echo(f"  Dead Letters (failed {reading_stream.max_deliveries} deliveries): {status['dead_letters']}")
+
+@cli.command()
+@click.option('--count', default=1000, help='Dead-lettered entries to move back')
+def stream_requeue_dead(count):
+    """Put dead-lettered reading stream entries back on the stream once their cause is fixed"""
+    with app.app_context():
+        from app.tasks import reading_stream
+        
+        moved = reading_stream.requeue_dead_letters(count)
+        click.echo(f"Requeued {moved} dead-lettered entries")
+
 @cli.command()
 def test_location():
     """Test data fetching for a specific location - NO DATA MODIFICATION"""
@@ -0,0 +1,190 @@
+import sys
+import time
+from app import create_app
+from app.database import db
+from app.models import Measurement
+from app.partitions import PARENT_TABLE, is_partitioned, ensure_partitions, month_start, add_months
+
+NEW_TABLE = 'measurements_partitioned'  # Built and filled next to the live table, then renamed into place
+OLD_TABLE = 'measurements_unpartitioned'
+NEW_SUFFIX = '_p'  # Index and constraint names are schema wide - the new table's get their final names at the swap
+# Secondary indexes of measurements (add_indexes.py creates the same ones on a fresh database)
+INDEXES = {
+    'idx_measurements_sensor_id': '(sensor_id)',
+    'idx_measurements_timestamp': '(timestamp DESC)',
+    'idx_measurements_sensor_timestamp': '(sensor_id, timestamp DESC)',
+}
+
+def committed_id_bound(sequence):
+    """Highest measurement id allocated so far, once every transaction that could still commit one of them has ended
+
+    Rows with ids up to the bound are then all visible to the month copies;
+    everything above it is copied under the lock at the swap.
+    """
+    if sequence:
+        bound = db.session.execute(db.text(f"SELECT last_value FROM {sequence}")).scalar()
+    else:
+        bound = db.session.execute(db.text(f"SELECT COALESCE(max(id), 0) FROM {PARENT_TABLE}")).scalar()
+    xmax = db.session.execute(db.text("SELECT txid_snapshot_xmax(txid_current_snapshot())")).scalar()
+    db.session.commit()
+
+    waited = 0
+    while db.session.execute(db.text("SELECT txid_snapshot_xmin(txid_current_snapshot())")).scalar() < xmax:
+        db.session.commit()
+        if waited % 10 == 0:
+            print(f"Waiting for transactions older than the copy to finish ({waited}s)...")
+        time.sleep(1)
+        waited += 1
+    db.session.commit()
+    return bound
+
+def create_new_table(sequence):
+    """The partitioned measurements table under NEW_TABLE, sharing the live table's id sequence"""
+    default = f"DEFAULT nextval('{sequence}'::regclass)" if sequence else ''
+    db.session.execute(db.text(
+        f"CREATE TABLE IF NOT EXISTS {NEW_TABLE} ("
+        f"  id integer NOT NULL {default},"
+        f"  sensor_id integer NOT NULL,"
+        f"  value numeric(8, 3) NOT NULL,"
+        f"  timestamp timestamp without time zone NOT NULL,"
+        f"  CONSTRAINT measurements_pkey{NEW_SUFFIX} PRIMARY KEY (id, timestamp),"
+        f"  CONSTRAINT uq_measurements_sensor_timestamp{NEW_SUFFIX} UNIQUE (sensor_id, timestamp),"
+        f"  CONSTRAINT measurements_sensor_id_fkey{NEW_SUFFIX} FOREIGN KEY (sensor_id) REFERENCES sensors (id)"
+        f") PARTITION BY RANGE (timestamp)"
+    ))
+    db.session.commit()
+
+def swap_tables(bound, sequence):
+    """Copy what arrived since `bound` and rename the partitioned table into place, in one transaction
+
+    Writers wait on the EXCLUSIVE lock meanwhile (readers keep going until the
+    renames); lock_timeout makes a busy moment fail fast - just re-run.
+    """
+    db.session.execute(db.text("SET LOCAL lock_timeout = '10s'"))
+    db.session.execute(db.text(f"LOCK TABLE {PARENT_TABLE} IN EXCLUSIVE MODE"))
+    caught_up = db.session.execute(db.text(
+        f"INSERT INTO {NEW_TABLE} (id, sensor_id, value, timestamp) "
+        f"SELECT id, sensor_id, value, timestamp FROM {PARENT_TABLE} WHERE id > :bound "
+        f"ON CONFLICT DO NOTHING"
+    ), {'bound': bound}).rowcount
+
+    index_names = lambda table: [name for (name,) in db.session.execute(db.text(
+        "SELECT indexname FROM pg_indexes WHERE tablename = :table AND schemaname = current_schema()"
+    ), {'table': table}).all()]
+    old_indexes, new_indexes = index_names(PARENT_TABLE), index_names(NEW_TABLE)
+
+    db.session.execute(db.text(f"ALTER TABLE {PARENT_TABLE} RENAME TO {OLD_TABLE}"))
+    for name in old_indexes:
+        db.session.execute(db.text(f"ALTER INDEX {name} RENAME TO {name[:45]}_unpartitioned"))
+    db.session.execute(db.text(f"ALTER TABLE {NEW_TABLE} RENAME TO {PARENT_TABLE}"))
+    for name in new_indexes:
+        db.session.execute(db.text(f"ALTER INDEX {name} RENAME TO {name[:-len(NEW_SUFFIX)]}"))
+    db.session.execute(db.text(
+        f"ALTER TABLE {PARENT_TABLE} RENAME CONSTRAINT measurements_sensor_id_fkey{NEW_SUFFIX} TO measurements_sensor_id_fkey"
+    ))
+    if sequence:
+        # Otherwise dropping the old table would drop the sequence with it
+        db.session.execute(db.text(f"ALTER SEQUENCE {sequence} OWNED BY {PARENT_TABLE}.id"))
+    db.session.commit()
+    return caught_up
+
+def partition_measurements(drop_old=False):
+    """Convert measurements to a monthly range-partitioned table
+
+    The partitioned table is built next to the live one: monthly partitions,
+    rows copied month by month (each month its own transaction; re-running
+    resumes, copied rows are skipped), then its indexes. Only then is it swapped
+    in, in one short transaction that also copies the rows written meanwhile -
+    readers see the full history throughout and ingestion only pauses for the
+    swap. Pause enforce_raw_retention (and manual deletes) while this runs: rows
+    deleted from the live table after their month was copied come back. The old
+    table is kept unless --drop-old is given.
+    """
+    app = create_app()
+
+    with app.app_context():
+        if is_partitioned():
+            print("measurements is already partitioned")
+        elif not db.session.execute(db.text(f"SELECT to_regclass('{PARENT_TABLE}') IS NOT NULL")).scalar():
+            print("Creating partitioned measurements table...")
+            Measurement.__table__.create(bind=db.session.connection())
+            db.session.commit()
+            print(f"✅ Created with partitions {ensure_partitions()}. Run add_indexes.py next.")
+            return
+        else:
+            sequence = db.session.execute(db.text(f"SELECT pg_get_serial_sequence('{PARENT_TABLE}', 'id')")).scalar()
+
+            try:
+                print(f"Creating {NEW_TABLE} next to the live table...")
+                create_new_table(sequence)
+                bound = committed_id_bound(sequence)
+                oldest, newest = db.session.execute(db.text(
+                    f"SELECT min(timestamp), max(timestamp) FROM {PARENT_TABLE}"
+                )).one()
+                created = ensure_partitions(start=oldest, end=newest, parent=NEW_TABLE)
+                print(f"✅ Created {len(created)} partitions")
+            except Exception as e:
+                print(f"❌ Error: {e}")
+                db.session.rollback()
+                return
+
+            if oldest is not None:
+                print(f"Copying rows up to id {bound} month by month...")
+                copied = 0
+                month = month_start(oldest)
+                while month <= newest:
+                    next_month = add_months(month, 1)
+                    try:
+                        result = db.session.execute(db.text(
+                            f"INSERT INTO {NEW_TABLE} (id, sensor_id, value, timestamp) "
+                            f"SELECT id, sensor_id, value, timestamp FROM {PARENT_TABLE} "
+                            f"WHERE timestamp >= :lower AND timestamp < :upper AND id <= :bound "
+                            f"ON CONFLICT DO NOTHING"
+                        ), {'lower': month, 'upper': next_month, 'bound': bound})
+                        db.session.commit()
+                        copied += result.rowcount
+                        print(f"✅ {month:%Y-%m}: {result.rowcount} rows")
+                    except Exception as e:
+                        print(f"❌ Error copying {month:%Y-%m}: {e}")
+                        db.session.rollback()
+                        return
+                    month = next_month
+                print(f"Copied {copied} rows (rows copied by an earlier run are skipped)")
+
+            print("Creating indexes on the partitioned table...")
+            for name, columns in INDEXES.items():
+                try:
+                    db.session.execute(db.text(f"CREATE INDEX IF NOT EXISTS {name}{NEW_SUFFIX} ON {NEW_TABLE} {columns}"))
+                    db.session.commit()
+                    print(f"✅ {name}")
+                except Exception as e:
+                    print(f"❌ Error creating {name}: {e}")
+                    db.session.rollback()
+                    return
+
+            print("Swapping the partitioned table in...")
+            try:
+                caught_up = swap_tables(bound, sequence)
+                print(f"✅ Swapped - {caught_up} rows written during the copy carried over")
+            except Exception as e:
+                print(f"❌ Error: {e} (re-run to retry the swap)")
+                db.session.rollback()
+                return
+
+        if not db.session.execute(db.text(f"SELECT to_regclass('{OLD_TABLE}') IS NOT NULL")).scalar():
+            return
+        if drop_old:
+            db.session.execute(db.text(f"DROP TABLE {OLD_TABLE}"))
+            db.session.commit()
+            print(f"✅ Dropped {OLD_TABLE}")
+        else:
+            old_count, new_count = db.session.execute(db.text(
+                f"SELECT (SELECT count(*) FROM {OLD_TABLE}), (SELECT count(*) FROM {PARENT_TABLE})"
+            )).one()
+            print(f"{OLD_TABLE} kept ({old_count} rows, measurements has {new_count}) - "
+                  f"drop it once you have checked the copy (or re-run with --drop-old)")
+
+        print("Partitioning completed!")
+
+if __name__ == "__main__":
+    partition_measurements(drop_old='--drop-old' in sys.argv)
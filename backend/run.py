@@ -1,6 +1,11 @@
 from app import create_app
+from app.api.locations import location_index
 
 app = create_app()
 
+# Build the in-memory location index before the first map request (falls back to SQL on failure)
+with app.app_context():
+    location_index.get(app.config)
+
 if __name__ == "__main__":
     app.run(debug=True)
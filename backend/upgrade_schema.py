@@ -0,0 +1,38 @@
+from app import create_app
+from app.database import db
+from app.partitions import ensure_partitions
+
+# Columns added to existing tables after the initial schema.
+# New tables are created by db.create_all(); indexes live in add_indexes.py.
+COLUMN_UPGRADES = [
+    "ALTER TABLE locations ADD COLUMN IF NOT EXISTS fingerprint VARCHAR(40);",
+]
+
+def upgrade_schema():
+    app = create_app()
+    
+    with app.app_context():
+        print("Creating missing tables...")
+        db.create_all()
+        print("✅ Success")
+        
+        # A new measurements table is created partitioned and needs its monthly partitions
+        print(f"Creating measurement partitions: {ensure_partitions()}")
+        
+        print("Adding new columns...")
+        for upgrade_sql in COLUMN_UPGRADES:
+            try:
+                print(f"Running: {upgrade_sql}")
+                db.session.execute(db.text(upgrade_sql))
+                db.session.commit()
+                print("✅ Success")
+            except Exception as e:
+                print(f"❌ Error: {e}")
+                db.session.rollback()
+        
+        print("Schema upgrade completed! Run partition_measurements.py (existing databases) and add_indexes.py next,")
+        print("then 'python manage.py rebuild-rollups' once to fill the hourly/daily rollups from existing rows")
+        print("and 'python manage.py reconcile-counters' / 'rebuild-summaries' to seed the counters and data-range summaries.")
+
+if __name__ == "__main__":
+    upgrade_schema()
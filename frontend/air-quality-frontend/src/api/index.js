@@ -22,6 +22,16 @@ export const fetchLocations = async (bounds) => {
     return response.data;
 };
 
+// k closest stations by great-circle distance; options: { k, parameter, maxAgeHours }
+export const fetchNearestLocations = async (lat, lon, { k = 10, parameter, maxAgeHours } = {}) => {
+    const params = { lat, lon, k };
+    if (parameter) params.parameter = parameter;
+    if (maxAgeHours) params.max_age_hours = maxAgeHours;
+
+    const response = await api.get('/locations/nearest', { params });
+    return response.data;
+};
+
 export const fetchLocationDetail = async (id) => {
     const response = await api.get(`/locations/${id}`);
     return response.data;
@@ -50,18 +60,60 @@ export const fetchMeasurements = async (params) => {
 };
 
 // Get chart data for specific location and parameter - ALL HISTORICAL DATA
-export const fetchChartMeasurements = async (locationId, parameterId, limit = 200) => {
+// resolution 'hour' or 'day' returns one averaged point per bucket (long ranges), null = raw readings
+export const fetchChartMeasurements = async (locationId, parameterId, limit = 200, resolution = null) => {
     const response = await api.get('/measurements', {
         params: {
             location_id: locationId,
             parameter_id: parameterId,
-            limit: limit
+            limit: limit,
+            ...(resolution ? { resolution } : {})
             // NO DATE FILTERING - get all available historical data
         }
     });
     return response.data;
 };
 
+// Get a whole series downsampled on the server to at most `points` points (newest first)
+// options: { start, end, days, method: 'lttb' | 'minmax' }
+export const fetchDownsampledMeasurements = async (locationId, parameterId, points = 200, options = {}) => {
+    const response = await api.get('/measurements', {
+        params: {
+            location_id: locationId,
+            parameter_id: parameterId,
+            points: points,
+            ...options
+        }
+    });
+    return response.data;
+};
+
+// Get many (location, parameter) series in one request
+// pairs: [{ locationId, parameterId, limit? }], options: { limit, resolution, days }
+export const fetchSeries = async (pairs, options = {}) => {
+    const response = await api.get('/measurements/series', {
+        params: {
+            pairs: pairs
+                .map(p => [p.locationId, p.parameterId, ...(p.limit ? [p.limit] : [])].join(':'))
+                .join(','),
+            ...options
+        }
+    });
+    return response.data;
+};
+
+// Which locations have data for a parameter (or which of the given pairs) - answered without reading measurements
+export const fetchSeriesProbe = async ({ parameterId, pairs } = {}) => {
+    const response = await api.get('/measurements/series', {
+        params: {
+            probe: true,
+            ...(parameterId ? { parameter_id: parameterId } : {}),
+            ...(pairs ? { pairs: pairs.map(p => `${p.locationId}:${p.parameterId}`).join(',') } : {})
+        }
+    });
+    return response.data;
+};
+
 // Get measurements for a specific sensor - ALL HISTORICAL DATA
 export const fetchSensorMeasurements = async (sensorId, limit = 200) => {
     const response = await api.get('/measurements', {
@@ -99,8 +151,9 @@ export const fetchParameterMeasurements = async (parameterId, limit = 500) => {
 };
 
 // Get latest measurements for all sensors
-export const fetchLatestMeasurements = async () => {
-    const response = await api.get('/measurements/latest');
+// params: { parameter, parameter_id, max_age_hours, north, south, east, west } - all optional
+export const fetchLatestMeasurements = async (params = {}) => {
+    const response = await api.get('/measurements/latest', { params });
     return response.data;
 };
 
@@ -129,7 +182,7 @@ export const fetchDebugInfo = async () => {
 // Get chart data for dashboard - ALL HISTORICAL DATA
 export const getDashboardChartData = async (locationId, parameterId) => {
     try {
-        const data = await fetchChartMeasurements(locationId, parameterId, 200);
+        const data = await fetchDownsampledMeasurements(locationId, parameterId, 200);
         return data.results || [];
     } catch (error) {
         console.error(`Error fetching chart data for location ${locationId}, parameter ${parameterId}:`, error);
@@ -149,22 +202,26 @@ export const getLocationAllParameters = async (locationId, parameters) => {
         console.log(`Could not get data range for location ${locationId}`);
     }
 
-    for (const parameter of parameters) {
-        try {
-            const data = await fetchChartMeasurements(locationId, parameter.id, 200);
-            measurementsData[parameter.id] = data.results || [];
+    // One request for every parameter of the location
+    try {
+        const data = await fetchSeries(parameters.map(parameter => ({ locationId, parameterId: parameter.id })), { limit: 200 });
+        const byParameter = Object.fromEntries(data.series.map(series => [series.parameter_id, series.results]));
+
+        for (const parameter of parameters) {
+            const results = byParameter[parameter.id] || [];
+            measurementsData[parameter.id] = results;
 
-            if (data.results && data.results.length > 0) {
-                const oldest = data.results[data.results.length - 1]?.timestamp;
-                const newest = data.results[0]?.timestamp;
-                console.log(`Parameter ${parameter.name}: ${data.results.length} measurements (${oldest} to ${newest})`);
+            if (results.length > 0) {
+                const oldest = results[results.length - 1]?.timestamp;
+                const newest = results[0]?.timestamp;
+                console.log(`Parameter ${parameter.name}: ${results.length} measurements (${oldest} to ${newest})`);
             } else {
                 console.log(`Parameter ${parameter.name}: 0 measurements`);
             }
-        } catch (error) {
-            console.error(`Error fetching data for parameter ${parameter.id}:`, error);
-            measurementsData[parameter.id] = [];
         }
+    } catch (error) {
+        console.error(`Error fetching data for location ${locationId}:`, error);
+        parameters.forEach(parameter => { measurementsData[parameter.id] = []; });
     }
 
     return measurementsData;
@@ -174,22 +231,26 @@ export const getLocationAllParameters = async (locationId, parameters) => {
 export const getComparisonData = async (locations, parameterId) => {
     const comparisonData = {};
 
-    for (const location of locations) {
-        try {
-            const data = await fetchChartMeasurements(location.id, parameterId, 200);
-            comparisonData[location.id] = data.results || [];
+    // One request for all compared locations
+    try {
+        const data = await fetchSeries(locations.map(location => ({ locationId: location.id, parameterId })), { limit: 200 });
+        const byLocation = Object.fromEntries(data.series.map(series => [series.location_id, series.results]));
+
+        for (const location of locations) {
+            const results = byLocation[location.id] || [];
+            comparisonData[location.id] = results;
 
-            if (data.results && data.results.length > 0) {
-                const oldest = data.results[data.results.length - 1]?.timestamp;
-                const newest = data.results[0]?.timestamp;
-                console.log(`Location ${location.name}: ${data.results.length} measurements (${oldest} to ${newest})`);
+            if (results.length > 0) {
+                const oldest = results[results.length - 1]?.timestamp;
+                const newest = results[0]?.timestamp;
+                console.log(`Location ${location.name}: ${results.length} measurements (${oldest} to ${newest})`);
             } else {
                 console.log(`Location ${location.name}: 0 measurements`);
             }
-        } catch (error) {
-            console.error(`Error fetching data for location ${location.id}:`, error);
-            comparisonData[location.id] = [];
         }
+    } catch (error) {
+        console.error(`Error fetching comparison data for parameter ${parameterId}:`, error);
+        locations.forEach(location => { comparisonData[location.id] = []; });
     }
 
     return comparisonData;
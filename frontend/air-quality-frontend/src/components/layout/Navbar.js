@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useRef, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { searchLocations } from '../../api';
 
@@ -6,13 +6,17 @@ const Navbar = () => {
     const [searchQuery, setSearchQuery] = useState('');
     const [searchResults, setSearchResults] = useState([]);
     const [showResults, setShowResults] = useState(false);
+    const latestQuery = useRef('');
     const navigate = useNavigate();
 
     const handleSearch = async (query) => {
         setSearchQuery(query);
+        latestQuery.current = query;
         if (query.length > 2) {
             try {
                 const results = await searchLocations(query);
+                // A slower response for an earlier keystroke must not replace newer results
+                if (latestQuery.current !== query) return;
                 setSearchResults(results.results || []);
                 setShowResults(true);
             } catch (error) {
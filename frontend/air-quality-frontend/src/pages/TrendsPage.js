@@ -5,7 +5,7 @@ import {
     fetchParameters,
     getComparisonData,
     fetchLocations,
-    fetchChartMeasurements
+    fetchSeriesProbe
 } from '../api';
 
 const TrendsPage = () => {
@@ -77,17 +77,21 @@ const TrendsPage = () => {
         if (selectedParameter && locations.length > 0) {
             const checkDataAvailability = async () => {
                 const dataInfo = {};
+                locations.forEach(location => {
+                    dataInfo[location.id] = { hasData: false, count: 0 };
+                });
 
-                for (const location of locations) {
-                    try {
-                        const data = await fetchChartMeasurements(location.id, selectedParameter.id, 1);
-                        dataInfo[location.id] = {
-                            hasData: data.results?.length > 0,
-                            count: data.meta?.total || 0
+                // One probe for every location, answered from the per-sensor data summaries
+                try {
+                    const probe = await fetchSeriesProbe({ parameterId: selectedParameter.id });
+                    probe.series.forEach(series => {
+                        dataInfo[series.location_id] = {
+                            hasData: series.has_data,
+                            count: series.count
                         };
-                    } catch (error) {
-                        dataInfo[location.id] = { hasData: false, count: 0 };
-                    }
+                    });
+                } catch (error) {
+                    console.error('Error checking data availability:', error);
                 }
 
                 setLocationDataInfo(dataInfo);